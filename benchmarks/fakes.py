@@ -0,0 +1,567 @@
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from re import compile, fullmatch, sub
+from threading import Lock, Thread
+from time import sleep, time, time_ns
+from typing import Any, BinaryIO, Self, override
+from urllib.parse import parse_qs, urlparse
+
+SOURCE_LOGIN = "alice"
+TARGET_LOGIN = "bob"
+
+FORGEJO_PREFIX = "/api/v1"
+REPO_PATH = compile(r"/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)(?P<rest>/.*)?")
+UPDATED_BASE = datetime(2024, 1, 1, tzinfo=UTC)
+
+# Owner, repository and push mirror names are collapsed so calls can be
+# counted per endpoint rather than per URL.
+ENDPOINT_SUBSTITUTIONS = (
+    (r"^/repos/[^/]+/[^/]+", "/repos/{owner}/{repo}"),
+    (r"^/users/[^/]+", "/users/{login}"),
+    (r"/push_mirrors/[^/]+$", "/push_mirrors/{name}"),
+)
+
+
+def get_endpoint(method: str, path: str) -> str:
+    for pattern, replacement in ENDPOINT_SUBSTITUTIONS:
+        path = sub(pattern, replacement, path)
+
+    return f"{method} {path}"
+
+
+def get_repo_name(index: int) -> str:
+    return f"repo-{index:05d}"
+
+
+@dataclass
+class Response:
+    status: int
+    body: Any = None
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: dict[str, str]
+    body: Any
+    host: str
+
+    def get_page(self: Self, items: list[Any], page_size: int) -> list[Any]:
+        limit = min(int(self.query.get("limit", 30)), page_size)
+        page = int(self.query.get("page", 1))
+        return items[(page - 1) * limit : page * limit]
+
+
+class Traffic:
+    """
+    Calls per endpoint and bytes on the wire, counted from the servers'
+    side and shared by all of them.
+    """
+
+    calls: Counter[str]
+    received: int
+    sent: int
+    lock: Lock
+
+    def __init__(self: Self) -> None:
+        self.calls = Counter()
+        self.received = 0
+        self.sent = 0
+        self.lock = Lock()
+
+    def record_call(self: Self, endpoint: str) -> None:
+        with self.lock:
+            self.calls[endpoint] += 1
+
+    def record_bytes(self: Self, received: int = 0, sent: int = 0) -> None:
+        with self.lock:
+            self.received += received
+            self.sent += sent
+
+    def reset(self: Self) -> None:
+        with self.lock:
+            self.calls.clear()
+            self.received = 0
+            self.sent = 0
+
+
+class CountingReader:
+    file: BinaryIO
+    traffic: Traffic
+
+    def __init__(self: Self, file: BinaryIO, traffic: Traffic) -> None:
+        self.file = file
+        self.traffic = traffic
+
+    def read(self: Self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.traffic.record_bytes(received=len(data))
+        return data
+
+    def readline(self: Self, size: int = -1) -> bytes:
+        data = self.file.readline(size)
+        self.traffic.record_bytes(received=len(data))
+        return data
+
+    @property
+    def closed(self: Self) -> bool:
+        return self.file.closed
+
+    def close(self: Self) -> None:
+        self.file.close()
+
+
+class CountingWriter:
+    file: BinaryIO
+    traffic: Traffic
+
+    def __init__(self: Self, file: BinaryIO, traffic: Traffic) -> None:
+        self.file = file
+        self.traffic = traffic
+
+    def write(self: Self, data: bytes) -> int:
+        self.traffic.record_bytes(sent=len(data))
+        return self.file.write(data)
+
+    def flush(self: Self) -> None:
+        self.file.flush()
+
+    @property
+    def closed(self: Self) -> bool:
+        return self.file.closed
+
+    def close(self: Self) -> None:
+        self.file.close()
+
+
+def make_forgejo_repo(
+    owner: str, name: str, base_url: str, index: int
+) -> dict[str, Any]:
+    updated_at = UPDATED_BASE + timedelta(minutes=index)
+
+    return {
+        "id": index + 1,
+        "name": name,
+        "full_name": f"{owner}/{name}",
+        "owner": {"login": owner, "id": 1},
+        "description": f"Repository number {index}",
+        "html_url": f"{base_url}/{owner}/{name}",
+        "clone_url": f"{base_url}/{owner}/{name}.git",
+        "website": "",
+        "default_branch": "main",
+        "private": index % 7 == 6,
+        "fork": index % 10 == 9,
+        "mirror": index % 17 == 16,
+        "archived": index % 13 == 12,
+        "template": False,
+        "topics": ["benchmark", f"group-{index % 5}"],
+        "updated_at": updated_at.isoformat().replace("+00:00", "Z"),
+        "has_issues": True,
+        "has_wiki": True,
+        "has_pull_requests": True,
+        "has_projects": True,
+        "has_releases": True,
+        "has_packages": True,
+        "has_actions": True,
+        "wiki_branch": "main",
+    }
+
+
+class FakeForgejo:
+    """
+    The parts of the Forgejo API that forgesync uses, serving `repo_count`
+    repositories in pages of at most `page_size` items.
+    """
+
+    login: str
+    base_url: str
+    page_size: int
+    repos: dict[str, dict[str, Any]]
+    push_mirrors: dict[str, list[dict[str, Any]]]
+    lock: Lock
+
+    def __init__(
+        self: Self, login: str, base_url: str, repo_count: int, page_size: int
+    ) -> None:
+        self.login = login
+        self.base_url = base_url
+        self.page_size = page_size
+        self.repos = {}
+        self.push_mirrors = {}
+        self.lock = Lock()
+
+        for index in range(repo_count):
+            name = get_repo_name(index)
+            self.repos[name] = make_forgejo_repo(login, name, base_url, index)
+            self.push_mirrors[name] = []
+
+    def page(self: Self, request: Request, items: list[Any]) -> Response:
+        return Response(
+            status=200,
+            body=request.get_page(items, self.page_size),
+            headers={"X-Total-Count": str(len(items))},
+        )
+
+    def search(self: Self, request: Request) -> Response:
+        query = request.query
+        items = list(self.repos.values())
+
+        if query.get("mode") == "source":
+            items = [repo for repo in items if not repo["fork"] and not repo["mirror"]]
+        if query.get("archived") == "false":
+            items = [repo for repo in items if not repo["archived"]]
+        if query.get("is_private") == "false":
+            items = [repo for repo in items if not repo["private"]]
+        if query.get("q"):
+            keyword = query["q"].lower()
+            items = [repo for repo in items if keyword in repo["name"].lower()]
+        if query.get("sort") == "updated":
+            items.sort(
+                key=lambda repo: repo["updated_at"],
+                reverse=query.get("order") == "desc",
+            )
+
+        return Response(
+            status=200,
+            body={"ok": True, "data": request.get_page(items, self.page_size)},
+            headers={"X-Total-Count": str(len(items))},
+        )
+
+    def handle(self: Self, request: Request) -> Response:
+        method = request.method
+        path = request.path.removeprefix(FORGEJO_PREFIX)
+
+        if path == "/user":
+            return Response(status=200, body={"login": self.login, "id": 1})
+        if path == "/settings/api":
+            return Response(
+                status=200,
+                body={
+                    "max_response_items": self.page_size,
+                    "default_paging_num": min(30, self.page_size),
+                },
+            )
+        if path in ("/user/repos", f"/users/{self.login}/repos") and method == "GET":
+            return self.page(request, list(self.repos.values()))
+        if path == "/repos/search":
+            return self.search(request)
+        if path == "/user/repos" and method == "POST":
+            with self.lock:
+                repo = make_forgejo_repo(
+                    self.login, request.body["name"], self.base_url, len(self.repos)
+                )
+                repo.update(
+                    description=request.body.get("description", ""),
+                    private=request.body.get("private", False),
+                    fork=False,
+                    mirror=False,
+                    archived=False,
+                    topics=[],
+                )
+                self.repos[repo["name"]] = repo
+                self.push_mirrors[repo["name"]] = []
+            return Response(status=201, body=repo)
+
+        match = fullmatch(REPO_PATH, path)
+        if match is None:
+            return Response(status=404, body={"message": "Not found"})
+
+        name = match.group("name")
+        rest = match.group("rest") or ""
+        repo = self.repos.get(name)
+        if repo is None:
+            return Response(status=404, body={"message": "Not found"})
+
+        match method, rest:
+            case "GET", "":
+                return Response(status=200, body=repo)
+            case "PATCH", "":
+                repo.update(request.body)
+                return Response(status=200, body=repo)
+            case "GET", "/topics":
+                topics = request.get_page(repo["topics"], self.page_size)
+                return Response(
+                    status=200,
+                    body={"topics": topics},
+                    headers={"X-Total-Count": str(len(repo["topics"]))},
+                )
+            case "PUT", "/topics":
+                repo["topics"] = request.body["topics"]
+                return Response(status=204)
+            case "GET", "/push_mirrors":
+                return self.page(request, self.push_mirrors[name])
+            case "POST", "/push_mirrors":
+                push_mirror = {
+                    "remote_name": f"remote_mirror_{time_ns()}",
+                    "remote_address": request.body["remote_address"],
+                    "interval": request.body["interval"],
+                    "sync_on_commit": request.body.get("sync_on_commit", False),
+                    "repo_name": name,
+                }
+                with self.lock:
+                    self.push_mirrors[name].append(push_mirror)
+                return Response(status=200, body=push_mirror)
+            case "DELETE", _ if rest.startswith("/push_mirrors/"):
+                remote_name = rest.removeprefix("/push_mirrors/")
+                with self.lock:
+                    self.push_mirrors[name] = [
+                        push_mirror
+                        for push_mirror in self.push_mirrors[name]
+                        if push_mirror["remote_name"] != remote_name
+                    ]
+                return Response(status=204)
+            case "POST", "/push_mirrors-sync":
+                return Response(status=200)
+            case _:
+                return Response(status=404, body={"message": "Not found"})
+
+
+class FakeGithub:
+    """
+    The parts of the GitHub REST and GraphQL APIs that forgesync uses. The
+    repositories are listed through GraphQL and start out empty, so each one
+    is mirrored before its settings are edited.
+    """
+
+    login: str
+    repos: dict[str, dict[str, Any]]
+    lock: Lock
+
+    def __init__(self: Self, login: str, repo_count: int) -> None:
+        self.login = login
+        self.repos = {}
+        self.lock = Lock()
+
+        for index in range(repo_count):
+            name = get_repo_name(index)
+            self.repos[name] = self.make_repo(name)
+
+    def make_repo(self: Self, name: str) -> dict[str, Any]:
+        return {
+            "name": name,
+            "full_name": f"{self.login}/{name}",
+            "owner": {"login": self.login},
+            "clone_url": f"https://github.invalid/{self.login}/{name}.git",
+            "description": "",
+            "homepage": "",
+            "private": False,
+            "fork": False,
+            "archived": False,
+            "is_template": False,
+            "default_branch": "main",
+            "has_issues": True,
+            "has_projects": True,
+            "has_wiki": True,
+            "has_discussions": False,
+            "topics": [],
+        }
+
+    def render(self: Self, repo: dict[str, Any], host: str) -> dict[str, Any]:
+        # PyGithub follows the URLs in responses, so they have to point back
+        # at this server.
+        return {**repo, "url": f"http://{host}/repos/{self.login}/{repo['name']}"}
+
+    def make_node(self: Self, repo: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "name": repo["name"],
+            "owner": {"login": self.login},
+            "url": f"https://github.invalid/{self.login}/{repo['name']}",
+            "isEmpty": True,
+            "isArchived": repo["archived"],
+            "isFork": repo["fork"],
+            "isTemplate": repo["is_template"],
+            "description": repo["description"] or None,
+            "homepageUrl": repo["homepage"] or None,
+            "visibility": "PRIVATE" if repo["private"] else "PUBLIC",
+            "hasIssuesEnabled": repo["has_issues"],
+            "hasProjectsEnabled": repo["has_projects"],
+            "hasWikiEnabled": repo["has_wiki"],
+            "hasDiscussionsEnabled": repo["has_discussions"],
+            "defaultBranchRef": {"name": repo["default_branch"]},
+            "repositoryTopics": {
+                "nodes": [{"topic": {"name": topic}} for topic in repo["topics"]]
+            },
+        }
+
+    def graphql(self: Self, request: Request) -> Response:
+        variables = request.body.get("variables") or {}
+        repos = list(self.repos.values())
+        start = int(variables.get("after") or 0)
+        end = min(start + int(variables.get("first") or 100), len(repos))
+
+        return Response(
+            status=200,
+            body={
+                "data": {
+                    "viewer": {
+                        "login": self.login,
+                        "repositories": {
+                            "pageInfo": {
+                                "hasNextPage": end < len(repos),
+                                "endCursor": str(end),
+                            },
+                            "nodes": [
+                                self.make_node(repo) for repo in repos[start:end]
+                            ],
+                        },
+                    }
+                }
+            },
+        )
+
+    def handle(self: Self, request: Request) -> Response:
+        method = request.method
+        path = request.path
+
+        if path == "/user":
+            return Response(
+                status=200,
+                body={
+                    "login": self.login,
+                    "type": "User",
+                    "url": f"http://{request.host}/users/{self.login}",
+                },
+                headers={
+                    "X-RateLimit-Limit": "5000",
+                    "X-RateLimit-Remaining": "4999",
+                    "X-RateLimit-Reset": str(int(time()) + 3600),
+                },
+            )
+        if path == "/graphql" and method == "POST":
+            return self.graphql(request)
+        if path == "/user/repos" and method == "POST":
+            repo = self.make_repo(request.body["name"])
+            repo.update(
+                (key, value) for key, value in request.body.items() if key in repo
+            )
+            with self.lock:
+                self.repos[repo["name"]] = repo
+            return Response(status=201, body=self.render(repo, request.host))
+
+        match = fullmatch(REPO_PATH, path)
+        if match is None:
+            return Response(status=404, body={"message": "Not Found"})
+
+        rest = match.group("rest") or ""
+        repo = self.repos.get(match.group("name"))
+        if repo is None:
+            return Response(status=404, body={"message": "Not Found"})
+
+        match method, rest:
+            case "GET", "":
+                return Response(status=200, body=self.render(repo, request.host))
+            case "PATCH", "":
+                repo.update(request.body)
+                return Response(status=200, body=self.render(repo, request.host))
+            case "PUT", "/topics":
+                repo["topics"] = request.body["names"]
+                return Response(status=200, body={"names": repo["topics"]})
+            case _:
+                return Response(status=404, body={"message": "Not Found"})
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version: str = "HTTP/1.1"
+    server: "FakeServer"
+
+    @override
+    def setup(self: Self) -> None:
+        super().setup()
+        self.rfile = CountingReader(self.rfile, self.server.traffic)  # pyright: ignore[reportAttributeAccessIssue]
+        self.wfile = CountingWriter(self.wfile, self.server.traffic)  # pyright: ignore[reportAttributeAccessIssue]
+
+    @override
+    def log_message(self: Self, format: str, *args: Any) -> None:
+        pass
+
+    def read_body(self: Self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length > 0 else b""
+        return loads(data) if data else {}
+
+    def send(self: Self, response: Response) -> None:
+        data = b"" if response.body is None else dumps(response.body).encode()
+        headers = dict(response.headers)
+        status = response.status
+
+        if self.command == "GET" and status == 200:
+            etag = f'"{sha1(data).hexdigest()}"'
+            headers["ETag"] = etag
+
+            if self.headers.get("If-None-Match") == etag:
+                status = 304
+                data = b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def dispatch(self: Self) -> None:
+        if self.server.latency > 0:
+            sleep(self.server.latency)
+
+        url = urlparse(self.path)
+        path = url.path.removeprefix(FORGEJO_PREFIX)
+        self.server.traffic.record_call(
+            f"{self.server.name} {get_endpoint(self.command, path)}"
+        )
+
+        request = Request(
+            method=self.command,
+            path=url.path,
+            query={key: values[0] for key, values in parse_qs(url.query).items()},
+            body=self.read_body(),
+            host=self.headers.get("Host") or "",
+        )
+        self.send(self.server.respond(request))
+
+    do_GET = dispatch
+    do_POST = dispatch
+    do_PUT = dispatch
+    do_PATCH = dispatch
+    do_DELETE = dispatch
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads: bool = True
+
+    name: str
+    respond: Callable[[Request], Response]
+    traffic: Traffic
+    latency: float
+
+    def __init__(
+        self: Self,
+        name: str,
+        respond: Callable[[Request], Response],
+        traffic: Traffic,
+        latency: float,
+        host: str = "127.0.0.1",
+    ) -> None:
+        super().__init__((host, 0), FakeHandler)
+        self.name = name
+        self.respond = respond
+        self.traffic = traffic
+        self.latency = latency
+
+    @property
+    def port(self: Self) -> int:
+        return self.server_address[1]
+
+    def start(self: Self) -> None:
+        Thread(target=self.serve_forever, name=f"fake-{self.name}", daemon=True).start()
+
+    def stop(self: Self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,259 @@
+"""
+Benchmarks forgesync end to end against local fake Forgejo and GitHub
+servers, and reports the results as JSON.
+"""
+
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from importlib.metadata import version
+from json import dumps
+from os import environ, wait4, waitstatus_to_exitcode
+from pathlib import Path
+from platform import python_version
+from subprocess import Popen
+from sys import executable, platform, stderr
+from tempfile import TemporaryFile
+from time import perf_counter
+from typing import Literal, Self
+
+from fakes import (
+    SOURCE_LOGIN,
+    TARGET_LOGIN,
+    FakeForgejo,
+    FakeGithub,
+    FakeServer,
+    Traffic,
+)
+from tap import Tap
+
+
+class BenchmarkArgumentParser(Tap):
+    repos: tuple[int, ...] = (10, 1000)
+    "numbers of source repositories to benchmark, e.g. 10 1000 20000"
+    target: Literal["forgejo", "github"] = "forgejo"
+    "platform of the fake destination"
+    latency: float = 0.0
+    "artificial latency added to every request, in seconds"
+    page_size: int = 50
+    "largest page the fake servers return"
+    existing: float = 0.5
+    "share of the repositories that already exist at the destination"
+    runs: int = 1
+    "runs per repository count against the same servers; later runs see the changes made by earlier ones"
+    output: Path | None = None
+    "write the results to this file instead of standard output"
+
+    def configure(self: Self) -> None:
+        self.add_argument("--repos", nargs="+")  # pyright: ignore[reportUnknownMemberType]
+
+
+@dataclass
+class EndpointResult:
+    calls: int
+    calls_per_repo: float
+
+
+@dataclass
+class BenchmarkResult:
+    repos: int
+    run: int
+    target: str
+    latency: float
+    page_size: int
+    args: list[str]
+    exit_code: int
+    wall_time: float
+    peak_rss: int
+    calls: int
+    calls_per_repo: float
+    request_bytes: int
+    response_bytes: int
+    endpoints: dict[str, EndpointResult]
+
+
+@dataclass
+class Fakes:
+    source: FakeServer
+    target: FakeServer
+    target_url: str
+    traffic: Traffic
+
+    @classmethod
+    def start(cls, args: BenchmarkArgumentParser, repo_count: int) -> Self:
+        traffic = Traffic()
+        existing = int(repo_count * args.existing)
+
+        source = FakeServer(
+            name="source",
+            respond=lambda request: source_api.handle(request),
+            traffic=traffic,
+            latency=args.latency,
+        )
+        source_api = FakeForgejo(
+            login=SOURCE_LOGIN,
+            base_url=f"http://127.0.0.1:{source.port}",
+            repo_count=repo_count,
+            page_size=args.page_size,
+        )
+
+        # The GitHub destination runs on another host name, so the rate
+        # limiter doesn't apply its write cap to the source as well.
+        match args.target:
+            case "forgejo":
+                target = FakeServer(
+                    name="target",
+                    respond=lambda request: target_api.handle(request),
+                    traffic=traffic,
+                    latency=args.latency,
+                )
+                target_api = FakeForgejo(
+                    login=TARGET_LOGIN,
+                    base_url=f"http://127.0.0.1:{target.port}",
+                    repo_count=existing,
+                    page_size=args.page_size,
+                )
+                target_url = f"forgejo=http://127.0.0.1:{target.port}/api/v1"
+            case "github":
+                github_api = FakeGithub(login=TARGET_LOGIN, repo_count=existing)
+                target = FakeServer(
+                    name="target",
+                    respond=github_api.handle,
+                    traffic=traffic,
+                    latency=args.latency,
+                    host="localhost",
+                )
+                target_url = f"github=http://localhost:{target.port}"
+
+        source.start()
+        target.start()
+        return cls(source=source, target=target, target_url=target_url, traffic=traffic)
+
+    def stop(self: Self) -> None:
+        self.source.stop()
+        self.target.stop()
+
+
+def get_peak_rss(max_rss: int) -> int:
+    # Linux reports kibibytes, macOS bytes.
+    return max_rss if platform == "darwin" else max_rss * 1024
+
+
+def run_forgesync(fakes: Fakes, forgesync_args: list[str]) -> tuple[int, float, int]:
+    """
+    Runs forgesync in a child process, so its peak memory can be measured on
+    its own. Returns its exit code, wall time and peak RSS in bytes.
+    """
+
+    argv = [
+        executable,
+        "-m",
+        "forgesync",
+        f"http://127.0.0.1:{fakes.source.port}/api/v1",
+        fakes.target_url,
+        *forgesync_args,
+    ]
+    env = {
+        **environ,
+        "SOURCE_TOKEN": "source",
+        "TARGET_TOKEN": "target",
+        "MIRROR_TOKEN": "mirror",
+    }
+
+    with TemporaryFile() as log:
+        start = perf_counter()
+        process = Popen(argv, env=env, stdout=log, stderr=log)
+        _, status, usage = wait4(process.pid, 0)
+        wall_time = perf_counter() - start
+
+        exit_code = waitstatus_to_exitcode(status)
+        process.returncode = exit_code
+
+        if exit_code != 0:
+            _ = log.seek(0)
+            print(log.read().decode(errors="replace")[-4000:], file=stderr)
+
+    return exit_code, wall_time, get_peak_rss(usage.ru_maxrss)
+
+
+def make_result(
+    args: BenchmarkArgumentParser,
+    repo_count: int,
+    run: int,
+    traffic: Traffic,
+    exit_code: int,
+    wall_time: float,
+    peak_rss: int,
+) -> BenchmarkResult:
+    calls = sum(traffic.calls.values())
+
+    return BenchmarkResult(
+        repos=repo_count,
+        run=run,
+        target=args.target,
+        latency=args.latency,
+        page_size=args.page_size,
+        args=args.extra_args,
+        exit_code=exit_code,
+        wall_time=round(wall_time, 3),
+        peak_rss=peak_rss,
+        calls=calls,
+        calls_per_repo=round(calls / max(repo_count, 1), 3),
+        request_bytes=traffic.received,
+        response_bytes=traffic.sent,
+        endpoints={
+            endpoint: EndpointResult(
+                calls=count, calls_per_repo=round(count / max(repo_count, 1), 3)
+            )
+            for endpoint, count in sorted(traffic.calls.items())
+        },
+    )
+
+
+def main() -> None:
+    # Options this script doesn't know are passed on to forgesync.
+    args = BenchmarkArgumentParser(
+        description=__doc__, underscores_to_dashes=True
+    ).parse_args(known_only=True)
+    started_at = datetime.now(UTC)
+    results: list[BenchmarkResult] = []
+
+    for repo_count in args.repos:
+        fakes = Fakes.start(args, repo_count)
+
+        try:
+            for run in range(1, args.runs + 1):
+                fakes.traffic.reset()
+                exit_code, wall_time, peak_rss = run_forgesync(fakes, args.extra_args)
+                result = make_result(
+                    args, repo_count, run, fakes.traffic, exit_code, wall_time, peak_rss
+                )
+                results.append(result)
+
+                print(
+                    f"{repo_count} repositories, run {run}: {result.wall_time:.2f}s, "
+                    + f"{result.calls_per_repo:.2f} calls per repository, "
+                    + f"peak RSS {result.peak_rss / 1024 / 1024:.1f} MiB, "
+                    + f"exit code {exit_code}",
+                    file=stderr,
+                )
+        finally:
+            fakes.stop()
+
+    report = dumps(
+        {
+            "forgesync": version("forgesync"),
+            "python": python_version(),
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "results": [asdict(result) for result in results],
+        },
+        indent=2,
+    )
+
+    if args.output is None:
+        print(report)
+    else:
+        _ = args.output.write_text(f"{report}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,9 +36,11 @@ in
             target = lib.mkOption {
               example = "github";
               description = ''
-                The destination, e.g. github, codeberg or forgejo=https://forgejo.example.com/api/v1.
+                The destination, e.g. github, codeberg or forgejo=https://forgejo.example.com/api/v1,
+                or a list of destinations to synchronize to at once.
+                The tokens for the second destination are read from `TARGET_TOKEN_2` and `MIRROR_TOKEN_2`, and so on.
               '';
-              type = types.str;
+              type = types.either types.str (types.listOf types.str);
             };
 
             settings = lib.mkOption {
@@ -75,6 +77,17 @@ in
               type = types.path;
               description = ''
                 The EnvironmentFile for the required tokens: `SOURCE_TOKEN`, `TARGET_TOKEN` and `MIRROR_TOKEN`.
+                In daemon mode, it should also contain `WEBHOOK_SECRET`.
+              '';
+            };
+
+            serve = lib.mkOption {
+              type = types.bool;
+              default = false;
+              description = ''
+                Whether to run the job as a long-running daemon that listens for Forgejo webhooks
+                instead of running it on a timer. Set `listen`, `debounce` and `reconcile-interval`
+                in `settings` to configure it.
               '';
             };
 
@@ -103,18 +116,22 @@ in
           description = "Forgesync job ${jobName}";
         in
         {
-          timers.${unitName} = {
-            wantedBy = [ "timers.target" ];
-            inherit description;
-            inherit (job) timerConfig;
+          timers = lib.mkIf (!job.serve) {
+            ${unitName} = {
+              wantedBy = [ "timers.target" ];
+              inherit description;
+              inherit (job) timerConfig;
+            };
           };
 
           services.${unitName} = {
             after = [ "network.target" ];
+            wantedBy = lib.mkIf job.serve [ "multi-user.target" ];
             inherit description;
 
             serviceConfig = {
-              Type = "oneshot";
+              Type = if job.serve then "simple" else "oneshot";
+              Restart = lib.mkIf job.serve "on-failure";
 
               DynamicUser = true;
 
@@ -123,12 +140,13 @@ in
                   args = [
                     (lib.getExe cfg.package)
                   ]
+                  ++ lib.optional job.serve "serve"
                   ++ (lib.cli.toCommandLineGNU { isLong = _: true; } job.settings)
                   ++ [
                     "--"
                     job.source
-                    job.target
-                  ];
+                  ]
+                  ++ lib.toList job.target;
                 in
                 utils.escapeSystemdExecArgs args;
 
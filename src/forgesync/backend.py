@@ -0,0 +1,170 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from importlib import import_module
+from importlib.metadata import entry_points
+from logging import Logger
+from threading import Lock
+from typing import TYPE_CHECKING, Self
+
+from httpx import AsyncClient, Client
+
+from .platform import (
+    CODEBERG_INSTANCE,
+    GITHUB_INSTANCE,
+    GITHUB_WRITES_PER_MINUTE,
+    Platform,
+)
+from .retry import Retrier
+from .sync import Applier, AsyncSyncer, RepositoryFeature, Syncer
+from .transport import Transport
+
+if TYPE_CHECKING:
+    # The mirror module imports the Forgejo backend, which imports this one.
+    from .mirror import AsyncPushMirrorer, PushMirrorConfig, PushMirrorer
+
+ENTRY_POINT_GROUP = "forgesync.backends"
+
+
+class BackendError(RuntimeError):
+    pass
+
+
+class Backend(ABC):
+    """
+    Makes the syncers for one kind of destination. Backends are only
+    imported once a destination of theirs needs a syncer, so a run doesn't
+    pay for the SDKs of platforms it doesn't synchronize to.
+    """
+
+    # Used when a destination names the platform without an instance.
+    default_instance: str | None = None
+
+    @abstractmethod
+    def make_syncer(
+        self: Self,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: "PushMirrorer",
+        push_mirror_config: "PushMirrorConfig",
+        httpx_client: Client,
+        transport: Transport,
+    ) -> Syncer: ...
+
+    @abstractmethod
+    def make_applier(
+        self: Self,
+        instance: str,
+        token: str,
+        logger: Logger,
+        push_mirrorer: "PushMirrorer",
+        httpx_client: Client,
+        transport: Transport,
+    ) -> Applier: ...
+
+    @abstractmethod
+    async def make_async_syncer(
+        self: Self,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: "AsyncPushMirrorer",
+        push_mirror_config: "PushMirrorConfig",
+        httpx_client: AsyncClient,
+        retrier: Retrier,
+    ) -> AsyncSyncer: ...
+
+
+@dataclass
+class BackendEntry:
+    # Where the backend class is defined, as "module:attribute".
+    target: str
+    # Known up front for built-in backends, so that parsing a destination
+    # doesn't import them.
+    default_instance: str | None = None
+    writes_per_minute: int | None = None
+
+
+BUILTIN_BACKENDS = {
+    Platform.FORGEJO: BackendEntry(target="forgesync.forgejo:ForgejoBackend"),
+    Platform.CODEBERG: BackendEntry(
+        target="forgesync.forgejo:ForgejoBackend", default_instance=CODEBERG_INSTANCE
+    ),
+    Platform.GITHUB: BackendEntry(
+        target="forgesync.github:GithubBackend",
+        default_instance=GITHUB_INSTANCE,
+        writes_per_minute=GITHUB_WRITES_PER_MINUTE,
+    ),
+}
+
+
+class BackendRegistry:
+    """
+    Maps platform names to backends. Besides the built-in ones, backends of
+    other packages are found through the `forgesync.backends` entry point
+    group, which is only read when a name isn't built in.
+    """
+
+    entries: dict[str, BackendEntry]
+    backends: dict[str, Backend]
+    discovered: bool
+    lock: Lock
+
+    def __init__(self: Self, entries: dict[str, BackendEntry]) -> None:
+        self.entries = dict(entries)
+        self.backends = {}
+        self.discovered = False
+        self.lock = Lock()
+
+    def register(self: Self, name: str, entry: BackendEntry) -> None:
+        with self.lock:
+            self.entries[name] = entry
+            _ = self.backends.pop(name, None)
+
+    def find(self: Self, name: str) -> BackendEntry | None:
+        with self.lock:
+            if name not in self.entries and not self.discovered:
+                for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+                    _ = self.entries.setdefault(
+                        entry_point.name, BackendEntry(target=entry_point.value)
+                    )
+                self.discovered = True
+
+            return self.entries.get(name)
+
+    def load(self: Self, name: str) -> Backend:
+        entry = self.find(name)
+        if entry is None:
+            raise BackendError(f"Unknown destination platform: {name}")
+
+        with self.lock:
+            backend = self.backends.get(name)
+            if backend is not None:
+                return backend
+
+            module, _, attribute = entry.target.partition(":")
+            try:
+                backend = getattr(import_module(module), attribute)()
+            except (ImportError, AttributeError) as e:
+                raise BackendError(f"Could not load the {name} backend: {e}")
+
+            if not isinstance(backend, Backend):
+                raise BackendError(f"{entry.target} is not a Forgesync backend")
+
+            self.backends[name] = backend
+            return backend
+
+    def default_instance(self: Self, name: str) -> str | None:
+        entry = self.find(name)
+        if entry is None:
+            raise BackendError(f"Unknown destination platform: {name}")
+
+        if entry.default_instance is not None:
+            return entry.default_instance
+
+        return self.load(name).default_instance
+
+
+registry = BackendRegistry(BUILTIN_BACKENDS)
@@ -0,0 +1,211 @@
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from hashlib import sha256
+from json import dumps, loads
+from pathlib import Path
+from sqlite3 import Connection, connect
+from threading import Lock
+from time import time
+from typing import Self, override
+
+CACHE_FILE = "http-cache.sqlite3"
+
+# Headers describing the wire encoding of a body. Cached bodies are stored
+# decoded, so these must not be replayed.
+HOP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+# Request headers that select a different representation of the same URL.
+VARY_HEADERS = ("accept", "authorization")
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+    def validators(self: Self) -> dict[str, str]:
+        validators: dict[str, str] = {}
+
+        if "etag" in self.headers:
+            validators["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            validators["If-Modified-Since"] = self.headers["last-modified"]
+
+        return validators
+
+    def revalidated(self: Self, headers: Mapping[str, str]) -> "CachedResponse":
+        return CachedResponse(
+            status=self.status,
+            headers={**self.headers, **strip_headers(headers)},
+            body=self.body,
+        )
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+    def count(self: Self, hit: bool) -> None:
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @override
+    def __str__(self: Self) -> str:
+        return f"{self.hits} hits, {self.misses} misses"
+
+
+def strip_headers(headers: Mapping[str, str]) -> dict[str, str]:
+    return {
+        key.lower(): value
+        for key, value in headers.items()
+        if key.lower() not in HOP_HEADERS
+    }
+
+
+def is_cacheable(status: int, headers: Mapping[str, str]) -> bool:
+    if status != 200:
+        return False
+
+    lowered = {key.lower() for key in headers}
+    return "etag" in lowered or "last-modified" in lowered
+
+
+def make_cache_key(method: str, url: str, headers: Mapping[str, str]) -> str:
+    lowered = {key.lower(): value for key, value in headers.items()}
+    inputs = [method.upper(), url, *(lowered.get(key, "") for key in VARY_HEADERS)]
+    return sha256(dumps(inputs).encode()).hexdigest()
+
+
+class HttpCache:
+    """
+    A persistent store of GET responses that carry an `ETag` or
+    `Last-Modified` validator. Stored responses are revalidated with
+    conditional requests, and the least recently used ones are evicted once
+    the bodies exceed `max_size` bytes.
+    """
+
+    connection: Connection
+    lock: Lock
+    # Access times of hits not yet written, so reads stay reads. They are
+    # written before anything is evicted, and on close.
+    accessed: dict[str, float]
+    max_size: int
+    size: int
+    stats: CacheStats
+
+    def __init__(self: Self, path: Path, max_size: int) -> None:
+        self.connection = connect(path, check_same_thread=False)
+        self.lock = Lock()
+        self.accessed = {}
+        self.max_size = max_size
+        self.stats = CacheStats()
+
+        with self.lock, self.connection:
+            _ = self.connection.execute("PRAGMA journal_mode=WAL")
+            _ = self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            (self.size,) = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+    @classmethod
+    def open(cls, cache_dir: Path, max_size: int) -> Self:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return cls(cache_dir / CACHE_FILE, max_size=max_size)
+
+    def get(self: Self, key: str) -> CachedResponse | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT status, headers, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            self.accessed[key] = time()
+
+        status, headers, body = row
+        return CachedResponse(status=status, headers=loads(headers), body=body)
+
+    def put(self: Self, key: str, response: CachedResponse) -> None:
+        size = len(response.body)
+        if size > self.max_size:
+            return
+
+        with self.lock, self.connection:
+            self.flush()
+
+            row = self.connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.size -= row[0]
+
+            _ = self.connection.execute(
+                """
+                INSERT INTO responses (key, status, headers, body, size, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    status = excluded.status,
+                    headers = excluded.headers,
+                    body = excluded.body,
+                    size = excluded.size,
+                    accessed_at = excluded.accessed_at
+                """,
+                (
+                    key,
+                    response.status,
+                    dumps(response.headers),
+                    response.body,
+                    size,
+                    time(),
+                ),
+            )
+            self.size += size
+
+            self.evict()
+
+    def flush(self: Self) -> None:
+        if not self.accessed:
+            return
+
+        _ = self.connection.executemany(
+            "UPDATE responses SET accessed_at = ? WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self.accessed.items()],
+        )
+        self.accessed.clear()
+
+    def evict(self: Self) -> None:
+        while self.size > self.max_size:
+            row = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+
+            key, size = row
+            _ = self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= size
+
+    def close(self: Self) -> None:
+        with self.lock:
+            with self.connection:
+                self.flush()
+
+            self.connection.close()
@@ -0,0 +1,191 @@
+from dataclasses import dataclass, field
+from typing import Any, Self
+from urllib.parse import urlparse, urlunparse
+
+from .sync import SyncError
+
+CATALOG_PAGE_SIZE = 100
+
+CATALOG_QUERY = """
+query ($first: Int!, $after: String) {
+  viewer {
+    login
+    repositories(first: $first, after: $after, ownerAffiliations: OWNER) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        name
+        owner {
+          login
+        }
+        url
+        isEmpty
+        isArchived
+        isFork
+        isTemplate
+        description
+        homepageUrl
+        visibility
+        hasIssuesEnabled
+        hasProjectsEnabled
+        hasWikiEnabled
+        hasDiscussionsEnabled
+        defaultBranchRef {
+          name
+        }
+        repositoryTopics(first: 100) {
+          nodes {
+            topic {
+              name
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# The repository fields compared against the desired state, named as in the
+# REST API so they line up with the edit options.
+EDIT_FIELDS = (
+    "name",
+    "description",
+    "homepage",
+    "private",
+    "has_issues",
+    "has_projects",
+    "has_wiki",
+    "has_discussions",
+    "is_template",
+    "default_branch",
+    "archived",
+)
+
+
+def get_graphql_url(instance: str) -> str:
+    # GitHub Enterprise serves REST from /api/v3 and GraphQL from /api/graphql.
+    url = urlparse(instance.rstrip("/"))
+    path = url.path
+    if path.endswith("/v3"):
+        path = path.removesuffix("/v3")
+
+    return urlunparse(url._replace(path=f"{path}/graphql"))
+
+
+@dataclass
+class CatalogEntry:
+    owner: str
+    name: str
+    clone_url: str
+    empty: bool
+    fork: bool
+    topics: list[str] | None
+    fields: dict[str, Any]
+
+    @property
+    def full_name(self: Self) -> str:
+        return f"{self.owner}/{self.name}"
+
+    @property
+    def archived(self: Self) -> bool:
+        return bool(self.fields.get("archived"))
+
+    @classmethod
+    def from_node(cls, node: dict[str, Any]) -> Self:
+        default_branch = node.get("defaultBranchRef") or {}
+        topics = (node.get("repositoryTopics") or {}).get("nodes") or []
+
+        return cls(
+            owner=node["owner"]["login"],
+            name=node["name"],
+            clone_url=f"{node['url']}.git",
+            empty=node["isEmpty"],
+            fork=node["isFork"],
+            topics=[topic["topic"]["name"] for topic in topics],
+            fields={
+                "name": node["name"],
+                "description": node.get("description"),
+                "homepage": node.get("homepageUrl"),
+                "private": node.get("visibility") != "PUBLIC",
+                "has_issues": node.get("hasIssuesEnabled"),
+                "has_projects": node.get("hasProjectsEnabled"),
+                "has_wiki": node.get("hasWikiEnabled"),
+                "has_discussions": node.get("hasDiscussionsEnabled"),
+                "is_template": node.get("isTemplate"),
+                "default_branch": default_branch.get("name"),
+                "archived": node.get("isArchived"),
+            },
+        )
+
+    @classmethod
+    def from_rest(cls, repo: dict[str, Any], empty: bool) -> Self:
+        return cls(
+            owner=repo["owner"]["login"],
+            name=repo["name"],
+            clone_url=repo["clone_url"],
+            empty=empty,
+            fork=repo.get("fork", False),
+            topics=repo.get("topics"),
+            fields={key: repo.get(key) for key in EDIT_FIELDS},
+        )
+
+
+@dataclass
+class CatalogPage:
+    login: str
+    entries: list[CatalogEntry]
+    cursor: str | None
+
+    @classmethod
+    def parse(cls, response: dict[str, Any]) -> Self:
+        if response.get("errors"):
+            messages = ", ".join(
+                error.get("message", "unknown error") for error in response["errors"]
+            )
+            raise SyncError(f"GitHub catalog query failed: {messages}")
+
+        viewer = response["data"]["viewer"]
+        repositories = viewer["repositories"]
+        page_info = repositories["pageInfo"]
+
+        return cls(
+            login=viewer["login"],
+            entries=[CatalogEntry.from_node(node) for node in repositories["nodes"]],
+            cursor=page_info["endCursor"] if page_info["hasNextPage"] else None,
+        )
+
+
+def make_catalog_variables(cursor: str | None) -> dict[str, Any]:
+    return {"first": CATALOG_PAGE_SIZE, "after": cursor}
+
+
+@dataclass
+class Catalog:
+    """
+    The repositories of the authenticated user, read page by page. Both
+    engines send the query themselves and pass each response to `add`.
+    """
+
+    login: str = ""
+    entries: dict[str, CatalogEntry] = field(default_factory=dict)
+    cursor: str | None = None
+    complete: bool = False
+
+    @property
+    def variables(self: Self) -> dict[str, Any]:
+        return make_catalog_variables(self.cursor)
+
+    def add(self: Self, response: dict[str, Any]) -> None:
+        page = CatalogPage.parse(response)
+        if not page.login:
+            raise SyncError("User must be authenticated")
+
+        self.login = page.login
+        for entry in page.entries:
+            self.entries[entry.name] = entry
+
+        self.cursor = page.cursor
+        self.complete = page.cursor is None
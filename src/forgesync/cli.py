@@ -2,34 +2,133 @@
 Automatically mirror all your Forgejo repositories to GitHub or any Forgejo instance.
 """
 
-from logging import Formatter, Logger, StreamHandler
+import asyncio
+from asyncio import Semaphore, to_thread
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from json import dumps
+from logging import Formatter, Logger, StreamHandler, getLogger
 from os import environ
-from sys import stderr
+from pathlib import Path
+from signal import SIGINT, SIGTERM, signal
+from sys import argv, exit, stderr
+from threading import BoundedSemaphore, Lock
+from time import monotonic, time
 from typing import Self, override
+from urllib.parse import urlparse
 
+from httpx import Client
 from pyforgejo import PyforgejoApi
+from pyforgejo.core.api_error import ApiError
 from tap import Tap
 
+from . import trace
+from .cache import HttpCache
 from .description import make_placeholders
 from .dest import Destination
-from .filter import RepositoryFilter
-from .forgejo import depaginate
-from .mirror import MirrorError, PushMirrorConfig, PushMirrorer, Remirror
-from .source import SourceRepository
-from .sync import (
-    RepositoryError,
-    RepositoryFeature,
-    RepositorySkippedError,
-    SyncError,
+from .discovery import (
+    DEFAULT_SWEEP_INTERVAL,
+    Discovery,
+    DiscoveryMark,
+    make_full_discovery,
+    make_incremental_discovery,
+)
+from .filter import PatternMatcher, RepositoryFilter, SearchOptions
+from .forgejo import (
+    NO_RETRIES,
+    AsyncPaginator,
+    Paginator,
+    get_search_data,
+    make_async_client,
+    make_client,
+)
+from .jobs import JobConfig, load_jobs
+from .journal import Journal
+from .limits import AsyncHostLimits, HostLimits, check_limits
+from .log import GroupingHandler
+from .metrics import format_prometheus, format_summary, write_atomically
+from .mirror import (
+    AsyncPushMirrorer,
+    AsyncPushMirrorIndexes,
+    PushMirrorConfig,
+    PushMirrorer,
+    PushMirrorIndexes,
+    Remirror,
 )
-from .task import Task
+from .plan import Plan, RepositoryPlan
+from .ratelimit import RateLimiter
+from .retry import Retrier, RetryConfig, request_errors_as
+from .runner import (
+    AsyncTaskRunner,
+    Engine,
+    Outcome,
+    PlanRunner,
+    RunSummary,
+    TaskRunner,
+)
+from .serve import Daemon, Debouncer, WebhookServer, parse_listen
+from .shard import Shard, count_shards, format_shard_balance
+from .source import SourceRepository
+from .state import StateStore, make_discovery_key
+from .sync import RepositoryFeature, SyncError
+from .task import ApplyTarget, AsyncTarget, AsyncTask, PlannedTask, Target, Task
+from .topics import AsyncTopicCache, TopicCache
+from .transport import HTTP2_AVAILABLE, Transport, TransportConfig
 
 
-class ArgumentParser(Tap):
+class ConnectionArgumentParser(Tap):
+    log: str = "INFO"
+    "log level"
+    pool_size: int | None = None
+    "maximum number of pooled HTTP connections (defaults to twice --jobs)"
+    keepalive: float = 5.0
+    "seconds to keep idle HTTP connections open for reuse"
+    http2: bool = False
+    "use HTTP/2 where the server supports it (requires the h2 package)"
+    timeout: float = 60.0
+    "HTTP request timeout in seconds"
+    cache_dir: Path | None = None
+    "directory for caching HTTP responses, which are then revalidated with conditional requests"
+    cache_size: int = 64
+    "maximum size of the HTTP response cache in MiB"
+    requests_per_second: float | None = None
+    "maximum number of requests per second to each host (unlimited by default)"
+    retries: int = 3
+    "how often to retry a request that failed with a connection error or a 502, 503 or 504 response"
+    retry_backoff: float = 1.0
+    "seconds to wait before the first retry, doubled for every further retry"
+    retry_max_backoff: float = 30.0
+    "maximum number of seconds to wait before a retry"
+    retry_jitter: float = 1.0
+    "fraction of the backoff that is randomized, from 0 to 1"
+    retry_budget: float = 0.2
+    "maximum number of retries per request sent to a host, on top of a few retries every host gets"
+    circuit_threshold: int = 5
+    "number of consecutive failures after which requests to a host are paused"
+    circuit_cooldown: float = 30.0
+    "seconds to pause requests to a failing host before trying it again"
+    metrics_file: Path | None = None
+    "write per-endpoint HTTP metrics and repository outcomes to this file in the Prometheus text format at the end of the run"
+    summary_file: Path | None = None
+    "write the same metrics as a JSON summary to this file at the end of the run"
+    trace_file: Path | None = None
+    "record tracing spans of every task and HTTP request, and write them to this file in the Chrome trace format"
+    jobs: int = 1
+    "number of repositories to synchronize concurrently, across all jobs with forgesync run"
+    source_concurrency: int | None = None
+    "maximum number of concurrent requests to each source instance (defaults to --jobs)"
+    target_concurrency: int | None = None
+    "maximum number of concurrent requests to each target instance (defaults to --jobs)"
+
+
+class SyncArgumentParser(ConnectionArgumentParser):
     source: str
     "base URL of the source instance"
-    target: Destination
-    "the destination, e.g. github, codeberg or forgejo=https://forgejo.example.com/api/v1"
+    target: list[Destination]
+    "the destinations, e.g. github, codeberg or forgejo=https://forgejo.example.com/api/v1"
     description_template: str = "{description} (Mirror of {url})"
     "the repository description template"
     remirror: bool = False
@@ -38,12 +137,10 @@ class ArgumentParser(Tap):
     "whether to purge all existing mirrors before creating new ones"
     mirror_interval: str = "8h0m0s"
     "repository mirror interval"
-    log: str = "INFO"
-    "log level"
     include: list[str] = []
-    "include repositories by these regular expressions"
+    "include repositories by these regular expressions, or shell globs prefixed with glob:"
     exclude: list[str] = []
-    "exclude repositories by these regular expressions"
+    "exclude repositories by these regular expressions, or shell globs prefixed with glob:"
     include_forks: bool = False
     "include forks"
     include_private: bool = False
@@ -54,21 +151,79 @@ class ArgumentParser(Tap):
     "tell Forgejo to sync as soon as commits are pushed"
     feature: list[RepositoryFeature] = []
     "allow a repository feature"
-    dry_run: bool = False
-    "don't actually sync, just print what would be synced"
+    state_dir: Path | None = None
+    "directory for the sync state, used to skip repositories that haven't changed since the last run, and to resume interrupted runs"
+    force: bool = False
+    "synchronize every repository, even if it hasn't changed since the last run"
+    shard: Shard | None = None
+    "only synchronize the repositories of one shard, given as INDEX/COUNT with INDEX counting from 0"
 
     @override
     def configure(self: Self):
         self.add_argument("source")  # pyright: ignore[reportUnknownMemberType]
-        self.add_argument("target", type=Destination.parse)  # pyright: ignore[reportUnknownMemberType]
+        self.add_argument("target", type=Destination.parse, nargs="+")  # pyright: ignore[reportUnknownMemberType]
         self.add_argument("--include", action="append")  # pyright: ignore[reportUnknownMemberType]
         self.add_argument("--exclude", action="append")  # pyright: ignore[reportUnknownMemberType]
         self.add_argument("--feature", action="append")  # pyright: ignore[reportUnknownMemberType]
+        self.add_argument("--shard", type=Shard.parse)  # pyright: ignore[reportUnknownMemberType]
+
+
+class DiscoveryArgumentParser(SyncArgumentParser):
+    incremental: bool = False
+    "only look at repositories updated since the last successful run (requires --state-dir)"
+    sweep_interval: float = DEFAULT_SWEEP_INTERVAL
+    "seconds between full sweeps of all repositories in incremental mode"
+    shard_stats: bool = False
+    "print how the repositories are spread across the shards of --shard and exit"
+
+
+class ArgumentParser(DiscoveryArgumentParser):
+    dry_run: bool = False
+    "don't actually sync, just print what would be synced"
+    engine: Engine = Engine.THREADS
+    "execution engine, either threads or async"
+
+
+class RunArgumentParser(ConnectionArgumentParser):
+    config: Path
+    "TOML file describing the jobs"
+
+
+class PlanArgumentParser(DiscoveryArgumentParser):
+    plan_file: Path = Path("plan.json")
+    "file to write the plan to"
+
+
+class ApplyArgumentParser(ConnectionArgumentParser):
+    plan: Path
+    "plan file written by forgesync plan"
+    state_dir: Path | None = None
+    "directory for the sync state, updated for every repository the plan was applied to"
+
+    @override
+    def configure(self: Self):
+        self.add_argument("plan")  # pyright: ignore[reportUnknownMemberType]
+
+
+class ServeArgumentParser(SyncArgumentParser):
+    dry_run: bool = False
+    "don't actually sync, just print what each batch of webhooks would synchronize"
+    listen: str = "127.0.0.1:8080"
+    "address to listen on for Forgejo webhooks"
+    debounce: float = 10.0
+    "seconds to wait for more events before synchronizing the affected repositories"
+    reconcile_interval: float = 86400.0
+    "seconds between full synchronizations of all repositories"
+    refresh_interval: float = 3600.0
+    "seconds after which webhook batches list the destination repositories again"
 
 
 def make_logger(name: str, level: str) -> Logger:
-    logger = Logger(name)
+    logger = getLogger(name)
     logger.setLevel(level)
+    # Job loggers are children of the main one, which would log their
+    # messages a second time.
+    logger.propagate = False
     formatter = Formatter(
         fmt="{asctime} [{levelname}] {name} ({filename}:{lineno}) - {message}",
         datefmt="%Y-%m-%d %H:%M:%S",
@@ -76,40 +231,88 @@ def make_logger(name: str, level: str) -> Logger:
     )
     handler = StreamHandler(stderr)
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    logger.addHandler(GroupingHandler(handler))
     return logger
 
 
-def get_args() -> ArgumentParser:
-    parser = ArgumentParser(description=__doc__, underscores_to_dashes=True)
-    return parser.parse_args()
+def get_args(
+    argv: list[str],
+) -> (
+    ArgumentParser
+    | PlanArgumentParser
+    | ServeArgumentParser
+    | RunArgumentParser
+    | ApplyArgumentParser
+):
+    if argv[:1] == ["run"]:
+        parser = RunArgumentParser(
+            description="Run the jobs from a configuration file in one process.",
+            underscores_to_dashes=True,
+        )
+        return parser.parse_args(argv[1:])
 
+    if argv[:1] == ["plan"]:
+        parser = PlanArgumentParser(
+            description="Work out what a synchronization would change and write it to a plan file.",
+            underscores_to_dashes=True,
+        )
+        return parser.parse_args(argv[1:])
 
-def get_tokens() -> tuple[str, str, str]:
-    try:
-        source_token = environ["SOURCE_TOKEN"]
-        target_token = environ["TARGET_TOKEN"]
-        mirror_token = environ["MIRROR_TOKEN"]
-    except KeyError as e:
-        raise RuntimeError(f"Missing token: {e}")
+    if argv[:1] == ["apply"]:
+        parser = ApplyArgumentParser(
+            description="Make the changes of a plan file without reading the current state again.",
+            underscores_to_dashes=True,
+        )
+        return parser.parse_args(argv[1:])
 
-    return source_token, target_token, mirror_token
+    if argv[:1] == ["serve"]:
+        parser = ServeArgumentParser(
+            description="Keep repositories in sync by listening for Forgejo webhooks.",
+            underscores_to_dashes=True,
+        )
+        return parser.parse_args(argv[1:])
 
+    parser = ArgumentParser(description=__doc__, underscores_to_dashes=True)
+    return parser.parse_args(argv)
 
-def main() -> None:
-    args = get_args()
 
-    logger = make_logger(name="forgesync", level=args.log)
+@dataclass
+class Tokens:
+    source: str
+    targets: list[str]
+    mirrors: list[str]
 
+
+def get_token_env(name: str, index: int) -> str:
+    # The first destination uses the plain variable, the next ones get a
+    # suffix counting from 2, e.g. TARGET_TOKEN_2.
+    return name if index == 0 else f"{name}_{index + 1}"
+
+
+def get_tokens(
+    destinations: int,
+    source_env: str = "SOURCE_TOKEN",
+    target_env: str = "TARGET_TOKEN",
+    mirror_env: str = "MIRROR_TOKEN",
+) -> Tokens:
     try:
-        source_token, target_token, mirror_token = get_tokens()
-    except RuntimeError as e:
-        logger.fatal(e)
-        exit(1)
+        return Tokens(
+            source=environ[source_env],
+            targets=[
+                environ[get_token_env(target_env, index)]
+                for index in range(destinations)
+            ],
+            mirrors=[
+                environ[get_token_env(mirror_env, index)]
+                for index in range(destinations)
+            ],
+        )
+    except KeyError as e:
+        raise RuntimeError(f"Missing token: {e}")
 
-    source_client = PyforgejoApi(base_url=args.source, api_key=source_token)
 
-    push_mirror_config = PushMirrorConfig(
+def make_push_mirror_config(args: SyncArgumentParser) -> PushMirrorConfig:
+    return PushMirrorConfig(
         interval=args.mirror_interval,
         remirror=Remirror.PURGE
         if args.purge
@@ -120,77 +323,1284 @@ def main() -> None:
         on_commit=args.on_commit,
     )
 
-    push_mirrorer = PushMirrorer(
-        client=source_client,
-        mirror_token=mirror_token,
-        logger=logger,
+
+def make_transport_config(args: ConnectionArgumentParser) -> TransportConfig:
+    return TransportConfig(
+        pool_size=args.pool_size or args.jobs * 2,
+        keepalive=args.keepalive,
+        http2=args.http2,
+        timeout=args.timeout,
     )
 
-    syncer = args.target.make_syncer(
-        token=target_token,
-        features=args.feature,
-        logger=logger,
-        push_mirrorer=push_mirrorer,
-        push_mirror_config=push_mirror_config,
+
+def make_retry_config(args: ConnectionArgumentParser) -> RetryConfig:
+    return RetryConfig(
+        retries=args.retries,
+        backoff=args.retry_backoff,
+        max_backoff=args.retry_max_backoff,
+        jitter=args.retry_jitter,
+        budget=args.retry_budget,
+        failure_threshold=args.circuit_threshold,
+        cooldown=args.circuit_cooldown,
     )
 
-    source_user = source_client.user.get_current()
-    if source_user.login is None:
-        logger.fatal("Could not get username from Forgejo")
-        exit(1)
 
-    real_repos = depaginate(source_client.user.list_repos, source_user.login)
-    source_repos: list[SourceRepository] = []
-    for real in real_repos:
-        source_repos.append(SourceRepository(real=real))
+def check_connection_args(args: ConnectionArgumentParser) -> None:
+    if args.jobs < 1:
+        raise ValueError("The number of jobs must be at least 1")
+    if args.pool_size is not None and args.pool_size < 1:
+        raise ValueError("The connection pool size must be at least 1")
+    if args.requests_per_second is not None and args.requests_per_second <= 0:
+        raise ValueError("The request rate must be positive")
+    if args.retries < 0:
+        raise ValueError("The number of retries can't be negative")
+    if args.retry_backoff <= 0 or args.retry_max_backoff <= 0:
+        raise ValueError("The retry backoff must be positive")
+    if not 0 <= args.retry_jitter <= 1:
+        raise ValueError("The retry jitter must be between 0 and 1")
+    if args.retry_budget < 0:
+        raise ValueError("The retry budget can't be negative")
+    if args.circuit_threshold < 1:
+        raise ValueError("The circuit breaker threshold must be at least 1")
+    if args.circuit_cooldown <= 0:
+        raise ValueError("The circuit breaker cooldown must be positive")
+
+
+def check_args(args: SyncArgumentParser) -> None:
+    check_limits(
+        source=args.source_concurrency or args.jobs,
+        target=args.target_concurrency or args.jobs,
+    )
+    check_connection_args(args)
+    if isinstance(args, DiscoveryArgumentParser):
+        if args.incremental and args.state_dir is None:
+            raise ValueError("Incremental discovery requires --state-dir")
+        if args.sweep_interval <= 0:
+            raise ValueError("The sweep interval must be positive")
+        if args.shard_stats and args.shard is None:
+            raise ValueError("--shard-stats requires --shard")
+    _ = PatternMatcher(args.include)
+    _ = PatternMatcher(args.exclude)
+    if isinstance(args, ServeArgumentParser):
+        _ = parse_listen(args.listen)
+        if args.reconcile_interval <= 0:
+            raise ValueError("The reconciliation interval must be positive")
+        if args.refresh_interval <= 0:
+            raise ValueError("The refresh interval must be positive")
+
+
+def make_cache(args: ConnectionArgumentParser) -> HttpCache | None:
+    if args.cache_dir is None:
+        return None
+
+    return HttpCache.open(args.cache_dir, max_size=args.cache_size * 1024 * 1024)
+
+
+def log_http_stats(
+    logger: Logger, transport: Transport, cache: HttpCache | None, limiter: RateLimiter
+) -> None:
+    logger.info("HTTP connections: %s", transport.stats)
+    if cache is not None:
+        logger.info("HTTP cache: %s", cache.stats)
+    for host, budget in limiter.budgets().items():
+        logger.info("Rate limit budget for %s: %s", host, budget)
+    for host, retries in transport.retrier.summary().items():
+        logger.info("Retries for %s: %s", host, retries)
+
+
+def write_reports(
+    args: ConnectionArgumentParser,
+    logger: Logger,
+    transport: Transport,
+    outcomes: dict[str, dict[str, int]],
+    started_at: float,
+) -> None:
+    duration = monotonic() - started_at
+
+    try:
+        if args.trace_file is not None and trace.tracer is not None:
+            trace.tracer.write(args.trace_file)
+        if args.metrics_file is not None:
+            write_atomically(
+                args.metrics_file,
+                format_prometheus(transport.metrics, outcomes, duration),
+            )
+        if args.summary_file is not None:
+            write_atomically(
+                args.summary_file,
+                format_summary(transport.metrics, outcomes, duration),
+            )
+    except OSError as e:
+        logger.error("Could not write reports: %s", e)
+
+
+def make_run_key(args: SyncArgumentParser, job: str | None = None) -> str:
+    # Runs that select different repositories, or different jobs of a jobs
+    # file, must not resume each other's journals.
+    filters = {
+        "include": args.include,
+        "exclude": args.exclude,
+        "include_forks": args.include_forks,
+        "include_private": args.include_private,
+    }
+    key = f"{make_discovery_key(args.source, args.target, args.shard)} {dumps(filters)}"
+    return f"{job}: {key}" if job is not None else key
+
+
+def open_journal(
+    args: ArgumentParser, logger: Logger, job: str | None = None
+) -> Journal | None:
+    if args.state_dir is None or args.dry_run:
+        return None
 
-    filter = RepositoryFilter(
+    return Journal.open(args.state_dir, run_key=make_run_key(args, job), logger=logger)
+
+
+def make_filter(args: SyncArgumentParser, logger: Logger) -> RepositoryFilter:
+    return RepositoryFilter(
         includes=args.include,
         excludes=args.exclude,
         include_forks=args.include_forks,
         include_private=args.include_private,
         logger=logger,
+        shard=args.shard,
+    )
+
+
+def get_discovery_mark(
+    args: SyncArgumentParser, state: StateStore | None
+) -> DiscoveryMark | None:
+    # Daemon mode always lists every repository.
+    if (
+        not isinstance(args, DiscoveryArgumentParser)
+        or not args.incremental
+        or state is None
+    ):
+        return None
+
+    return state.get_mark(make_discovery_key(args.source, args.target, args.shard))
+
+
+def select_discovery_mark(
+    args: SyncArgumentParser, mark: DiscoveryMark | None, logger: Logger
+) -> DiscoveryMark | None:
+    """
+    Returns the mark to discover repositories from, or None if all
+    repositories have to be listed.
+    """
+
+    if (
+        mark is None
+        or not isinstance(args, DiscoveryArgumentParser)
+        or not args.incremental
+    ):
+        return None
+
+    if args.force:
+        logger.info("Listing all repositories, --force is set")
+        return None
+
+    if mark.sweep_due(args.sweep_interval, time()):
+        logger.info("Listing all repositories, a full sweep is due")
+        return None
+
+    return mark
+
+
+def record_discovery(
+    args: SyncArgumentParser,
+    logger: Logger,
+    state: StateStore | None,
+    mark: DiscoveryMark | None,
+    discovery: Discovery,
+    summary: RunSummary,
+) -> None:
+    # Plans don't synchronize the repositories they discovered.
+    if (
+        not isinstance(args, ArgumentParser)
+        or not args.incremental
+        or state is None
+        or args.dry_run
+    ):
+        return
+
+    if not summary.complete:
+        logger.info(
+            "Keeping the discovery mark, not all repositories were synchronized"
+        )
+        return
+
+    next_mark = discovery.next_mark(previous=mark, now=time())
+    if next_mark is not None:
+        state.record_mark(
+            make_discovery_key(args.source, args.target, args.shard), next_mark
+        )
+
+
+def log_discovery(logger: Logger, discovery: Discovery, mark: DiscoveryMark) -> None:
+    logger.info(
+        "Found %d repositories updated since %s",
+        len(discovery.source_repos),
+        datetime.fromtimestamp(mark.updated_at).isoformat(timespec="seconds"),
     )
 
-    for source_repo in filter.filter(source_repos=source_repos):
-        placeholders = make_placeholders(source_repo.real)
 
+def log_filtered(
+    logger: Logger, discovery: Discovery, filter: RepositoryFilter
+) -> None:
+    if discovery.matched is None:
+        logger.info("Filtered %d repositories on the client", filter.skipped)
+    else:
+        logger.info(
+            "The server's search matched %d repositories, filtered %d of them on the client",
+            discovery.matched,
+            filter.skipped,
+        )
+
+
+def render_description(
+    template: str, source_repo: SourceRepository, logger: Logger
+) -> str:
+    placeholders = make_placeholders(source_repo.real)
+
+    try:
+        return template.format_map(placeholders)
+    except KeyError as e:
+        logger.critical(
+            "Unknown repository description placeholder %s, expected one of the following: %s",
+            str(e),
+            ", ".join(placeholders.keys()),
+        )
+        exit(1)
+
+
+class SourceSession:
+    """
+    The client and per-run caches for one source instance and token. Jobs
+    that read from the same source share a session, so repositories, topics
+    and push mirrors are only listed once.
+    """
+
+    logger: Logger
+    client: PyforgejoApi
+    paginator: Paginator
+    login: str
+    user_id: int | None
+    limit: BoundedSemaphore
+    topic_cache: TopicCache
+    push_mirror_indexes: PushMirrorIndexes
+    full_discoveries: dict[SearchOptions | None, Discovery]
+    lock: Lock
+
+    def __init__(
+        self: Self,
+        base_url: str,
+        token: str,
+        httpx_client: Client,
+        limit: BoundedSemaphore,
+        jobs: int,
+        logger: Logger,
+    ) -> None:
+        self.logger = logger
+        self.client = make_client(
+            base_url=base_url, api_key=token, httpx_client=httpx_client
+        )
+        self.paginator = Paginator.connect(self.client, jobs=jobs)
+        self.limit = limit
+
+        user = self.client.user.get_current(request_options=NO_RETRIES)
+        if user.login is None:
+            raise SyncError("Could not get username from Forgejo")
+
+        self.login = user.login
+        self.user_id = user.id
+
+        self.topic_cache = TopicCache(
+            client=self.client, paginator=self.paginator, limit=limit
+        )
+        self.push_mirror_indexes = PushMirrorIndexes(
+            client=self.client, paginator=self.paginator
+        )
+        self.full_discoveries = {}
+        self.lock = Lock()
+
+    def discover(
+        self: Self, mark: DiscoveryMark | None, search: SearchOptions | None = None
+    ) -> Discovery:
+        """
+        Lists the repositories of the source account. With `search`, the
+        server leaves out what the filter would skip anyway.
+        """
+
+        if mark is None or self.user_id is None:
+            # Jobs with different filters search differently, but can share
+            # the listing when they agree.
+            with self.lock:
+                discovery = self.full_discoveries.get(search)
+                if discovery is None:
+                    discovery = self.list_repos(search)
+                    self.full_discoveries[search] = discovery
+
+                return discovery
+
+        discovery = make_incremental_discovery(
+            self.paginator.walk(
+                self.client.repository.with_raw_response.repo_search,
+                uid=self.user_id,
+                exclusive=True,
+                sort="updated",
+                order="desc",
+                convert=get_search_data,
+                **(search.kwargs() if search is not None else {}),
+            ),
+            mark=mark,
+        )
+        log_discovery(self.logger, discovery, mark)
+        return discovery
+
+    def list_repos(self: Self, search: SearchOptions | None) -> Discovery:
+        if search is not None and self.user_id is not None:
+            try:
+                return self.search_repos(self.user_id, search)
+            except ApiError as e:
+                self.logger.warning(
+                    "Could not search repositories on the server, filtering them on the client: %s",
+                    e,
+                )
+
+        return make_full_discovery(
+            self.paginator.depaginate(
+                self.client.user.with_raw_response.list_repos, self.login
+            )
+        )
+
+    def search_repos(self: Self, user_id: int, search: SearchOptions) -> Discovery:
+        discovery = make_full_discovery([])
+
+        def record_total(total: int) -> None:
+            discovery.matched = total
+
+        for real in self.paginator.depaginate(
+            self.client.repository.with_raw_response.repo_search,
+            uid=user_id,
+            exclusive=True,
+            convert=get_search_data,
+            on_total=record_total,
+            **search.kwargs(),
+        ):
+            discovery.add(real)
+
+        if discovery.matched is not None and discovery.matched > len(
+            discovery.source_repos
+        ):
+            self.logger.warning(
+                "The server's search matched %d repositories, but only listed %d",
+                discovery.matched,
+                len(discovery.source_repos),
+            )
+
+        return discovery
+
+    def get_repos(self: Self, full_names: Iterable[str]) -> list[SourceRepository]:
+        source_repos: list[SourceRepository] = []
+
+        for full_name in sorted(full_names):
+            owner, _, name = full_name.partition("/")
+
+            # The regular listing only covers repositories the user owns.
+            if owner != self.login:
+                self.logger.info("Ignoring %s, it isn't owned by %s", full_name, owner)
+                continue
+
+            try:
+                real = self.client.repository.repo_get(
+                    owner=owner, repo=name, request_options=NO_RETRIES
+                )
+            except ApiError as e:
+                self.logger.warning("Could not fetch %s: %s", full_name, e)
+                continue
+
+            source_repos.append(SourceRepository(real=real))
+
+        return source_repos
+
+
+class SyncSession:
+    """
+    The clients for synchronizing one job with the threads engine. Daemon
+    mode keeps its session across webhook batches, and opens a new one for
+    every reconciliation and once the session is `refresh_interval` seconds
+    old, so cached destination catalogs can't drift for long.
+    """
+
+    args: SyncArgumentParser
+    logger: Logger
+    state: StateStore | None
+    source: SourceSession
+    push_mirror_config: PushMirrorConfig
+    targets: list[Target]
+    journal: Journal | None
+    dry_run: bool
+
+    def __init__(
+        self: Self,
+        args: SyncArgumentParser,
+        logger: Logger,
+        state: StateStore | None,
+        limits: list[HostLimits],
+        source: SourceSession,
+        transport: Transport,
+        httpx_client: Client,
+        tokens: Tokens,
+        journal: Journal | None = None,
+        dry_run: bool = False,
+    ) -> None:
+        self.args = args
+        self.logger = logger
+        self.state = state
+        self.source = source
+        self.journal = journal
+        self.dry_run = dry_run
+
+        self.push_mirror_config = make_push_mirror_config(args)
+        self.targets = []
+
+        for destination, destination_limits, target_token, mirror_token in zip(
+            args.target, limits, tokens.targets, tokens.mirrors, strict=True
+        ):
+            push_mirrorer = PushMirrorer(
+                client=source.client,
+                indexes=source.push_mirror_indexes,
+                mirror_token=mirror_token,
+                logger=logger,
+                limit=destination_limits.source,
+                retrier=transport.retrier,
+            )
+
+            syncer = destination.make_syncer(
+                token=target_token,
+                features=args.feature,
+                logger=logger,
+                push_mirrorer=push_mirrorer,
+                push_mirror_config=self.push_mirror_config,
+                httpx_client=httpx_client,
+                transport=transport,
+            )
+
+            self.targets.append(
+                Target(
+                    destination=destination,
+                    syncer=syncer,
+                    push_mirrorer=push_mirrorer,
+                    limits=destination_limits,
+                )
+            )
+
+    @classmethod
+    def open(
+        cls,
+        args: SyncArgumentParser,
+        logger: Logger,
+        state: StateStore | None,
+        transport: Transport,
+        httpx_client: Client,
+        tokens: Tokens,
+        journal: Journal | None = None,
+        dry_run: bool = False,
+    ) -> Self:
+        source_limit = BoundedSemaphore(args.source_concurrency or args.jobs)
+        source = SourceSession(
+            base_url=args.source,
+            token=tokens.source,
+            httpx_client=httpx_client,
+            limit=source_limit,
+            jobs=args.source_concurrency or args.jobs,
+            logger=logger,
+        )
+
+        return cls(
+            args=args,
+            logger=logger,
+            state=state,
+            limits=[
+                HostLimits(
+                    source=source_limit,
+                    target=BoundedSemaphore(args.target_concurrency or args.jobs),
+                )
+                for _ in args.target
+            ],
+            source=source,
+            transport=transport,
+            httpx_client=httpx_client,
+            tokens=tokens,
+            journal=journal,
+            dry_run=dry_run,
+        )
+
+    def list_repos(self: Self) -> list[SourceRepository]:
+        search = make_filter(self.args, self.logger).search_options()
+        return self.source.discover(mark=None, search=search).source_repos
+
+    def get_repos(self: Self, full_names: Iterable[str]) -> list[SourceRepository]:
+        return self.source.get_repos(full_names)
+
+    def sync(
+        self: Self,
+        slots: BoundedSemaphore | None = None,
+        plans: list[RepositoryPlan] | None = None,
+    ) -> RunSummary:
+        """
+        Discovers the repositories to synchronize, incrementally if enabled,
+        and runs them.
+        """
+
+        args = self.args
+        filter = make_filter(args, self.logger)
+        mark = get_discovery_mark(args, self.state)
+        discovery = self.source.discover(
+            select_discovery_mark(args, mark, self.logger),
+            search=filter.search_options(),
+        )
+        summary = self.run(
+            discovery.source_repos, slots=slots, filter=filter, plans=plans
+        )
+        log_filtered(self.logger, discovery, filter)
+        record_discovery(args, self.logger, self.state, mark, discovery, summary)
+        return summary
+
+    def run(
+        self: Self,
+        source_repos: list[SourceRepository],
+        slots: BoundedSemaphore | None = None,
+        filter: RepositoryFilter | None = None,
+        plans: list[RepositoryPlan] | None = None,
+    ) -> RunSummary:
+        args = self.args
+        runner = TaskRunner(
+            jobs=args.jobs,
+            dry_run=self.dry_run,
+            logger=self.logger,
+            state=self.state,
+            force=args.force,
+            slots=slots,
+            plans=plans,
+            journal=self.journal,
+            remirror=self.push_mirror_config.remirror,
+        )
+
+        if filter is None:
+            filter = make_filter(args, self.logger)
+
+        def make_work() -> Iterator[tuple[SourceRepository, Callable[[], Task]]]:
+            for source_repo in filter.filter(source_repos=source_repos):
+                description = render_description(
+                    args.description_template, source_repo, self.logger
+                )
+
+                yield (
+                    source_repo,
+                    partial(
+                        Task,
+                        topic_cache=self.source.topic_cache,
+                        description=description,
+                        source_repo=source_repo,
+                        push_mirror_config=self.push_mirror_config,
+                        targets=self.targets,
+                    ),
+                )
+
+        # Daemon mode reuses the syncers, so their counts span several runs.
+        skipped_before = sum(target.syncer.stats.skipped for target in self.targets)
+        summary = runner.run(make_work())
+        summary.skipped_writes = (
+            sum(target.syncer.stats.skipped for target in self.targets) - skipped_before
+        )
+        return summary
+
+
+def run_threads(
+    args: ArgumentParser,
+    logger: Logger,
+    state: StateStore | None,
+    transport: Transport,
+    tokens: Tokens,
+    journal: Journal | None = None,
+) -> RunSummary:
+    with transport.make_client() as httpx_client:
+        try:
+            with request_errors_as(SyncError):
+                session = SyncSession.open(
+                    args=args,
+                    logger=logger,
+                    state=state,
+                    transport=transport,
+                    httpx_client=httpx_client,
+                    tokens=tokens,
+                    journal=journal,
+                    dry_run=args.dry_run,
+                )
+        except SyncError as e:
+            logger.fatal(e)
+            exit(1)
+
+        return session.sync()
+
+
+def write_plan(
+    args: PlanArgumentParser,
+    logger: Logger,
+    state: StateStore | None,
+    transport: Transport,
+    tokens: Tokens,
+) -> RunSummary:
+    plans: list[RepositoryPlan] = []
+
+    with transport.make_client() as httpx_client:
         try:
-            description = args.description_template.format_map(placeholders)
-        except KeyError as e:
-            logger.critical(
-                "Unknown repository description placeholder %s, expected one of the following: %s",
-                str(e),
-                ", ".join(placeholders.keys()),
+            with request_errors_as(SyncError):
+                session = SyncSession.open(
+                    args=args,
+                    logger=logger,
+                    state=state,
+                    transport=transport,
+                    httpx_client=httpx_client,
+                    tokens=tokens,
+                )
+        except SyncError as e:
+            logger.fatal(e)
+            exit(1)
+
+        summary = session.sync(plans=plans)
+
+    plan = Plan(
+        source=args.source,
+        destinations=[str(destination) for destination in args.target],
+        repositories=sorted(plans, key=str),
+    )
+
+    try:
+        plan.save(args.plan_file)
+    except OSError as e:
+        logger.fatal("Could not write plan: %s", e)
+        exit(1)
+
+    logger.info(
+        "Planned %d writes to %d repositories in %s",
+        plan.count_writes(),
+        len(plan.repositories),
+        args.plan_file,
+    )
+    return summary
+
+
+def apply_plan(args: ApplyArgumentParser, logger: Logger, started_at: float) -> bool:
+    """
+    Makes the changes of a plan file. Nothing is read from the source or the
+    destinations, so the state must not have changed since planning.
+    Returns whether the plan was applied without fatal errors.
+    """
+
+    try:
+        check_connection_args(args)
+        check_limits(
+            source=args.source_concurrency or args.jobs,
+            target=args.target_concurrency or args.jobs,
+        )
+        plan = Plan.load(args.plan)
+        destinations = [Destination.parse(string) for string in plan.destinations]
+        tokens = get_tokens(destinations=len(destinations))
+    except (ValueError, RuntimeError) as e:
+        logger.fatal(e)
+        return False
+
+    if args.http2 and not HTTP2_AVAILABLE:
+        logger.warning("HTTP/2 requested, but the h2 package is not installed")
+
+    limiter = RateLimiter(logger=logger, requests_per_second=args.requests_per_second)
+    for destination in destinations:
+        destination.register_limits(limiter)
+    transport = Transport(
+        config=make_transport_config(args),
+        limiter=limiter,
+        retrier=Retrier(logger=logger, config=make_retry_config(args)),
+    )
+
+    state = StateStore.open(args.state_dir) if args.state_dir is not None else None
+    source_limit = BoundedSemaphore(args.source_concurrency or args.jobs)
+
+    try:
+        with transport.make_client() as httpx_client:
+            source_client = make_client(
+                base_url=plan.source, api_key=tokens.source, httpx_client=httpx_client
+            )
+            # Applying never lists push mirrors, so the page size doesn't matter.
+            indexes = PushMirrorIndexes(client=source_client, paginator=Paginator())
+
+            targets: dict[str, ApplyTarget] = {}
+            try:
+                with request_errors_as(SyncError):
+                    for destination, target_token, mirror_token in zip(
+                        destinations, tokens.targets, tokens.mirrors, strict=True
+                    ):
+                        limits = HostLimits(
+                            source=source_limit,
+                            target=BoundedSemaphore(
+                                args.target_concurrency or args.jobs
+                            ),
+                        )
+                        push_mirrorer = PushMirrorer(
+                            client=source_client,
+                            indexes=indexes,
+                            mirror_token=mirror_token,
+                            logger=logger,
+                            limit=limits.source,
+                            retrier=transport.retrier,
+                        )
+                        targets[str(destination)] = ApplyTarget(
+                            destination=str(destination),
+                            applier=destination.make_applier(
+                                token=target_token,
+                                logger=logger,
+                                push_mirrorer=push_mirrorer,
+                                httpx_client=httpx_client,
+                                transport=transport,
+                            ),
+                            push_mirrorer=push_mirrorer,
+                            limits=limits,
+                        )
+            except SyncError as e:
+                logger.fatal(e)
+                return False
+
+            runner = PlanRunner(
+                jobs=args.jobs, dry_run=False, logger=logger, state=state
+            )
+            summary = runner.run(
+                PlannedTask(plan=repository, targets=targets)
+                for repository in plan.repositories
             )
+    finally:
+        if state is not None:
+            state.close()
+
+    logger.info("Finished: %s", summary)
+    log_http_stats(logger, transport, None, limiter)
+    write_reports(args, logger, transport, {"": summary.counts()}, started_at)
+
+    return not summary.fatal
+
+
+def print_shard_stats(
+    args: SyncArgumentParser, logger: Logger, transport: Transport, tokens: Tokens
+) -> None:
+    if args.shard is None:
+        return
+
+    filter = make_filter(args, logger)
+    filter.shard = None
+
+    with transport.make_client() as httpx_client:
+        try:
+            with request_errors_as(SyncError):
+                source = SourceSession(
+                    base_url=args.source,
+                    token=tokens.source,
+                    httpx_client=httpx_client,
+                    limit=BoundedSemaphore(args.source_concurrency or args.jobs),
+                    jobs=args.source_concurrency or args.jobs,
+                    logger=logger,
+                )
+        except SyncError as e:
+            logger.fatal(e)
             exit(1)
 
-        task = Task(
-            syncer=syncer,
-            source_client=source_client,
-            description=description,
-            source_repo=source_repo,
-            push_mirrorer=push_mirrorer,
-            push_mirror_config=push_mirror_config,
-            destination=args.target,
+        discovery = source.discover(mark=None, search=filter.search_options())
+        source_repos = filter.filter(discovery.source_repos)
+        print(format_shard_balance(count_shards(source_repos, args.shard.count)))
+
+
+def serve(
+    args: ServeArgumentParser,
+    logger: Logger,
+    state: StateStore | None,
+    transport: Transport,
+    tokens: Tokens,
+) -> None:
+    secret = environ.get("WEBHOOK_SECRET")
+    if secret is None:
+        logger.warning("WEBHOOK_SECRET is not set, accepting unsigned webhooks")
+
+    with transport.make_client() as httpx_client:
+        session: SyncSession | None = None
+        opened_at = 0.0
+
+        def get_session(refresh: bool) -> SyncSession:
+            nonlocal session, opened_at
+
+            if (
+                refresh
+                or session is None
+                or monotonic() - opened_at >= args.refresh_interval
+            ):
+                session = SyncSession.open(
+                    args=args,
+                    logger=logger,
+                    state=state,
+                    transport=transport,
+                    httpx_client=httpx_client,
+                    tokens=tokens,
+                    dry_run=args.dry_run,
+                )
+                opened_at = monotonic()
+
+            return session
+
+        def run(
+            select: Callable[[SyncSession], list[SourceRepository]], refresh: bool
+        ) -> None:
+            nonlocal session
+
+            try:
+                with request_errors_as(SyncError):
+                    current = get_session(refresh)
+                    summary = current.run(select(current))
+            except SyncError as e:
+                logger.error("Synchronization failed: %s", e)
+                # The failure may have left the catalogs out of date.
+                session = None
+                return
+
+            logger.info("Finished: %s", summary)
+
+        server = WebhookServer(
+            address=parse_listen(args.listen),
+            debouncer=Debouncer(delay=args.debounce),
+            secret=secret,
+            logger=logger,
+        )
+        daemon = Daemon(
+            server=server,
+            reconcile_interval=args.reconcile_interval,
+            logger=logger,
+            sync=lambda full_names: run(
+                lambda session: session.get_repos(full_names), refresh=False
+            ),
+            reconcile=lambda: run(lambda session: session.list_repos(), refresh=True),
+        )
+
+        _ = signal(SIGTERM, lambda *_: daemon.stop())
+        _ = signal(SIGINT, lambda *_: daemon.stop())
+
+        daemon.run()
+
+
+@dataclass
+class Job:
+    config: JobConfig
+    args: ArgumentParser
+    tokens: Tokens
+
+
+def parse_job(config: JobConfig, logger: Logger) -> Job:
+    parser = ArgumentParser(description=__doc__, underscores_to_dashes=True)
+    args = parser.parse_args(config.argv)
+
+    check_args(args)
+    if args.engine != Engine.THREADS:
+        logger.warning(
+            "Job %s: configuration files always use the threads engine", config.name
         )
 
-        if args.dry_run:
-            logger.info("Would run task: %s", task)
-            continue
+    return Job(
+        config=config,
+        args=args,
+        tokens=get_tokens(
+            destinations=len(args.target),
+            source_env=config.source_token_env,
+            target_env=config.target_token_env,
+            mirror_env=config.mirror_token_env,
+        ),
+    )
+
+
+def run_jobs(args: RunArgumentParser, logger: Logger, started_at: float) -> bool:
+    """
+    Runs every job of a configuration file concurrently in one process. Jobs
+    share the HTTP transport, a source session per source instance and token,
+    and per-instance concurrency limits. Returns whether all jobs succeeded.
+    """
+
+    try:
+        check_connection_args(args)
+        check_limits(
+            source=args.source_concurrency or args.jobs,
+            target=args.target_concurrency or args.jobs,
+        )
+        jobs = [parse_job(config, logger) for config in load_jobs(args.config)]
+    except (OSError, TypeError, ValueError, RuntimeError) as e:
+        logger.fatal(e)
+        return False
+
+    if args.http2 and not HTTP2_AVAILABLE:
+        logger.warning("HTTP/2 requested, but the h2 package is not installed")
+
+    cache = make_cache(args)
+    limiter = RateLimiter(logger=logger, requests_per_second=args.requests_per_second)
+    for job in jobs:
+        for destination in job.args.target:
+            destination.register_limits(limiter)
+    transport = Transport(
+        config=make_transport_config(args),
+        limiter=limiter,
+        retrier=Retrier(logger=logger, config=make_retry_config(args)),
+        cache=cache,
+    )
+
+    slots = BoundedSemaphore(args.jobs)
+    source_limits: dict[str, BoundedSemaphore] = {}
+    target_limits: dict[str, BoundedSemaphore] = {}
+    states: dict[Path, StateStore] = {}
+    journals: dict[str, Journal] = {}
+    summaries: dict[str, RunSummary] = {}
+
+    def get_state(job: Job) -> StateStore | None:
+        state_dir = job.args.state_dir
+        if state_dir is None:
+            return None
+
+        if state_dir not in states:
+            states[state_dir] = StateStore.open(state_dir)
+
+        return states[state_dir]
+
+    try:
+        with transport.make_client() as httpx_client:
+            sources: dict[tuple[str, str], SourceSession] = {}
+            sessions: dict[str, SyncSession] = {}
+
+            for job in jobs:
+                name = job.config.name
+                source_host = urlparse(job.args.source).hostname or job.args.source
+                source_limit = source_limits.setdefault(
+                    source_host, BoundedSemaphore(args.source_concurrency or args.jobs)
+                )
+                limits = [
+                    HostLimits(
+                        source=source_limit,
+                        target=target_limits.setdefault(
+                            destination.host,
+                            BoundedSemaphore(args.target_concurrency or args.jobs),
+                        ),
+                    )
+                    for destination in job.args.target
+                ]
+                job_logger = make_logger(name=f"forgesync.{name}", level=job.args.log)
+
+                try:
+                    with request_errors_as(SyncError):
+                        key = (job.args.source.rstrip("/"), job.tokens.source)
+                        if key not in sources:
+                            sources[key] = SourceSession(
+                                base_url=job.args.source,
+                                token=job.tokens.source,
+                                httpx_client=httpx_client,
+                                limit=source_limit,
+                                jobs=args.source_concurrency or args.jobs,
+                                logger=job_logger,
+                            )
+
+                        journal = open_journal(job.args, job_logger, job=name)
+                        if journal is not None:
+                            journals[name] = journal
+
+                        sessions[name] = SyncSession(
+                            args=job.args,
+                            logger=job_logger,
+                            state=get_state(job),
+                            limits=limits,
+                            source=sources[key],
+                            transport=transport,
+                            httpx_client=httpx_client,
+                            tokens=job.tokens,
+                            journal=journal,
+                            dry_run=job.args.dry_run,
+                        )
+                except SyncError as e:
+                    job_logger.fatal(e)
+                    summaries[name] = RunSummary()
+                    summaries[name].record(Outcome.FATAL)
+
+            with ThreadPoolExecutor(
+                max_workers=max(len(sessions), 1), thread_name_prefix="forgesync-job"
+            ) as executor:
+                futures = {
+                    name: executor.submit(session.sync, slots)
+                    for name, session in sessions.items()
+                }
+
+                for name, future in futures.items():
+                    summaries[name] = future.result()
+    finally:
+        for name, journal in journals.items():
+            summary = summaries.get(name)
+            journal.close(finished=summary is not None and not summary.interrupted)
+        for state in states.values():
+            state.close()
+        if cache is not None:
+            cache.close()
+
+    for job in jobs:
+        logger.info("Finished %s: %s", job.config.name, summaries[job.config.name])
+    log_http_stats(logger, transport, cache, limiter)
+    write_reports(
+        args,
+        logger,
+        transport,
+        {name: summary.counts() for name, summary in summaries.items()},
+        started_at,
+    )
+
+    return not any(summary.fatal for summary in summaries.values())
+
+
+async def run_async(
+    args: ArgumentParser,
+    logger: Logger,
+    state: StateStore | None,
+    transport: Transport,
+    tokens: Tokens,
+    journal: Journal | None = None,
+) -> RunSummary:
+    source_limit = Semaphore(args.source_concurrency or args.jobs)
+    push_mirror_config = make_push_mirror_config(args)
+    runner = AsyncTaskRunner(
+        jobs=args.jobs,
+        dry_run=args.dry_run,
+        logger=logger,
+        state=state,
+        force=args.force,
+        journal=journal,
+        remirror=push_mirror_config.remirror,
+    )
+
+    filter = make_filter(args, logger)
+    mark = get_discovery_mark(args, state)
+
+    async with transport.make_async_client() as httpx_client:
+        source_client = make_async_client(
+            base_url=args.source, api_key=tokens.source, httpx_client=httpx_client
+        )
 
         try:
-            logger.info("Running task: %s", task)
-            task.run()
-        except MirrorError as error:
-            logger.warning("Mirroring failed: %s", error)
-            continue
-        except RepositorySkippedError as error:
-            logger.warning("Repository %s skipped: %s", source_repo.name, error)
-            continue
-        except RepositoryError as error:
-            logger.warning("Syncing repository %s failed: %s", source_repo.name, error)
-            continue
-        except SyncError as error:
-            logger.fatal("Syncing repository %s failed: %s", source_repo.name, error)
+            # The source is listed the same way as by the threads engine, on
+            # a worker thread with a client of its own.
+            with request_errors_as(SyncError), transport.make_client() as client:
+                source = await to_thread(
+                    SourceSession,
+                    base_url=args.source,
+                    token=tokens.source,
+                    httpx_client=client,
+                    limit=BoundedSemaphore(args.source_concurrency or args.jobs),
+                    jobs=args.source_concurrency or args.jobs,
+                    logger=logger,
+                )
+                source_paginator = AsyncPaginator(
+                    page_size=source.paginator.page_size,
+                    jobs=args.source_concurrency or args.jobs,
+                )
+                push_mirror_indexes = AsyncPushMirrorIndexes(
+                    client=source_client, paginator=source_paginator
+                )
+
+                targets: list[AsyncTarget] = []
+                for destination, target_token, mirror_token in zip(
+                    args.target, tokens.targets, tokens.mirrors, strict=True
+                ):
+                    limits = AsyncHostLimits(
+                        source=source_limit,
+                        target=Semaphore(args.target_concurrency or args.jobs),
+                    )
+
+                    push_mirrorer = AsyncPushMirrorer(
+                        client=source_client,
+                        indexes=push_mirror_indexes,
+                        mirror_token=mirror_token,
+                        logger=logger,
+                        limit=limits.source,
+                        retrier=transport.retrier,
+                    )
+
+                    syncer = await destination.make_async_syncer(
+                        token=target_token,
+                        features=args.feature,
+                        logger=logger,
+                        push_mirrorer=push_mirrorer,
+                        push_mirror_config=push_mirror_config,
+                        httpx_client=httpx_client,
+                        retrier=transport.retrier,
+                    )
+
+                    targets.append(
+                        AsyncTarget(
+                            destination=destination,
+                            syncer=syncer,
+                            push_mirrorer=push_mirrorer,
+                            limits=limits,
+                        )
+                    )
+
+                discovery = await to_thread(
+                    source.discover,
+                    select_discovery_mark(args, mark, logger),
+                    search=filter.search_options(),
+                )
+        except SyncError as e:
+            logger.fatal(e)
+            exit(1)
+
+        topic_cache = AsyncTopicCache(
+            client=source_client, paginator=source_paginator, limit=source_limit
+        )
+
+        def make_work() -> Iterator[tuple[SourceRepository, Callable[[], AsyncTask]]]:
+            for source_repo in filter.filter(source_repos=discovery.source_repos):
+                description = render_description(
+                    args.description_template, source_repo, logger
+                )
+
+                yield (
+                    source_repo,
+                    partial(
+                        AsyncTask,
+                        topic_cache=topic_cache,
+                        description=description,
+                        source_repo=source_repo,
+                        push_mirror_config=push_mirror_config,
+                        targets=targets,
+                    ),
+                )
+
+        summary = await runner.run(make_work())
+        summary.skipped_writes = sum(target.syncer.stats.skipped for target in targets)
+        log_filtered(logger, discovery, filter)
+        record_discovery(args, logger, state, mark, discovery, summary)
+        return summary
+
+
+def main() -> None:
+    started_at = monotonic()
+    args = get_args(argv[1:])
+
+    logger = make_logger(name="forgesync", level=args.log)
+
+    if args.trace_file is not None:
+        _ = trace.enable_tracing()
+
+    if isinstance(args, RunArgumentParser):
+        if not run_jobs(args, logger, started_at):
             exit(1)
+        return
+
+    if isinstance(args, ApplyArgumentParser):
+        if not apply_plan(args, logger, started_at):
+            exit(1)
+        return
+
+    try:
+        tokens = get_tokens(destinations=len(args.target))
+    except RuntimeError as e:
+        logger.fatal(e)
+        exit(1)
+
+    try:
+        check_args(args)
+    except ValueError as e:
+        logger.fatal(e)
+        exit(1)
+
+    if args.http2 and not HTTP2_AVAILABLE:
+        logger.warning("HTTP/2 requested, but the h2 package is not installed")
+
+    cache = make_cache(args)
+    limiter = RateLimiter(logger=logger, requests_per_second=args.requests_per_second)
+    for destination in args.target:
+        destination.register_limits(limiter)
+    transport = Transport(
+        config=make_transport_config(args),
+        limiter=limiter,
+        retrier=Retrier(logger=logger, config=make_retry_config(args)),
+        cache=cache,
+    )
+
+    state = StateStore.open(args.state_dir) if args.state_dir is not None else None
+
+    try:
+        if isinstance(args, ServeArgumentParser):
+            serve(
+                args=args,
+                logger=logger,
+                state=state,
+                transport=transport,
+                tokens=tokens,
+            )
+            write_reports(args, logger, transport, {}, started_at)
+            return
+
+        if args.shard_stats:
+            print_shard_stats(
+                args=args, logger=logger, transport=transport, tokens=tokens
+            )
+            return
+
+        if isinstance(args, PlanArgumentParser):
+            summary = write_plan(
+                args=args,
+                logger=logger,
+                state=state,
+                transport=transport,
+                tokens=tokens,
+            )
+        else:
+            journal = open_journal(args, logger)
+            finished = False
+
+            try:
+                match args.engine:
+                    case Engine.THREADS:
+                        summary = run_threads(
+                            args=args,
+                            logger=logger,
+                            state=state,
+                            transport=transport,
+                            tokens=tokens,
+                            journal=journal,
+                        )
+                    case Engine.ASYNC:
+                        summary = asyncio.run(
+                            run_async(
+                                args=args,
+                                logger=logger,
+                                state=state,
+                                transport=transport,
+                                tokens=tokens,
+                                journal=journal,
+                            )
+                        )
+
+                # A run that was stopped resumes where it left off next time.
+                finished = not summary.interrupted
+            finally:
+                if journal is not None:
+                    journal.close(finished=finished)
+    finally:
+        if state is not None:
+            state.close()
+        if cache is not None:
+            cache.close()
+
+    logger.info("Finished: %s", summary)
+    log_http_stats(logger, transport, cache, limiter)
+    write_reports(args, logger, transport, {"": summary.counts()}, started_at)
+
+    if summary.fatal:
+        exit(1)
@@ -1,47 +1,63 @@
 from logging import Logger
+from httpx import AsyncClient, Client
 from re import fullmatch
 from typing import override
+from urllib.parse import urlparse
 
-from .platform import CODEBERG_INSTANCE, GITHUB_INSTANCE, Platform
-from .mirror import PushMirrorConfig, PushMirrorer
-from .sync import Syncer, RepositoryFeature
-from .github import GithubSyncer
-from .forgejo import ForgejoSyncer
+from .backend import BackendError, registry
+from .mirror import AsyncPushMirrorer, PushMirrorConfig, PushMirrorer
+from .sync import Applier, AsyncSyncer, Syncer, RepositoryFeature
+from .ratelimit import RateLimiter
+from .retry import Retrier
+from .transport import Transport
 
 
 class Destination:
-    platform: Platform
+    # The name of a backend in the registry, which is only loaded once a
+    # syncer for the destination is made.
+    platform: str
     instance: str
 
-    def __init__(self, platform: Platform, instance: str | None) -> None:
+    def __init__(self, platform: str, instance: str | None) -> None:
         self.platform = platform
 
-        if instance is not None:
-            self.instance = instance
-        else:
-            match platform:
-                case Platform.GITHUB:
-                    self.instance = GITHUB_INSTANCE
-                case Platform.CODEBERG:
-                    self.instance = CODEBERG_INSTANCE
-                case Platform.FORGEJO:
-                    raise DestinationError("Forgejo does not have a default instance")
+        if instance is None:
+            try:
+                instance = registry.default_instance(platform)
+            except BackendError as e:
+                raise DestinationError(str(e))
+
+            if instance is None:
+                raise DestinationError(
+                    f"{platform.title()} does not have a default instance"
+                )
+
+        self.instance = instance
 
     @classmethod
     def parse(cls, string: str) -> "Destination":
         match = fullmatch(r"(?P<platform>[^=]+)(=(?P<instance>.+))?", string)
         if match is None:
             raise ValueError(f"Invalid destination syntax: {string}")
-        platform = match.group("platform")
+        platform = match.group("platform").lower()
         instance = match.group("instance")
 
-        try:
-            platform = Platform(platform.lower())
-        except ValueError:
-            raise DestinationError(f"Unknown destination platform: {platform}")
+        if registry.find(platform) is None:
+            raise DestinationError(
+                f"Unknown destination platform: {match.group('platform')}"
+            )
 
         return cls(platform=platform, instance=instance)
 
+    @property
+    def host(self) -> str:
+        return urlparse(self.instance).hostname or self.instance
+
+    def register_limits(self, limiter: RateLimiter) -> None:
+        entry = registry.find(self.platform)
+        if entry is not None and entry.writes_per_minute is not None:
+            limiter.limit_writes(host=self.host, per_minute=entry.writes_per_minute)
+
     def make_syncer(
         self,
         token: str,
@@ -49,24 +65,57 @@ class Destination:
         logger: Logger,
         push_mirrorer: PushMirrorer,
         push_mirror_config: PushMirrorConfig,
+        httpx_client: Client,
+        transport: Transport,
     ) -> Syncer:
-        match self.platform:
-            case Platform.GITHUB:
-                return GithubSyncer(
-                    instance=self.instance,
-                    token=token,
-                    features=features,
-                    logger=logger,
-                    push_mirrorer=push_mirrorer,
-                    push_mirror_config=push_mirror_config,
-                )
-            case Platform.FORGEJO | Platform.CODEBERG:
-                return ForgejoSyncer(
-                    instance=self.instance,
-                    token=token,
-                    features=features,
-                    logger=logger,
-                )
+        return registry.load(self.platform).make_syncer(
+            instance=self.instance,
+            token=token,
+            features=features,
+            logger=logger,
+            push_mirrorer=push_mirrorer,
+            push_mirror_config=push_mirror_config,
+            httpx_client=httpx_client,
+            transport=transport,
+        )
+
+    def make_applier(
+        self,
+        token: str,
+        logger: Logger,
+        push_mirrorer: PushMirrorer,
+        httpx_client: Client,
+        transport: Transport,
+    ) -> Applier:
+        return registry.load(self.platform).make_applier(
+            instance=self.instance,
+            token=token,
+            logger=logger,
+            push_mirrorer=push_mirrorer,
+            httpx_client=httpx_client,
+            transport=transport,
+        )
+
+    async def make_async_syncer(
+        self,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: AsyncPushMirrorer,
+        push_mirror_config: PushMirrorConfig,
+        httpx_client: AsyncClient,
+        retrier: Retrier,
+    ) -> AsyncSyncer:
+        return await registry.load(self.platform).make_async_syncer(
+            instance=self.instance,
+            token=token,
+            features=features,
+            logger=logger,
+            push_mirrorer=push_mirrorer,
+            push_mirror_config=push_mirror_config,
+            httpx_client=httpx_client,
+            retrier=retrier,
+        )
 
     @override
     def __str__(self) -> str:
@@ -0,0 +1,89 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Self
+
+from pyforgejo import Repository as ForgejoRepository
+
+from .source import SourceRepository
+
+DEFAULT_SWEEP_INTERVAL = 7 * 86400.0
+
+
+def get_updated_at(real: ForgejoRepository) -> float | None:
+    updated_at: datetime | None = real.updated_at
+    return updated_at.timestamp() if updated_at is not None else None
+
+
+@dataclass
+class DiscoveryMark:
+    """
+    The newest `updated_at` seen by the last successful run, and when the last
+    full sweep of all repositories finished.
+    """
+
+    updated_at: float
+    swept_at: float
+
+    def sweep_due(self: Self, interval: float, now: float) -> bool:
+        return now - self.swept_at >= interval
+
+    def passed(self: Self, real: ForgejoRepository) -> bool:
+        updated_at = get_updated_at(real)
+        return updated_at is not None and updated_at < self.updated_at
+
+
+@dataclass
+class Discovery:
+    source_repos: list[SourceRepository]
+    full: bool
+    updated_at: float | None
+    # How many repositories the server's search matched, if it said so.
+    matched: int | None = None
+
+    def add(self: Self, real: ForgejoRepository) -> None:
+        self.source_repos.append(SourceRepository(real=real))
+
+        updated_at = get_updated_at(real)
+        if updated_at is not None:
+            self.updated_at = max(self.updated_at or updated_at, updated_at)
+
+    def next_mark(
+        self: Self, previous: DiscoveryMark | None, now: float
+    ) -> DiscoveryMark | None:
+        updated_at = self.updated_at
+        if previous is not None:
+            updated_at = max(updated_at or 0.0, previous.updated_at)
+
+        if updated_at is None:
+            return previous
+
+        swept_at = now if self.full or previous is None else previous.swept_at
+        return DiscoveryMark(updated_at=updated_at, swept_at=swept_at)
+
+
+def make_full_discovery(reals: Iterable[ForgejoRepository]) -> Discovery:
+    discovery = Discovery(source_repos=[], full=True, updated_at=None)
+    for real in reals:
+        discovery.add(real)
+
+    return discovery
+
+
+def make_incremental_discovery(
+    reals: Iterable[ForgejoRepository], mark: DiscoveryMark
+) -> Discovery:
+    """
+    Collects repositories from a listing ordered by `updated_at`, newest
+    first, and stops at the first one that is older than the mark. The mark
+    itself is included, since several repositories can share a timestamp.
+    """
+
+    discovery = Discovery(source_repos=[], full=False, updated_at=None)
+    for real in reals:
+        if mark.passed(real):
+            break
+
+        discovery.add(real)
+
+    return discovery
@@ -1,10 +1,96 @@
 from collections.abc import Iterator, Iterable
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
+from fnmatch import translate
 from logging import Logger
-from re import fullmatch
+from re import Pattern, compile, error as RegexError, fullmatch, search
+from typing import Any, Self
 
+from .shard import Shard
 from .source import SourceRepository
 
+# Forgejo matches `q` as a case-insensitive substring of the name and splits
+# it on commas, so only plain names can be sent as they are.
+LITERAL_PATTERN = r"[A-Za-z0-9_-]+"
+
+GLOB_PREFIX = "glob:"
+
+# Global inline flags, numbered backreferences and conditionals change
+# meaning inside a combined expression.
+STANDALONE_PATTERN = r"\(\?[aiLmsux]+\)|\\[1-9]|\(\?\("
+
+
+def compile_pattern(pattern: str) -> Pattern[str]:
+    try:
+        return compile(pattern)
+    except RegexError as e:
+        raise ValueError(f"Invalid pattern {pattern}: {e}")
+
+
+def combine_patterns(expressions: list[str]) -> list[Pattern[str]]:
+    regexes = [compile_pattern(expression) for expression in expressions]
+    if len(regexes) < 2:
+        return regexes
+
+    try:
+        return [compile("|".join(f"(?:{expression})" for expression in expressions))]
+    except RegexError:
+        # Named groups may clash between patterns.
+        return regexes
+
+
+class PatternMatcher:
+    """
+    Matches names against a list of patterns: regular expressions, or shell
+    globs prefixed with `glob:`. Plain names are looked up in a set, and the
+    other patterns are compiled into a single regular expression once, so a
+    name costs about one regex evaluation however many patterns there are.
+    """
+
+    literals: set[str]
+    regexes: list[Pattern[str]]
+
+    def __init__(self: Self, patterns: Iterable[str]) -> None:
+        self.literals = set()
+        combined: list[str] = []
+        standalone: list[str] = []
+
+        for pattern in patterns:
+            if pattern.startswith(GLOB_PREFIX):
+                combined.append(translate(pattern.removeprefix(GLOB_PREFIX)))
+            elif fullmatch(LITERAL_PATTERN, pattern):
+                self.literals.add(pattern)
+            elif search(STANDALONE_PATTERN, pattern):
+                standalone.append(pattern)
+            else:
+                combined.append(pattern)
+
+        self.regexes = [
+            *combine_patterns(combined),
+            *map(compile_pattern, standalone),
+        ]
+
+    def matches(self: Self, name: str) -> bool:
+        if name in self.literals:
+            return True
+
+        return any(regex.fullmatch(name) is not None for regex in self.regexes)
+
+
+@dataclass(frozen=True)
+class SearchOptions:
+    """
+    The filter predicates the Forgejo repository search applies on the
+    server. Anything it lets through is still checked by the filter.
+    """
+
+    archived: bool = False
+    mode: str | None = None
+    is_private: bool | None = None
+    q: str | None = None
+
+    def kwargs(self: Self) -> dict[str, Any]:
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
 
 @dataclass
 class RepositoryFilter:
@@ -13,47 +99,68 @@ class RepositoryFilter:
     logger: Logger
     include_forks: bool = False
     include_private: bool = False
+    shard: Shard | None = None
+    skipped: int = 0
+    include_matcher: PatternMatcher = field(init=False)
+    exclude_matcher: PatternMatcher = field(init=False)
 
-    @staticmethod
-    def matches(name: str, patterns: list[str]) -> bool:
-        for pattern in patterns:
-            if fullmatch(pattern, name) is not None:
-                return True
+    def __post_init__(self: Self) -> None:
+        self.include_matcher = PatternMatcher(self.includes)
+        self.exclude_matcher = PatternMatcher(self.excludes)
 
-        return False
+    def search_options(self: Self) -> SearchOptions:
+        literal = None
+        if len(self.includes) == 1 and fullmatch(LITERAL_PATTERN, self.includes[0]):
+            literal = self.includes[0]
 
-    def filter(
-        self, source_repos: Iterable[SourceRepository]
-    ) -> Iterator[SourceRepository]:
-        for source_repo in source_repos:
-            if source_repo.real.fork and not self.include_forks:
-                self.logger.info("Repository %s is a fork, skipping", source_repo)
-                continue
+        return SearchOptions(
+            # The source mode leaves out both forks and mirrors.
+            mode=None if self.include_forks else "source",
+            is_private=None if self.include_private else False,
+            q=literal,
+        )
 
-            if source_repo.real.mirror:
-                self.logger.info("Repository %s is a mirror, skipping", source_repo)
-                continue
+    def skip(self: Self, source_repo: SourceRepository) -> bool:
+        if source_repo.real.fork and not self.include_forks:
+            self.logger.info("Repository %s is a fork, skipping", source_repo)
+            return True
 
-            if source_repo.real.private and not self.include_private:
-                self.logger.info("Repository %s is private, skipping", source_repo)
-                continue
+        if source_repo.real.mirror:
+            self.logger.info("Repository %s is a mirror, skipping", source_repo)
+            return True
 
-            if source_repo.real.archived:
-                self.logger.info("Repository %s is archived, skipping", source_repo)
-                continue
+        if source_repo.real.private and not self.include_private:
+            self.logger.info("Repository %s is private, skipping", source_repo)
+            return True
 
-            if self.includes != [] and not self.matches(
-                source_repo.name, self.includes
-            ):
-                self.logger.info(
-                    "Repository %s does not match includes, skipping", source_repo
-                )
-                continue
+        if source_repo.real.archived:
+            self.logger.info("Repository %s is archived, skipping", source_repo)
+            return True
+
+        if self.includes != [] and not self.include_matcher.matches(source_repo.name):
+            self.logger.info(
+                "Repository %s does not match includes, skipping", source_repo
+            )
+            return True
+
+        if self.exclude_matcher.matches(source_repo.name):
+            self.logger.info("Repository %s matches excludes, skipping", source_repo)
+            return True
+
+        if self.shard is not None and not self.shard.contains(source_repo):
+            self.logger.debug(
+                "Repository %s belongs to another shard, skipping", source_repo
+            )
+            return True
+
+        return False
 
-            if self.matches(source_repo.name, self.excludes):
-                self.logger.info(
-                    "Repository %s matches excludes, skipping", source_repo
-                )
+    def filter(
+        self, source_repos: Iterable[SourceRepository]
+    ) -> Iterator[SourceRepository]:
+        for source_repo in source_repos:
+            if self.skip(source_repo):
+                self.skipped += 1
                 continue
 
             yield source_repo
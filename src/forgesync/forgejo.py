@@ -1,42 +1,477 @@
+from asyncio import Semaphore, gather
+from collections.abc import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    Mapping,
+    Sequence,
+)
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from io import StringIO
 from logging import Logger
-from typing import Self, override, Callable, Iterator, TypeVar, Any, Sequence
-from pyforgejo import PyforgejoApi, Repository as ForgejoRepository, User as ForgejoUser
+from typing import TYPE_CHECKING, Any, Self, TypeVar, override
+from httpx import AsyncClient, Client
+from pyforgejo import (
+    AsyncPyforgejoApi,
+    GeneralApiSettings,
+    PyforgejoApi,
+    Repository as ForgejoRepository,
+    SearchResults,
+    User as ForgejoUser,
+)
+from pyforgejo.core.api_error import ApiError
+from pyforgejo.core.http_response import AsyncHttpResponse, HttpResponse
+from pyforgejo.core.request_options import RequestOptions
 from itertools import count
 
 from .source import SourceRepository
+from .backend import Backend
+from .plan import RepositoryChanges
 from .platform import Platform
+from .retry import Retrier
 from .sync import (
+    Applier,
+    AsyncSyncer,
     RepositoryError,
     RepositoryFeature,
     RepositorySkippedError,
     SyncError,
     SyncedRepository,
     Syncer,
+    WriteStats,
+    diff_options,
+    topics_differ,
 )
+from .transport import Transport
+
+if TYPE_CHECKING:
+    # The mirror module imports this one for its paginators.
+    from .mirror import AsyncPushMirrorer, PushMirrorConfig, PushMirrorer
 
 T = TypeVar("T")
 R = TypeVar("R")
 
 
-def depaginate(
-    func: Callable[..., R],
-    *args: Any,
-    convert: Callable[[R], Sequence[T] | None] = lambda item: item,
-    limit: int = 50,
-    **kwargs: Any,
-) -> Iterator[T]:
-    for page in count(1):
-        result = func(*args, page=page, limit=limit, **kwargs)
+DEFAULT_PAGE_SIZE = 50
+PAGE_JOBS = 4
+
+# pyforgejo resends every request answered with a 5xx, 408, 409 or 429,
+# writes included, which can create a repository or push mirror twice.
+# Retries are left to the transport and the `Retrier` instead, so every call
+# passes these options.
+NO_RETRIES: RequestOptions = {"max_retries": 0}
+
+
+def get_total_count(headers: Mapping[str, str]) -> int | None:
+    for key, value in headers.items():
+        if key.lower() == "x-total-count":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+
+    return None
+
+
+def get_page_size(settings: GeneralApiSettings | None) -> int:
+    if settings is None or not settings.max_response_items:
+        return DEFAULT_PAGE_SIZE
+
+    return settings.max_response_items
+
+
+def is_last_page(items: Sequence[Any], first_page: int) -> bool:
+    # The server may cap the limit below the requested one, so only a page
+    # shorter than the first one, or an empty one, is the last.
+    return not items or len(items) < first_page
+
+
+def get_remaining_pages(first_page: int, total: int) -> range:
+    # The server may cap the requested limit, so the size of the first page
+    # is what determines the page boundaries.
+    if first_page == 0 or total <= first_page:
+        return range(0)
+
+    return range(2, -(-total // first_page) + 1)
 
-        items = convert(result) or []
 
-        if not items:
-            break
+class Paginator:
+    """
+    Walks Forgejo list endpoints with the largest page size the server
+    allows. Once the first page reports `X-Total-Count`, the remaining pages
+    are fetched concurrently; without it, pages are fetched one by one until
+    one comes back empty or shorter than the first.
 
+    `func` must be a `with_raw_response` method so the headers are available.
+    """
+
+    page_size: int
+    jobs: int
+
+    def __init__(
+        self: Self, page_size: int = DEFAULT_PAGE_SIZE, jobs: int = PAGE_JOBS
+    ) -> None:
+        self.page_size = page_size
+        self.jobs = jobs
+
+    @classmethod
+    def connect(cls, client: PyforgejoApi, jobs: int = PAGE_JOBS) -> Self:
+        try:
+            settings = client.settings.get_general_api_settings(
+                request_options=NO_RETRIES
+            )
+        except ApiError:
+            settings = None
+
+        return cls(page_size=get_page_size(settings), jobs=jobs)
+
+    def depaginate(
+        self: Self,
+        func: Callable[..., HttpResponse[R]],
+        *args: Any,
+        convert: Callable[[R], Sequence[T] | None] = lambda item: item,
+        on_total: Callable[[int], None] | None = None,
+        **kwargs: Any,
+    ) -> Iterator[T]:
+        limit = self.page_size
+
+        def fetch(page: int) -> Sequence[T]:
+            return (
+                convert(
+                    func(
+                        *args,
+                        page=page,
+                        limit=limit,
+                        request_options=NO_RETRIES,
+                        **kwargs,
+                    ).data
+                )
+                or []
+            )
+
+        response = func(
+            *args, page=1, limit=limit, request_options=NO_RETRIES, **kwargs
+        )
+        items = convert(response.data) or []
         yield from items
 
-        if len(items) < limit:
-            break
+        total = get_total_count(response.headers)
+        if total is not None and on_total is not None:
+            on_total(total)
+
+        if total is None:
+            full = len(items)
+            for page in count(2):
+                if is_last_page(items, first_page=full):
+                    break
+
+                items = fetch(page)
+                yield from items
+
+            return
+
+        pages = get_remaining_pages(first_page=len(items), total=total)
+        if not pages:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.jobs, len(pages))) as executor:
+            for items in executor.map(fetch, pages):
+                yield from items
+
+    def walk(
+        self: Self,
+        func: Callable[..., HttpResponse[R]],
+        *args: Any,
+        convert: Callable[[R], Sequence[T] | None] = lambda item: item,
+        **kwargs: Any,
+    ) -> Iterator[T]:
+        """
+        Fetches pages one by one, only when the previous one is used up, so
+        callers that stop early don't pay for the rest of the listing.
+        """
+
+        full: int | None = None
+        for page in count(1):
+            items = (
+                convert(
+                    func(
+                        *args,
+                        page=page,
+                        limit=self.page_size,
+                        request_options=NO_RETRIES,
+                        **kwargs,
+                    ).data
+                )
+                or []
+            )
+            yield from items
+
+            # As in `depaginate`, the first page shows the server's limit.
+            if full is None:
+                full = len(items)
+            if is_last_page(items, first_page=full):
+                break
+
+
+class AsyncPaginator:
+    page_size: int
+    jobs: int
+
+    def __init__(
+        self: Self, page_size: int = DEFAULT_PAGE_SIZE, jobs: int = PAGE_JOBS
+    ) -> None:
+        self.page_size = page_size
+        self.jobs = jobs
+
+    @classmethod
+    async def connect(cls, client: AsyncPyforgejoApi, jobs: int = PAGE_JOBS) -> Self:
+        try:
+            settings = await client.settings.get_general_api_settings(
+                request_options=NO_RETRIES
+            )
+        except ApiError:
+            settings = None
+
+        return cls(page_size=get_page_size(settings), jobs=jobs)
+
+    async def depaginate(
+        self: Self,
+        func: Callable[..., Awaitable[AsyncHttpResponse[R]]],
+        *args: Any,
+        convert: Callable[[R], Sequence[T] | None] = lambda item: item,
+        **kwargs: Any,
+    ) -> AsyncIterator[T]:
+        limit = self.page_size
+        slots = Semaphore(self.jobs)
+
+        async def fetch(page: int) -> Sequence[T]:
+            async with slots:
+                response = await func(
+                    *args, page=page, limit=limit, request_options=NO_RETRIES, **kwargs
+                )
+
+            return convert(response.data) or []
+
+        response = await func(
+            *args, page=1, limit=limit, request_options=NO_RETRIES, **kwargs
+        )
+        items = convert(response.data) or []
+        for item in items:
+            yield item
+
+        total = get_total_count(response.headers)
+
+        if total is None:
+            full = len(items)
+            for page in count(2):
+                if is_last_page(items, first_page=full):
+                    break
+
+                items = await fetch(page)
+                for item in items:
+                    yield item
+
+            return
+
+        pages = get_remaining_pages(first_page=len(items), total=total)
+
+        for items in await gather(*(fetch(page) for page in pages)):
+            for item in items:
+                yield item
+
+    async def walk(
+        self: Self,
+        func: Callable[..., Awaitable[AsyncHttpResponse[R]]],
+        *args: Any,
+        convert: Callable[[R], Sequence[T] | None] = lambda item: item,
+        **kwargs: Any,
+    ) -> AsyncIterator[T]:
+        full: int | None = None
+        for page in count(1):
+            response = await func(
+                *args,
+                page=page,
+                limit=self.page_size,
+                request_options=NO_RETRIES,
+                **kwargs,
+            )
+            items = convert(response.data) or []
+            for item in items:
+                yield item
+
+            if full is None:
+                full = len(items)
+            if is_last_page(items, first_page=full):
+                break
+
+
+def get_search_data(results: SearchResults) -> list[ForgejoRepository] | None:
+    return results.data
+
+
+def make_client(base_url: str, api_key: str, httpx_client: Client) -> PyforgejoApi:
+    return PyforgejoApi(base_url=base_url, api_key=api_key, httpx_client=httpx_client)
+
+
+def make_async_client(
+    base_url: str, api_key: str, httpx_client: AsyncClient
+) -> AsyncPyforgejoApi:
+    # AsyncPyforgejoApi announces its base URL and API key on stdout, at least
+    # up to the pinned 2.0 series. `test_forgejo` notices when it stops.
+    with redirect_stdout(StringIO()):
+        return AsyncPyforgejoApi(
+            base_url=base_url, api_key=api_key, httpx_client=httpx_client
+        )
+
+
+def check_existing(repo: ForgejoRepository) -> None:
+    if repo.archived:
+        raise RepositorySkippedError("Destination repository is archived")
+
+    if repo.fork:
+        raise RepositorySkippedError("Destination repository is a fork")
+
+
+def make_create_options(
+    source_repo: SourceRepository, description: str
+) -> dict[str, Any]:
+    real = source_repo.real
+
+    return {
+        "name": source_repo.name,
+        "auto_init": False,
+        "default_branch": real.default_branch,
+        "description": description,
+        "private": real.private,
+    }
+
+
+def make_edit_options(
+    source_repo: SourceRepository,
+    description: str,
+    features: list[RepositoryFeature],
+) -> dict[str, Any]:
+    real = source_repo.real
+
+    return {
+        "archived": real.archived,
+        "default_branch": real.default_branch,
+        "description": description,
+        "external_tracker": None,
+        "external_wiki": None,
+        "globally_editable_wiki": None,
+        "has_actions": RepositoryFeature.ACTIONS in features,
+        "has_issues": RepositoryFeature.ISSUES in features,
+        "has_packages": RepositoryFeature.PACKAGES in features,
+        "has_projects": RepositoryFeature.PROJECTS in features,
+        "has_pull_requests": RepositoryFeature.PULL_REQUESTS in features,
+        "has_releases": RepositoryFeature.RELEASES in features,
+        "has_wiki": RepositoryFeature.WIKI in features,
+        "internal_tracker": None,
+        "name": real.name,
+        "private": real.private,
+        "template": real.template,
+        "website": real.website,
+        "wiki_branch": real.wiki_branch,
+    }
+
+
+def diff_edit_options(
+    repo: ForgejoRepository, desired: dict[str, Any]
+) -> dict[str, Any]:
+    return diff_options(
+        desired=desired,
+        current={key: getattr(repo, key, None) for key in desired},
+    )
+
+
+def find_repo(client: PyforgejoApi, owner: str, name: str) -> ForgejoRepository | None:
+    try:
+        return client.repository.repo_get(
+            owner=owner, repo=name, request_options=NO_RETRIES
+        )
+    except ApiError as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
+async def find_async_repo(
+    client: AsyncPyforgejoApi, owner: str, name: str
+) -> ForgejoRepository | None:
+    try:
+        return await client.repository.repo_get(
+            owner=owner, repo=name, request_options=NO_RETRIES
+        )
+    except ApiError as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
+def without_unset(options: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def get_login(user: ForgejoUser) -> str:
+    if user.login is None:
+        raise SyncError("Could not get username from Forgejo")
+
+    return user.login
+
+
+def add_listed_repo(
+    repos: dict[str, ForgejoRepository], repo: ForgejoRepository
+) -> None:
+    if repo.name is not None:
+        repos[repo.name] = repo
+
+
+def find_existing(
+    repos: dict[str, ForgejoRepository], source_repo: SourceRepository
+) -> ForgejoRepository | None:
+    repo = repos.get(source_repo.name)
+    if repo is not None:
+        check_existing(repo)
+
+    return repo
+
+
+def diff_repo(
+    repo: ForgejoRepository,
+    source_repo: SourceRepository,
+    description: str,
+    features: list[RepositoryFeature],
+) -> dict[str, Any]:
+    return diff_edit_options(
+        repo=repo,
+        desired=make_edit_options(
+            source_repo=source_repo, description=description, features=features
+        ),
+    )
+
+
+def make_synced(
+    source_repo: SourceRepository, edited_repo: ForgejoRepository
+) -> SyncedRepository:
+    if (
+        edited_repo.owner is None
+        or edited_repo.owner.login is None
+        or edited_repo.name is None
+        or edited_repo.clone_url is None
+    ):
+        raise RepositoryError("Received malformed target repository from Forgejo")
+
+    return SyncedRepository(
+        new_owner=edited_repo.owner.login,
+        orig_owner=source_repo.owner,
+        name=edited_repo.name,
+        clone_url=edited_repo.clone_url,
+        platform=Platform.FORGEJO,
+        mirrored=False,
+    )
 
 
 class ForgejoSyncer(Syncer):
@@ -45,6 +480,7 @@ class ForgejoSyncer(Syncer):
     repos: dict[str, ForgejoRepository]
     features: list[RepositoryFeature]
     logger: Logger
+    retrier: Retrier
 
     def __init__(
         self: Self,
@@ -52,23 +488,27 @@ class ForgejoSyncer(Syncer):
         token: str,
         features: list[RepositoryFeature],
         logger: Logger,
+        httpx_client: Client,
+        retrier: Retrier,
     ) -> None:
-        self.client = PyforgejoApi(base_url=instance, api_key=token)
+        self.client = make_client(
+            base_url=instance, api_key=token, httpx_client=httpx_client
+        )
 
-        self.user = self.client.user.get_current()
+        self.user = self.client.user.get_current(request_options=NO_RETRIES)
 
         self.features = features
-
-        if self.user.login is None:
-            raise SyncError("Could not get username from Forgejo")
+        self.stats = WriteStats()
 
         self.repos = {}
-        for repo in depaginate(self.client.user.list_repos, self.user.login):
-            if repo.name is None:
-                continue
-            self.repos[repo.name] = repo
+        paginator = Paginator.connect(self.client)
+        for repo in paginator.depaginate(
+            self.client.user.with_raw_response.list_repos, get_login(self.user)
+        ):
+            add_listed_repo(self.repos, repo)
 
         self.logger = logger
+        self.retrier = retrier
 
     @override
     def sync(
@@ -77,77 +517,376 @@ class ForgejoSyncer(Syncer):
         description: str,
         topics: list[str],
     ) -> SyncedRepository:
-        if self.user.login is None:
-            raise SyncError("Cannot get username from Forgejo")
+        login = get_login(self.user)
 
-        self.logger.info("Synchronizing to %s/%s", self.user.login, source_repo.name)
+        self.logger.info("Synchronizing to %s/%s", login, source_repo.name)
 
-        real = source_repo.real
+        repo = find_existing(self.repos, source_repo)
+        if repo is None:
+            repo = self.retrier.call_checked(
+                lambda: self.client.repository.create_current_user_repo(
+                    **make_create_options(
+                        source_repo=source_repo, description=description
+                    ),
+                    request_options=NO_RETRIES,
+                ),
+                lambda: find_repo(self.client, login, source_repo.name),
+            )
 
-        if source_repo.name in self.repos:
-            existing_repo = self.repos[source_repo.name]
+            self.logger.info("Created new Forgejo repository %s", repo.full_name)
 
-            if existing_repo.archived:
-                raise RepositorySkippedError("Destination repository is archived")
+        changes = diff_repo(
+            repo=repo,
+            source_repo=source_repo,
+            description=description,
+            features=self.features,
+        )
 
-            if existing_repo.fork:
-                raise RepositorySkippedError("Destination repository is a fork")
-        else:
-            new_repo = self.client.repository.create_current_user_repo(
-                name=source_repo.name,
-                auto_init=False,
-                default_branch=real.default_branch,
-                description=description,
-                private=real.private,
+        self.stats.count(changed=bool(changes))
+
+        if changes:
+            repo = self.client.repository.repo_edit(
+                owner=login,
+                repo=source_repo.name,
+                **changes,
+                request_options=NO_RETRIES,
+            )
+
+            self.logger.info(
+                "Updated %s on Forgejo repository %s",
+                ", ".join(changes),
+                repo.full_name,
+            )
+
+        self.repos[source_repo.name] = repo
+
+        synced_repo = make_synced(source_repo=source_repo, edited_repo=repo)
+
+        changed_topics = topics_differ(desired=topics, current=repo.topics)
+
+        self.stats.count(changed=changed_topics)
+
+        if changed_topics:
+            self.client.repository.repo_update_topics(
+                owner=synced_repo.new_owner,
+                repo=synced_repo.name,
+                topics=topics,
+                request_options=NO_RETRIES,
             )
 
-            self.logger.info("Created new Forgejo repository %s", new_repo.full_name)
+            self.logger.info("Updated topics on Forgejo repository %s", repo.full_name)
+
+        if not changes and not changed_topics:
+            self.logger.info("Forgejo repository %s is up to date", repo.full_name)
+
+        return synced_repo
 
-        edited_repo = self.client.repository.repo_edit(
-            owner=self.user.login,
-            repo=source_repo.name,
-            archived=real.archived,
-            default_branch=real.default_branch,
+    @override
+    def plan(
+        self: Self,
+        source_repo: SourceRepository,
+        description: str,
+        topics: list[str],
+    ) -> RepositoryChanges:
+        login = get_login(self.user)
+
+        desired = make_edit_options(
+            source_repo=source_repo,
             description=description,
-            external_tracker=None,
-            external_wiki=None,
-            globally_editable_wiki=None,
-            has_actions=RepositoryFeature.ACTIONS in self.features,
-            has_issues=RepositoryFeature.ISSUES in self.features,
-            has_packages=RepositoryFeature.PACKAGES in self.features,
-            has_projects=RepositoryFeature.PROJECTS in self.features,
-            has_pull_requests=RepositoryFeature.PULL_REQUESTS in self.features,
-            has_releases=RepositoryFeature.RELEASES in self.features,
-            has_wiki=RepositoryFeature.WIKI in self.features,
-            internal_tracker=None,
-            name=real.name,
-            private=real.private,
-            template=real.template,
-            website=real.website,
-            wiki_branch=real.wiki_branch,
-        )
-
-        if (
-            edited_repo.owner is None
-            or edited_repo.owner.login is None
-            or edited_repo.name is None
-            or edited_repo.clone_url is None
-        ):
-            raise RepositoryError("Received malformed target repository from Forgejo")
+            features=self.features,
+        )
+
+        repo = find_existing(self.repos, source_repo)
+        if repo is None:
+            return RepositoryChanges(
+                owner=login,
+                name=source_repo.name,
+                clone_url=None,
+                create=make_create_options(
+                    source_repo=source_repo, description=description
+                ),
+                edit=without_unset(desired),
+                topics=list(topics) if topics else None,
+            )
+
+        return RepositoryChanges(
+            owner=login,
+            name=source_repo.name,
+            clone_url=repo.clone_url,
+            edit=diff_edit_options(repo=repo, desired=desired),
+            topics=list(topics)
+            if topics_differ(desired=topics, current=repo.topics)
+            else None,
+        )
+
 
-        self.client.repository.repo_update_topics(
-            owner=edited_repo.owner.login,
-            repo=edited_repo.name,
-            topics=topics,
+class ForgejoApplier(Applier):
+    client: PyforgejoApi
+    logger: Logger
+    retrier: Retrier
+
+    def __init__(
+        self: Self,
+        instance: str,
+        token: str,
+        logger: Logger,
+        httpx_client: Client,
+        retrier: Retrier,
+    ) -> None:
+        self.client = make_client(
+            base_url=instance, api_key=token, httpx_client=httpx_client
         )
+        self.logger = logger
+        self.retrier = retrier
+
+    @override
+    def apply(
+        self: Self, orig_owner: str, changes: RepositoryChanges
+    ) -> SyncedRepository:
+        clone_url = changes.clone_url
+        edit = changes.edit
+
+        if changes.create is not None:
+            create = changes.create
+            repo = self.retrier.call_checked(
+                lambda: self.client.repository.create_current_user_repo(
+                    **create, request_options=NO_RETRIES
+                ),
+                lambda: find_repo(self.client, changes.owner, changes.name),
+            )
+            clone_url = repo.clone_url
 
-        self.logger.info("Updated Forgejo repository %s", edited_repo.full_name)
+            self.logger.info("Created new Forgejo repository %s", repo.full_name)
+
+            # The plan couldn't know the defaults of the new repository.
+            edit = diff_edit_options(repo=repo, desired=edit)
+
+        if edit:
+            _ = self.client.repository.repo_edit(
+                owner=changes.owner,
+                repo=changes.name,
+                **edit,
+                request_options=NO_RETRIES,
+            )
+
+            self.logger.info(
+                "Updated %s on Forgejo repository %s",
+                ", ".join(edit),
+                changes.full_name,
+            )
+
+        if changes.topics is not None:
+            self.client.repository.repo_update_topics(
+                owner=changes.owner,
+                repo=changes.name,
+                topics=changes.topics,
+                request_options=NO_RETRIES,
+            )
+
+            self.logger.info(
+                "Updated topics on Forgejo repository %s", changes.full_name
+            )
+
+        if clone_url is None:
+            raise RepositoryError("Received malformed target repository from Forgejo")
 
         return SyncedRepository(
-            new_owner=edited_repo.owner.login,
-            orig_owner=source_repo.owner,
-            name=edited_repo.name,
-            clone_url=edited_repo.clone_url,
+            new_owner=changes.owner,
+            orig_owner=orig_owner,
+            name=changes.name,
+            clone_url=clone_url,
             platform=Platform.FORGEJO,
             mirrored=False,
         )
+
+
+class AsyncForgejoSyncer(AsyncSyncer):
+    client: AsyncPyforgejoApi
+    user: ForgejoUser
+    repos: dict[str, ForgejoRepository]
+    features: list[RepositoryFeature]
+    logger: Logger
+    retrier: Retrier
+
+    def __init__(
+        self: Self,
+        client: AsyncPyforgejoApi,
+        user: ForgejoUser,
+        repos: dict[str, ForgejoRepository],
+        features: list[RepositoryFeature],
+        logger: Logger,
+        retrier: Retrier,
+    ) -> None:
+        self.client = client
+        self.user = user
+        self.repos = repos
+        self.features = features
+        self.stats = WriteStats()
+        self.logger = logger
+        self.retrier = retrier
+
+    @classmethod
+    async def connect(
+        cls,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        httpx_client: AsyncClient,
+        retrier: Retrier,
+    ) -> Self:
+        client = make_async_client(
+            base_url=instance, api_key=token, httpx_client=httpx_client
+        )
+
+        user = await client.user.get_current(request_options=NO_RETRIES)
+
+        repos: dict[str, ForgejoRepository] = {}
+        paginator = await AsyncPaginator.connect(client)
+        async for repo in paginator.depaginate(
+            client.user.with_raw_response.list_repos, get_login(user)
+        ):
+            add_listed_repo(repos, repo)
+
+        return cls(
+            client=client,
+            user=user,
+            repos=repos,
+            features=features,
+            logger=logger,
+            retrier=retrier,
+        )
+
+    @override
+    async def sync(
+        self: Self,
+        source_repo: SourceRepository,
+        description: str,
+        topics: list[str],
+    ) -> SyncedRepository:
+        login = get_login(self.user)
+
+        self.logger.info("Synchronizing to %s/%s", login, source_repo.name)
+
+        repo = find_existing(self.repos, source_repo)
+        if repo is None:
+            repo = await self.retrier.call_checked_async(
+                lambda: self.client.repository.create_current_user_repo(
+                    **make_create_options(
+                        source_repo=source_repo, description=description
+                    ),
+                    request_options=NO_RETRIES,
+                ),
+                lambda: find_async_repo(self.client, login, source_repo.name),
+            )
+
+            self.logger.info("Created new Forgejo repository %s", repo.full_name)
+
+        changes = diff_repo(
+            repo=repo,
+            source_repo=source_repo,
+            description=description,
+            features=self.features,
+        )
+
+        self.stats.count(changed=bool(changes))
+
+        if changes:
+            repo = await self.client.repository.repo_edit(
+                owner=login,
+                repo=source_repo.name,
+                **changes,
+                request_options=NO_RETRIES,
+            )
+
+            self.logger.info(
+                "Updated %s on Forgejo repository %s",
+                ", ".join(changes),
+                repo.full_name,
+            )
+
+        self.repos[source_repo.name] = repo
+
+        synced_repo = make_synced(source_repo=source_repo, edited_repo=repo)
+
+        changed_topics = topics_differ(desired=topics, current=repo.topics)
+
+        self.stats.count(changed=changed_topics)
+
+        if changed_topics:
+            await self.client.repository.repo_update_topics(
+                owner=synced_repo.new_owner,
+                repo=synced_repo.name,
+                topics=topics,
+                request_options=NO_RETRIES,
+            )
+
+            self.logger.info("Updated topics on Forgejo repository %s", repo.full_name)
+
+        if not changes and not changed_topics:
+            self.logger.info("Forgejo repository %s is up to date", repo.full_name)
+
+        return synced_repo
+
+
+class ForgejoBackend(Backend):
+    # Forgejo sets up its push mirrors itself, from the source instance.
+    @override
+    def make_syncer(
+        self: Self,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: "PushMirrorer",
+        push_mirror_config: "PushMirrorConfig",
+        httpx_client: Client,
+        transport: Transport,
+    ) -> Syncer:
+        return ForgejoSyncer(
+            instance=instance,
+            token=token,
+            features=features,
+            logger=logger,
+            httpx_client=httpx_client,
+            retrier=transport.retrier,
+        )
+
+    @override
+    def make_applier(
+        self: Self,
+        instance: str,
+        token: str,
+        logger: Logger,
+        push_mirrorer: "PushMirrorer",
+        httpx_client: Client,
+        transport: Transport,
+    ) -> Applier:
+        return ForgejoApplier(
+            instance=instance,
+            token=token,
+            logger=logger,
+            httpx_client=httpx_client,
+            retrier=transport.retrier,
+        )
+
+    @override
+    async def make_async_syncer(
+        self: Self,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: "AsyncPushMirrorer",
+        push_mirror_config: "PushMirrorConfig",
+        httpx_client: AsyncClient,
+        retrier: Retrier,
+    ) -> AsyncSyncer:
+        return await AsyncForgejoSyncer.connect(
+            instance=instance,
+            token=token,
+            features=features,
+            logger=logger,
+            httpx_client=httpx_client,
+            retrier=retrier,
+        )
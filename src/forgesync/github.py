@@ -1,33 +1,406 @@
 from dataclasses import replace
+from itertools import count
 from logging import Logger
-from typing import Self, override
+from time import perf_counter, sleep
+from typing import Any, Self, override
+from urllib.parse import urlparse
 from github.AuthenticatedUser import AuthenticatedUser
-from github.GithubException import GithubException
-from github.GithubObject import NotSet
+from github import (
+    Auth as GithubAuth,
+    Github,
+    GithubException,
+    UnknownObjectException,
+)
 from github.Repository import Repository as GithubRepository
-from github import Github, Auth as GithubAuth
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+    Requester,
+)
+from httpx import AsyncClient, Client, Response
+from requests import PreparedRequest, Response as RequestsResponse
+from requests.adapters import HTTPAdapter
+from requests.exceptions import (
+    ConnectTimeout,
+    ConnectionError as RequestsConnectionError,
+    RequestException,
+)
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import NewConnectionError
+from requests.utils import get_encoding_from_headers
 
 from .source import SourceRepository
-from .platform import Platform
-from .mirror import PushMirrorConfig, PushMirrorer, Remirror
+from .backend import Backend
+from .plan import RepositoryChanges
+from .platform import GITHUB_INSTANCE, Platform
+from .mirror import AsyncPushMirrorer, PushMirrorConfig, PushMirrorer, Remirror
+from .catalog import (
+    CATALOG_QUERY,
+    Catalog,
+    CatalogEntry,
+    get_graphql_url,
+)
+from .cache import (
+    CachedResponse,
+    HttpCache,
+    is_cacheable,
+    make_cache_key,
+    strip_headers,
+)
+from .metrics import Metrics, get_endpoint
+from .ratelimit import MAX_PAUSES, RateLimiter
+from .retry import RETRY_STATUSES, Retrier, is_idempotent
+from .trace import span
+from .transport import Transport
 from .sync import (
+    Applier,
+    AsyncSyncer,
     RepositoryError,
     RepositoryFeature,
     SyncError,
     RepositorySkippedError,
     SyncedRepository,
     Syncer,
+    WriteStats,
+    diff_options,
+    topics_differ,
 )
 
+USER_AGENT = "forgesync"
+
+
+def check_existing(archived: bool, fork: bool) -> None:
+    if archived:
+        raise RepositorySkippedError("Destination repository is archived")
+
+    if fork:
+        raise RepositorySkippedError("Destination repository is a fork")
+
+
+def without_unset(options: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def make_create_options(
+    source_repo: SourceRepository,
+    description: str,
+    features: list[RepositoryFeature],
+) -> dict[str, Any]:
+    real = source_repo.real
+
+    return without_unset(
+        {
+            "auto_init": False,
+            "name": source_repo.name,
+            "description": description,
+            "homepage": real.website,
+            "private": real.private,
+            "has_issues": RepositoryFeature.ISSUES in features,
+            "has_projects": RepositoryFeature.PROJECTS in features,
+            "has_wiki": RepositoryFeature.WIKI in features,
+            "has_discussions": RepositoryFeature.DISCUSSIONS in features,
+            "has_downloads": False,
+        }
+    )
+
+
+def make_edit_options(
+    source_repo: SourceRepository,
+    description: str,
+    features: list[RepositoryFeature],
+) -> dict[str, Any]:
+    real = source_repo.real
+
+    return without_unset(
+        {
+            "name": source_repo.name,
+            "description": description,
+            "homepage": real.website,
+            "private": real.private,
+            "has_issues": RepositoryFeature.ISSUES in features,
+            "has_projects": RepositoryFeature.PROJECTS in features,
+            "has_wiki": RepositoryFeature.WIKI in features,
+            "has_discussions": RepositoryFeature.DISCUSSIONS in features,
+            "is_template": real.template,
+            "default_branch": real.default_branch,
+            "archived": real.archived,
+        }
+    )
+
+
+def find_repo(client: Github, full_name: str) -> GithubRepository | None:
+    try:
+        return client.get_repo(full_name)
+    except UnknownObjectException:
+        return None
+
+
+def make_empty_mirror_config(config: PushMirrorConfig) -> PushMirrorConfig:
+    return replace(config, remirror=Remirror.YES, immediate=True)
+
+
+def find_entry(
+    repos: dict[str, CatalogEntry], source_repo: SourceRepository
+) -> CatalogEntry | None:
+    entry = repos.get(source_repo.name)
+    if entry is not None:
+        check_existing(archived=entry.archived, fork=entry.fork)
+
+    return entry
+
+
+def diff_entry(
+    entry: CatalogEntry,
+    source_repo: SourceRepository,
+    description: str,
+    features: list[RepositoryFeature],
+) -> dict[str, Any]:
+    return diff_options(
+        desired=make_edit_options(
+            source_repo=source_repo, description=description, features=features
+        ),
+        current=entry.fields,
+    )
+
+
+def make_synced(source_repo: SourceRepository, entry: CatalogEntry) -> SyncedRepository:
+    return SyncedRepository(
+        new_owner=entry.owner,
+        orig_owner=source_repo.owner,
+        name=entry.name,
+        clone_url=entry.clone_url,
+        platform=Platform.GITHUB,
+        mirrored=False,
+    )
+
+
+def make_requests_response(
+    cached: CachedResponse, request: PreparedRequest
+) -> RequestsResponse:
+    response = RequestsResponse()
+    response.status_code = cached.status
+    response.headers = CaseInsensitiveDict(cached.headers)
+    response._content = cached.body  # pyright: ignore[reportPrivateUsage]
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = request.url or ""
+    response.request = request
+    return response
+
+
+def is_unsent(error: RequestException | None) -> bool:
+    if isinstance(error, ConnectTimeout):
+        return True
+
+    # requests reports refused connections as a ConnectionError wrapping
+    # urllib3's MaxRetryError.
+    return (
+        isinstance(error, RequestsConnectionError)
+        and bool(error.args)
+        and isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    )
+
+
+def can_resend(request: PreparedRequest, error: RequestException | None) -> bool:
+    return is_unsent(error) or is_idempotent(
+        request.method or "GET", urlparse(request.url or "").path
+    )
+
+
+class TransportAdapter(HTTPAdapter):
+    """
+    Routes PyGithub's requests through the shared rate limiter, retry policy,
+    metrics and, if enabled, the response cache.
+    """
+
+    limiter: RateLimiter
+    retrier: Retrier
+    cache: HttpCache | None
+    metrics: Metrics
+
+    def __init__(
+        self: Self,
+        limiter: RateLimiter,
+        retrier: Retrier,
+        cache: HttpCache | None,
+        metrics: Metrics,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.limiter = limiter
+        self.retrier = retrier
+        self.cache = cache
+        self.metrics = metrics
+
+    @override
+    def send(  # pyright: ignore[reportIncompatibleMethodOverride]
+        self: Self, request: PreparedRequest, **kwargs: Any
+    ) -> RequestsResponse:
+        if (
+            self.cache is None
+            or request.method != "GET"
+            or "If-None-Match" in request.headers
+            or "If-Modified-Since" in request.headers
+        ):
+            return self.send_limited(request, **kwargs)
+
+        key = make_cache_key(request.method, request.url or "", request.headers)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            request.headers.update(cached.validators())
+
+        response = self.send_limited(request, **kwargs)
+
+        if cached is not None and response.status_code == 304:
+            self.cache.stats.count(hit=True)
+            return make_requests_response(cached.revalidated(response.headers), request)
+
+        self.cache.stats.count(hit=False)
+
+        if is_cacheable(response.status_code, response.headers):
+            self.cache.put(
+                key,
+                CachedResponse(
+                    status=response.status_code,
+                    headers=strip_headers(response.headers),
+                    body=response.content,
+                ),
+            )
+
+        return response
+
+    def send_limited(
+        self: Self, request: PreparedRequest, **kwargs: Any
+    ) -> RequestsResponse:
+        url = urlparse(request.url or "")
+        host = url.hostname or ""
+        method = request.method or "GET"
+        endpoint = get_endpoint(method, url.path)
+
+        pauses = 0
+        retries = 0
+
+        for attempt in count(1):
+            sleep(self.limiter.before(host, method, url.path))
+            self.retrier.before(host)
+
+            status = "error"
+            start = perf_counter()
+
+            try:
+                with span(endpoint, "http", host=host) as http_span:
+                    try:
+                        response = super().send(request, **kwargs)
+                        status = str(response.status_code)
+                    finally:
+                        counters = self.metrics.observe(
+                            host, endpoint, status, perf_counter() - start, attempt > 1
+                        )
+                        http_span.set(status=status)
+            except RequestException as e:
+                self.retrier.after(host, failed=True)
+
+                retries += 1
+                delay = self.retrier.delay(host, retries)
+                if delay is None or not can_resend(request, e):
+                    raise
+
+                sleep(delay)
+                continue
+
+            # PyGithub doesn't stream, so reading the body here costs nothing.
+            self.metrics.count_bytes(counters, len(response.content))
+
+            failed = response.status_code in RETRY_STATUSES
+            self.retrier.after(host, failed=failed)
+
+            body = response.text if response.status_code == 403 else ""
+            pause = self.limiter.after(
+                host, response.status_code, response.headers, body
+            )
+            if pause is not None and pauses < MAX_PAUSES:
+                pauses += 1
+                response.close()
+                continue
+
+            if not failed or not can_resend(request, None):
+                return response
+
+            retries += 1
+            delay = self.retrier.delay(host, retries)
+            if delay is None:
+                return response
+
+            response.close()
+            sleep(delay)
+
+        raise AssertionError("unreachable")
+
+
+def make_connection_classes(
+    transport: Transport,
+) -> tuple[type[HTTPRequestsConnectionClass], type[HTTPSRequestsConnectionClass]]:
+    def mount(connection: HTTPRequestsConnectionClass | HTTPSRequestsConnectionClass):
+        connection.adapter = TransportAdapter(
+            limiter=transport.limiter,
+            retrier=transport.retrier,
+            cache=transport.cache,
+            metrics=transport.metrics,
+            # Retries happen in the adapter, where they are counted.
+            max_retries=0,
+            pool_connections=connection.pool_size,
+            pool_maxsize=connection.pool_size,
+        )
+        connection.session.mount(f"{connection.protocol}://", connection.adapter)
+
+    class CachingHTTPConnection(HTTPRequestsConnectionClass):
+        def __init__(self: Self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+            mount(self)
+
+    class CachingHTTPSConnection(HTTPSRequestsConnectionClass):
+        def __init__(self: Self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+            mount(self)
+
+    return CachingHTTPConnection, CachingHTTPSConnection
+
+
+def make_client(instance: str, token: str, transport: Transport) -> Github:
+    # PyGithub brings its own requests-based transport, so it shares the pool
+    # size and timeout, and gets the rate limiter, retry policy and response
+    # cache through its connection classes. Those can only be swapped
+    # globally, but the requester picks them up when it is created, so the
+    # defaults are restored right away. PyGithub's own retries are turned
+    # off, as they would resend repository creations after a server error,
+    # and so is its fixed pause between requests, as the rate limiter paces
+    # them for both engines.
+    Requester.injectConnectionClasses(*make_connection_classes(transport))
+    try:
+        return Github(
+            base_url=instance,
+            auth=GithubAuth.Token(token),
+            user_agent=USER_AGENT,
+            pool_size=transport.config.pool_size,
+            timeout=round(transport.config.timeout),
+            retry=None,
+            seconds_between_requests=None,
+            seconds_between_writes=None,
+        )
+    finally:
+        Requester.resetConnectionClasses()
+
 
 class GithubSyncer(Syncer):
     client: Github
     user: AuthenticatedUser
-    repos: dict[str, GithubRepository]
+    login: str
+    repos: dict[str, CatalogEntry]
     logger: Logger
     features: list[RepositoryFeature]
     push_mirrorer: PushMirrorer
     push_mirror_config: PushMirrorConfig
+    retrier: Retrier
 
     def __init__(
         self: Self,
@@ -37,14 +410,10 @@ class GithubSyncer(Syncer):
         logger: Logger,
         push_mirrorer: PushMirrorer,
         push_mirror_config: PushMirrorConfig,
+        transport: Transport,
     ) -> None:
-        auth = GithubAuth.Token(token)
-
-        self.client = Github(
-            base_url=instance,
-            auth=auth,
-            user_agent="forgesync",
-        )
+        self.client = make_client(instance=instance, token=token, transport=transport)
+        self.retrier = transport.retrier
 
         user = self.client.get_user()
         if not isinstance(user, AuthenticatedUser):
@@ -53,10 +422,21 @@ class GithubSyncer(Syncer):
         self.user = user
 
         self.features = features
+        self.stats = WriteStats()
 
-        self.repos = {}
-        for repo in self.user.get_repos():
-            self.repos[repo.name] = repo
+        catalog = Catalog()
+        while not catalog.complete:
+            try:
+                _, response = self.client.requester.graphql_query(
+                    query=CATALOG_QUERY, variables=catalog.variables
+                )
+            except GithubException as e:
+                # PyGithub raises GraphQL errors itself, as HTTP 400.
+                raise SyncError(f"GitHub catalog query failed: {e}")
+            catalog.add(response)
+
+        self.login = catalog.login
+        self.repos = catalog.entries
 
         self.push_mirrorer = push_mirrorer
         self.push_mirror_config = push_mirror_config
@@ -70,97 +450,494 @@ class GithubSyncer(Syncer):
         description: str,
         topics: list[str],
     ) -> SyncedRepository:
-        self.logger.info("Synchronizing to %s/%s", self.user.login, source_repo.name)
-
-        real = source_repo.real
+        self.logger.info("Synchronizing to %s/%s", self.login, source_repo.name)
 
         mirrored = False
 
-        if source_repo.name in self.repos:
-            repo = self.repos[source_repo.name]
+        entry = find_entry(self.repos, source_repo)
+        if entry is None:
+            created = self.retrier.call_checked(
+                lambda: self.user.create_repo(
+                    **make_create_options(
+                        source_repo=source_repo,
+                        description=description,
+                        features=self.features,
+                    )
+                ),
+                lambda: find_repo(self.client, f"{self.login}/{source_repo.name}"),
+            )
+            entry = CatalogEntry.from_rest(created.raw_data, empty=True)
+
+            self.logger.info("Created new GitHub repository %s", entry.full_name)
+            self.repos[source_repo.name] = entry
+
+        # Only needed for writes, a lazy repository doesn't fetch anything.
+        repo = self.client.get_repo(entry.full_name, lazy=True)
+
+        if entry.empty:
+            self.logger.info(
+                "GitHub repository %s is empty, setting up mirroring",
+                entry.full_name,
+            )
+
+            push_mirror = self.push_mirrorer.mirror_repo(
+                synced_repo=make_synced(source_repo=source_repo, entry=entry),
+                config=make_empty_mirror_config(self.push_mirror_config),
+            )
+            if push_mirror is None:
+                raise RepositoryError(
+                    f"Could not mirror new repository {entry.full_name}"
+                )
+
+            # The catalog outlives this run in daemon mode, and the push
+            # mirror fills the repository.
+            entry.empty = False
+            mirrored = True
+
+        changes = diff_entry(
+            entry=entry,
+            source_repo=source_repo,
+            description=description,
+            features=self.features,
+        )
+
+        self.stats.count(changed=bool(changes))
+
+        if changes:
+            # PyGithub fetches the current name unless it is passed along.
+            repo.edit(**{"name": entry.name, **changes})
+            entry.fields.update(changes)
+
+            self.logger.info(
+                "Updated %s on GitHub repository %s",
+                ", ".join(changes),
+                entry.full_name,
+            )
+
+        changed_topics = topics_differ(desired=topics, current=entry.topics)
+
+        self.stats.count(changed=changed_topics)
+
+        if changed_topics:
+            repo.replace_topics(topics=topics)
+            entry.topics = list(topics)
+
+            self.logger.info("Replaced topics on GitHub repository %s", entry.full_name)
+
+        if not changes and not changed_topics:
+            self.logger.info("GitHub repository %s is up to date", entry.full_name)
+
+        synced_repo = make_synced(source_repo=source_repo, entry=entry)
+
+        synced_repo.mirrored = mirrored
+
+        return synced_repo
 
-            if repo.archived:
-                raise RepositorySkippedError("Destination repository is archived")
+    @override
+    def plan(
+        self: Self,
+        source_repo: SourceRepository,
+        description: str,
+        topics: list[str],
+    ) -> RepositoryChanges:
+        desired = make_edit_options(
+            source_repo=source_repo,
+            description=description,
+            features=self.features,
+        )
+        mirror_config = make_empty_mirror_config(self.push_mirror_config)
 
-            if repo.fork:
-                raise RepositorySkippedError("Destination repository is a fork")
-        else:
-            repo = self.user.create_repo(
-                auto_init=False,
+        entry = find_entry(self.repos, source_repo)
+        if entry is None:
+            return RepositoryChanges(
+                owner=self.login,
                 name=source_repo.name,
-                description=description,
-                homepage=real.website if real.website is not None else NotSet,
-                private=real.private if real.private is not None else NotSet,
-                has_issues=RepositoryFeature.ISSUES in self.features,
-                has_projects=RepositoryFeature.PROJECTS in self.features,
-                has_wiki=RepositoryFeature.WIKI in self.features,
-                has_discussions=RepositoryFeature.DISCUSSIONS in self.features,
-                has_downloads=False,
+                clone_url=None,
+                create=make_create_options(
+                    source_repo=source_repo,
+                    description=description,
+                    features=self.features,
+                ),
+                edit=desired,
+                topics=list(topics) if topics else None,
+                mirror=self.push_mirrorer.plan_repo(
+                    source_repo=source_repo, clone_url=None, config=mirror_config
+                ),
+                mirror_first=True,
+            )
+
+        return RepositoryChanges(
+            owner=entry.owner,
+            name=entry.name,
+            clone_url=entry.clone_url,
+            edit=diff_options(desired=desired, current=entry.fields),
+            topics=list(topics)
+            if topics_differ(desired=topics, current=entry.topics)
+            else None,
+            mirror=self.push_mirrorer.plan_repo(
+                source_repo=source_repo,
+                clone_url=entry.clone_url,
+                config=mirror_config,
+            )
+            if entry.empty
+            else None,
+            mirror_first=entry.empty,
+        )
+
+
+class GithubApplier(Applier):
+    client: Github
+    logger: Logger
+    push_mirrorer: PushMirrorer
+    retrier: Retrier
+
+    def __init__(
+        self: Self,
+        instance: str,
+        token: str,
+        logger: Logger,
+        push_mirrorer: PushMirrorer,
+        transport: Transport,
+    ) -> None:
+        self.client = make_client(instance=instance, token=token, transport=transport)
+        self.logger = logger
+        self.push_mirrorer = push_mirrorer
+        self.retrier = transport.retrier
+
+    @override
+    def apply(
+        self: Self, orig_owner: str, changes: RepositoryChanges
+    ) -> SyncedRepository:
+        clone_url = changes.clone_url
+        edit = changes.edit
+
+        if changes.create is not None:
+            # Without a login, PyGithub doesn't fetch the user.
+            user = self.client.get_user()
+            if not isinstance(user, AuthenticatedUser):
+                raise SyncError("User must be authenticated")
+
+            create = changes.create
+            created = CatalogEntry.from_rest(
+                self.retrier.call_checked(
+                    lambda: user.create_repo(**create),
+                    lambda: find_repo(self.client, changes.full_name),
+                ).raw_data,
+                empty=True,
             )
+            clone_url = created.clone_url
+
+            self.logger.info("Created new GitHub repository %s", created.full_name)
 
-            self.logger.info("Created new GitHub repository %s", repo.full_name)
+            # The plan couldn't know the defaults of the new repository.
+            edit = diff_options(desired=edit, current=created.fields)
+
+        if clone_url is None:
+            raise RepositoryError("Received malformed target repository from GitHub")
+
+        synced_repo = SyncedRepository(
+            new_owner=changes.owner,
+            orig_owner=orig_owner,
+            name=changes.name,
+            clone_url=clone_url,
+            platform=Platform.GITHUB,
+            mirrored=False,
+        )
 
-        try:
-            _ = repo.get_contents("/")
-        except GithubException:
-            self.logger.warning(
-                "Could not fetch contents of %s, continuing assuming the repo is empty",
-                repo.name,
+        if changes.mirror_first and changes.mirror is not None:
+            self.logger.info(
+                "GitHub repository %s is empty, setting up mirroring",
+                changes.full_name,
             )
 
-            synced_repo = self.make_synced(source_repo=source_repo, repo=repo)
+            if (
+                self.push_mirrorer.apply_repo(
+                    synced_repo=synced_repo, changes=changes.mirror
+                )
+                is None
+            ):
+                raise RepositoryError(
+                    f"Could not mirror new repository {changes.full_name}"
+                )
+
+            synced_repo.mirrored = True
 
-            push_mirror = self.push_mirrorer.mirror_repo(
-                synced_repo=synced_repo,
-                config=replace(
-                    self.push_mirror_config,
-                    remirror=Remirror.YES,
-                    immediate=True,
+        repo = self.client.get_repo(changes.full_name, lazy=True)
+
+        if edit:
+            # PyGithub fetches the current name unless it is passed along.
+            repo.edit(**{"name": changes.name, **edit})
+
+            self.logger.info(
+                "Updated %s on GitHub repository %s",
+                ", ".join(edit),
+                changes.full_name,
+            )
+
+        if changes.topics is not None:
+            repo.replace_topics(topics=changes.topics)
+
+            self.logger.info(
+                "Replaced topics on GitHub repository %s", changes.full_name
+            )
+
+        return synced_repo
+
+
+class AsyncGithubSyncer(AsyncSyncer):
+    client: AsyncClient
+    instance: str
+    headers: dict[str, str]
+    login: str
+    repos: dict[str, CatalogEntry]
+    logger: Logger
+    features: list[RepositoryFeature]
+    push_mirrorer: AsyncPushMirrorer
+    push_mirror_config: PushMirrorConfig
+    retrier: Retrier
+
+    def __init__(
+        self: Self,
+        client: AsyncClient,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: AsyncPushMirrorer,
+        push_mirror_config: PushMirrorConfig,
+        retrier: Retrier,
+    ) -> None:
+        self.client = client
+        self.instance = instance.rstrip("/")
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+            "User-Agent": USER_AGENT,
+        }
+        self.login = ""
+        self.repos = {}
+        self.features = features
+        self.stats = WriteStats()
+        self.logger = logger
+        self.push_mirrorer = push_mirrorer
+        self.push_mirror_config = push_mirror_config
+        self.retrier = retrier
+
+    @classmethod
+    async def connect(
+        cls,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: AsyncPushMirrorer,
+        push_mirror_config: PushMirrorConfig,
+        httpx_client: AsyncClient,
+        retrier: Retrier,
+    ) -> Self:
+        syncer = cls(
+            client=httpx_client,
+            instance=instance,
+            token=token,
+            features=features,
+            logger=logger,
+            push_mirrorer=push_mirrorer,
+            push_mirror_config=push_mirror_config,
+            retrier=retrier,
+        )
+
+        graphql_url = get_graphql_url(syncer.instance)
+
+        catalog = Catalog()
+        while not catalog.complete:
+            response = await syncer.request(
+                "POST",
+                graphql_url,
+                json={"query": CATALOG_QUERY, "variables": catalog.variables},
+            )
+            catalog.add(response.json())
+
+        syncer.login = catalog.login
+        syncer.repos = catalog.entries
+
+        return syncer
+
+    async def request(
+        self: Self, method: str, url: str, check: bool = True, **kwargs: Any
+    ) -> Response:
+        if url.startswith("/"):
+            url = f"{self.instance}{url}"
+
+        response = await self.client.request(
+            method, url, headers=self.headers, **kwargs
+        )
+
+        if check:
+            _ = response.raise_for_status()
+
+        return response
+
+    async def find_repo(self: Self, name: str) -> Response | None:
+        response = await self.request("GET", f"/repos/{self.login}/{name}", check=False)
+        if response.status_code == 404:
+            return None
+
+        _ = response.raise_for_status()
+        return response
+
+    @override
+    async def sync(
+        self: Self,
+        source_repo: SourceRepository,
+        description: str,
+        topics: list[str],
+    ) -> SyncedRepository:
+        self.logger.info("Synchronizing to %s/%s", self.login, source_repo.name)
+
+        mirrored = False
+
+        entry = find_entry(self.repos, source_repo)
+        if entry is None:
+            response = await self.retrier.call_checked_async(
+                lambda: self.request(
+                    "POST",
+                    "/user/repos",
+                    json=make_create_options(
+                        source_repo=source_repo,
+                        description=description,
+                        features=self.features,
+                    ),
                 ),
+                lambda: self.find_repo(source_repo.name),
+            )
+            entry = CatalogEntry.from_rest(response.json(), empty=True)
+
+            self.logger.info("Created new GitHub repository %s", entry.full_name)
+            self.repos[source_repo.name] = entry
+
+        path = f"/repos/{entry.full_name}"
+
+        if entry.empty:
+            self.logger.info(
+                "GitHub repository %s is empty, setting up mirroring",
+                entry.full_name,
+            )
+
+            push_mirror = await self.push_mirrorer.mirror_repo(
+                synced_repo=make_synced(source_repo=source_repo, entry=entry),
+                config=make_empty_mirror_config(self.push_mirror_config),
             )
             if push_mirror is None:
                 raise RepositoryError(
-                    f"Could not mirror new repository {repo.full_name}"
+                    f"Could not mirror new repository {entry.full_name}"
                 )
 
+            # The catalog outlives this run in daemon mode, and the push
+            # mirror fills the repository.
+            entry.empty = False
             mirrored = True
 
-        repo.edit(
-            name=source_repo.name,
+        changes = diff_entry(
+            entry=entry,
+            source_repo=source_repo,
             description=description,
-            homepage=real.website if real.website is not None else NotSet,
-            private=real.private if real.private is not None else NotSet,
-            has_issues=RepositoryFeature.ISSUES in self.features,
-            has_projects=RepositoryFeature.PROJECTS in self.features,
-            has_wiki=RepositoryFeature.WIKI in self.features,
-            has_discussions=RepositoryFeature.DISCUSSIONS in self.features,
-            is_template=real.template if real.template is not None else NotSet,
-            default_branch=real.default_branch
-            if real.default_branch is not None
-            else NotSet,
-            archived=real.archived if real.archived is not None else NotSet,
+            features=self.features,
         )
 
-        self.logger.info("Updated GitHub repository %s", repo.full_name)
+        self.stats.count(changed=bool(changes))
+
+        if changes:
+            _ = await self.request("PATCH", path, json=changes)
+            entry.fields.update(changes)
+
+            self.logger.info(
+                "Updated %s on GitHub repository %s",
+                ", ".join(changes),
+                entry.full_name,
+            )
+
+        changed_topics = topics_differ(desired=topics, current=entry.topics)
 
-        repo.replace_topics(topics=topics)
+        self.stats.count(changed=changed_topics)
 
-        self.logger.info("Replaced topics on GitHub repository %s", repo.full_name)
+        if changed_topics:
+            _ = await self.request("PUT", f"{path}/topics", json={"names": topics})
+            entry.topics = list(topics)
 
-        synced_repo = self.make_synced(source_repo=source_repo, repo=repo)
+            self.logger.info("Replaced topics on GitHub repository %s", entry.full_name)
+
+        if not changes and not changed_topics:
+            self.logger.info("GitHub repository %s is up to date", entry.full_name)
+
+        synced_repo = make_synced(source_repo=source_repo, entry=entry)
 
         synced_repo.mirrored = mirrored
 
         return synced_repo
 
-    def make_synced(
-        self: Self, source_repo: SourceRepository, repo: GithubRepository
-    ) -> SyncedRepository:
-        return SyncedRepository(
-            new_owner=repo.owner.login,
-            orig_owner=source_repo.owner,
-            name=repo.name,
-            clone_url=repo.clone_url,
-            platform=Platform.GITHUB,
-            mirrored=False,
+
+class GithubBackend(Backend):
+    default_instance: str | None = GITHUB_INSTANCE
+
+    @override
+    def make_syncer(
+        self: Self,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: PushMirrorer,
+        push_mirror_config: PushMirrorConfig,
+        httpx_client: Client,
+        transport: Transport,
+    ) -> Syncer:
+        return GithubSyncer(
+            instance=instance,
+            token=token,
+            features=features,
+            logger=logger,
+            push_mirrorer=push_mirrorer,
+            push_mirror_config=push_mirror_config,
+            transport=transport,
+        )
+
+    @override
+    def make_applier(
+        self: Self,
+        instance: str,
+        token: str,
+        logger: Logger,
+        push_mirrorer: PushMirrorer,
+        httpx_client: Client,
+        transport: Transport,
+    ) -> Applier:
+        return GithubApplier(
+            instance=instance,
+            token=token,
+            logger=logger,
+            push_mirrorer=push_mirrorer,
+            transport=transport,
+        )
+
+    @override
+    async def make_async_syncer(
+        self: Self,
+        instance: str,
+        token: str,
+        features: list[RepositoryFeature],
+        logger: Logger,
+        push_mirrorer: AsyncPushMirrorer,
+        push_mirror_config: PushMirrorConfig,
+        httpx_client: AsyncClient,
+        retrier: Retrier,
+    ) -> AsyncSyncer:
+        return await AsyncGithubSyncer.connect(
+            instance=instance,
+            token=token,
+            features=features,
+            logger=logger,
+            push_mirrorer=push_mirrorer,
+            push_mirror_config=push_mirror_config,
+            httpx_client=httpx_client,
+            retrier=retrier,
         )
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+from pathlib import Path
+from tomllib import load
+from typing import Any
+
+DEFAULT_TOKEN_ENV = {
+    "source-token-env": "SOURCE_TOKEN",
+    "target-token-env": "TARGET_TOKEN",
+    "mirror-token-env": "MIRROR_TOKEN",
+}
+
+
+@dataclass
+class JobConfig:
+    """
+    One job from a jobs file: the command line it stands for, and the
+    environment variables holding its tokens.
+    """
+
+    name: str
+    argv: list[str]
+    source_token_env: str
+    target_token_env: str
+    mirror_token_env: str
+
+
+def make_option_argv(key: str, value: Any) -> list[str]:
+    option = f"--{key}"
+
+    match value:
+        case bool():
+            return [option] if value else []
+        case list():
+            return [arg for item in value for arg in (option, str(item))]
+        case dict():
+            raise ValueError(f"Option {key} can't be a table")
+        case _:
+            return [option, str(value)]
+
+
+def make_job(name: str, settings: dict[str, Any]) -> JobConfig:
+    settings = {key.replace("_", "-"): value for key, value in settings.items()}
+
+    try:
+        source = settings.pop("source")
+        target = settings.pop("target")
+    except KeyError as e:
+        raise ValueError(f"Job {name} is missing {e}")
+
+    token_env = {
+        key: str(settings.pop(key, default))
+        for key, default in DEFAULT_TOKEN_ENV.items()
+    }
+
+    targets = target if isinstance(target, list) else [target]
+
+    argv: list[str] = []
+    for key, value in settings.items():
+        argv.extend(make_option_argv(key, value))
+
+    return JobConfig(
+        name=name,
+        argv=[*argv, "--", str(source), *map(str, targets)],
+        source_token_env=token_env["source-token-env"],
+        target_token_env=token_env["target-token-env"],
+        mirror_token_env=token_env["mirror-token-env"],
+    )
+
+
+def load_jobs(path: Path) -> list[JobConfig]:
+    """
+    Reads a TOML file with a `jobs` table of jobs, keyed by name. Each job
+    takes the same options as the command line, and the `defaults` table
+    applies to all of them.
+    """
+
+    with path.open("rb") as file:
+        config = load(file)
+
+    defaults = config.get("defaults", {})
+    jobs = config.get("jobs", {})
+
+    if not isinstance(defaults, dict) or not isinstance(jobs, dict):
+        raise TypeError("defaults and jobs must be tables")
+    if not jobs:
+        raise ValueError(f"No jobs defined in {path}")
+
+    configs: list[JobConfig] = []
+    for name, settings in jobs.items():
+        if not isinstance(settings, dict):
+            raise TypeError(f"Job {name} must be a table")
+
+        configs.append(make_job(name, {**defaults, **settings}))
+
+    return configs
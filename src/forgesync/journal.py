@@ -0,0 +1,295 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from enum import StrEnum
+from hashlib import sha256
+from json import dumps, loads
+from logging import Logger
+from os import O_RDONLY, close, fsync
+from os import open as open_fd
+from pathlib import Path
+from threading import Event, Lock, Thread
+from time import time
+from typing import Any, Self, TextIO
+from uuid import uuid4
+
+from .sync import SyncedRepository
+
+# Entries are written and synced to disk in batches, once per interval or
+# as soon as this many are waiting.
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE = 256
+
+
+class Stage(StrEnum):
+    SYNCED = "synced"
+    MIRRORED = "mirrored"
+    TRIGGERED = "triggered"
+    PURGED = "purged"
+    DONE = "done"
+
+
+def get_journal_path(state_dir: Path, run_key: str) -> Path:
+    # Every job that shares a state directory gets its own journal.
+    return state_dir / f"journal-{sha256(run_key.encode()).hexdigest()[:16]}.jsonl"
+
+
+def sync_directory(path: Path) -> None:
+    # A new file only survives a crash once its directory entry is on disk.
+    fd = open_fd(path, O_RDONLY)
+    try:
+        fsync(fd)
+    finally:
+        close(fd)
+
+
+@dataclass
+class Progress:
+    """
+    The stages one repository has completed for one destination in the
+    current run generation. Without a journal, progress is only kept in
+    memory.
+    """
+
+    key: str
+    fingerprint: str
+    journal: "Journal | None" = None
+    synced_repo: SyncedRepository | None = None
+    mirrored: bool = False
+    # Whether a push mirror was created whose initial sync hasn't been
+    # triggered yet.
+    trigger: bool = False
+    # Whether the push mirrors to all destinations were purged.
+    purged: bool = False
+    done: bool = False
+
+    def apply(self: Self, stage: Stage, data: dict[str, Any]) -> None:
+        match stage:
+            case Stage.SYNCED:
+                self.synced_repo = SyncedRepository(**data["repository"])
+            case Stage.MIRRORED:
+                self.mirrored = True
+                self.trigger = data["trigger"]
+            case Stage.TRIGGERED:
+                self.trigger = False
+            case Stage.PURGED:
+                # The push mirrors set up for this destination are gone.
+                self.mirrored = False
+                self.trigger = False
+                self.purged = True
+                self.done = False
+            case Stage.DONE:
+                self.done = True
+
+    def record(self: Self, stage: Stage, **data: Any) -> None:
+        self.apply(stage, data)
+
+        if self.journal is not None:
+            self.journal.append(
+                {
+                    "key": self.key,
+                    "fingerprint": self.fingerprint,
+                    "stage": stage,
+                    **data,
+                }
+            )
+
+    def record_synced(self: Self, synced_repo: SyncedRepository) -> None:
+        self.record(Stage.SYNCED, repository=asdict(synced_repo))
+
+    def record_mirrored(self: Self, trigger: bool) -> None:
+        self.record(Stage.MIRRORED, trigger=trigger)
+
+    def record_triggered(self: Self) -> None:
+        self.record(Stage.TRIGGERED)
+
+    def record_purged(self: Self) -> None:
+        self.record(Stage.PURGED)
+
+    def record_done(self: Self) -> None:
+        self.record(Stage.DONE)
+
+
+class Journal:
+    """
+    An append-only log of the stages every task has completed, so that a run
+    that was killed can skip what it already did when it is started again.
+    The journal belongs to one run generation, which ends, and the journal
+    with it, once a run gets through all repositories without being stopped.
+    """
+
+    path: Path
+    file: TextIO
+    generation: str
+    progress_by_key: dict[str, Progress]
+    pending: list[str]
+    lock: Lock
+    flush_lock: Lock
+    stopped: Event
+    flusher: Thread
+
+    def __init__(
+        self: Self,
+        path: Path,
+        file: TextIO,
+        generation: str,
+        progress_by_key: dict[str, Progress],
+    ) -> None:
+        self.path = path
+        self.file = file
+        self.generation = generation
+        self.progress_by_key = progress_by_key
+        self.pending = []
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.stopped = Event()
+
+        for progress in progress_by_key.values():
+            progress.journal = self
+
+        # Flushing on a timer rather than on the next append means that at
+        # most one interval of progress is lost when the process is stopped.
+        self.flusher = Thread(
+            target=self.flush_periodically, name="forgesync-journal", daemon=True
+        )
+        self.flusher.start()
+
+    @classmethod
+    def open(cls, state_dir: Path, run_key: str, logger: Logger) -> Self:
+        state_dir.mkdir(parents=True, exist_ok=True)
+        path = get_journal_path(state_dir, run_key)
+
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            data = b""
+
+        # A crash can leave a partly written entry behind, which is cut off
+        # so that new entries start on a line of their own.
+        complete = data[: data.rfind(b"\n") + 1]
+        lines = complete.decode(errors="replace").splitlines()
+
+        header: dict[str, Any] | None = None
+        if lines:
+            try:
+                header = loads(lines[0])
+            except ValueError:
+                header = None
+
+        if header is None or header.get("run") != run_key:
+            return cls.start(path, run_key)
+
+        progress_by_key: dict[str, Progress] = {}
+        for line in lines[1:]:
+            try:
+                entry = loads(line)
+                key, fingerprint, stage = (
+                    entry.pop("key"),
+                    entry.pop("fingerprint"),
+                    Stage(entry.pop("stage")),
+                )
+            except (ValueError, KeyError, AttributeError):
+                logger.warning("Ignoring malformed journal entry: %s", line)
+                continue
+
+            progress = progress_by_key.get(key)
+            if progress is None or progress.fingerprint != fingerprint:
+                progress = progress_by_key[key] = Progress(
+                    key=key, fingerprint=fingerprint
+                )
+            progress.apply(stage, entry)
+
+        file = path.open("a")
+        if len(complete) < len(data):
+            _ = file.truncate(len(complete))
+
+        journal = cls(
+            path=path,
+            file=file,
+            generation=header["generation"],
+            progress_by_key=progress_by_key,
+        )
+        logger.info(
+            "Resuming run %s from %s, %d repository destinations already done",
+            journal.generation,
+            datetime.fromtimestamp(header["started_at"]).isoformat(
+                sep=" ", timespec="seconds"
+            ),
+            sum(progress.done for progress in progress_by_key.values()),
+        )
+        return journal
+
+    @classmethod
+    def start(cls, path: Path, run_key: str) -> Self:
+        generation = uuid4().hex[:12]
+
+        file = path.open("w")
+        _ = file.write(
+            dumps({"generation": generation, "run": run_key, "started_at": time()})
+            + "\n"
+        )
+        file.flush()
+        fsync(file.fileno())
+        sync_directory(path.parent)
+
+        return cls(path=path, file=file, generation=generation, progress_by_key={})
+
+    def progress(self: Self, key: str, fingerprint: str) -> Progress:
+        with self.lock:
+            progress = self.progress_by_key.get(key)
+
+            # Stages completed for another fingerprint synchronized a repository
+            # that has changed since, so they don't count.
+            if progress is None or progress.fingerprint != fingerprint:
+                progress = self.progress_by_key[key] = Progress(
+                    key=key, fingerprint=fingerprint, journal=self
+                )
+
+            return progress
+
+    def append(self: Self, entry: dict[str, Any]) -> None:
+        with self.lock:
+            self.pending.append(dumps(entry) + "\n")
+            due = len(self.pending) >= FLUSH_SIZE
+
+        if due:
+            self.flush()
+
+    def flush_periodically(self: Self) -> None:
+        while not self.stopped.wait(FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self: Self) -> None:
+        # Entries appended while a batch is being synced wait for the next
+        # batch instead of for the disk.
+        with self.flush_lock:
+            with self.lock:
+                lines, self.pending = self.pending, []
+
+            if not lines:
+                return
+
+            _ = self.file.write("".join(lines))
+            self.file.flush()
+            fsync(self.file.fileno())
+
+    def close(self: Self, finished: bool) -> None:
+        """
+        Writes the remaining entries, and removes the journal if the run
+        generation is finished.
+        """
+
+        self.stopped.set()
+        self.flusher.join()
+
+        self.flush()
+        self.file.close()
+
+        if finished:
+            self.path.unlink(missing_ok=True)
+
+
+def get_progress(journal: Journal | None, key: str, fingerprint: str) -> Progress:
+    if journal is None:
+        return Progress(key=key, fingerprint=fingerprint)
+
+    return journal.progress(key, fingerprint)
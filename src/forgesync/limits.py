@@ -0,0 +1,20 @@
+from asyncio import Semaphore
+from dataclasses import dataclass
+from threading import BoundedSemaphore
+
+
+def check_limits(source: int, target: int) -> None:
+    if source < 1 or target < 1:
+        raise ValueError("Concurrency limits must be at least 1")
+
+
+@dataclass
+class HostLimits:
+    source: BoundedSemaphore
+    target: BoundedSemaphore
+
+
+@dataclass
+class AsyncHostLimits:
+    source: Semaphore
+    target: Semaphore
@@ -0,0 +1,55 @@
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from logging import Handler, Logger, LogRecord
+from typing import Self, override
+
+
+class GroupingHandler(Handler):
+    """
+    Buffers records emitted inside `group()` and hands them to the target
+    handler in one go, so concurrent tasks don't interleave their logs.
+
+    The buffer lives in a context variable, which keeps it separate per thread
+    as well as per asyncio task.
+    """
+
+    target: Handler
+    buffer: ContextVar[list[LogRecord] | None]
+
+    def __init__(self: Self, target: Handler) -> None:
+        super().__init__()
+        self.target = target
+        self.buffer = ContextVar(f"buffer-{id(self)}", default=None)
+
+    @override
+    def emit(self: Self, record: LogRecord) -> None:
+        buffer = self.buffer.get()
+        if buffer is None:
+            self.target.handle(record)
+        else:
+            buffer.append(record)
+
+    @contextmanager
+    def group(self: Self) -> Iterator[None]:
+        records: list[LogRecord] = []
+        token = self.buffer.set(records)
+        try:
+            yield
+        finally:
+            self.buffer.reset(token)
+            self.acquire()
+            try:
+                for record in records:
+                    self.target.handle(record)
+            finally:
+                self.release()
+
+
+@contextmanager
+def log_group(logger: Logger) -> Iterator[None]:
+    with ExitStack() as stack:
+        for handler in logger.handlers:
+            if isinstance(handler, GroupingHandler):
+                stack.enter_context(handler.group())
+        yield
@@ -0,0 +1,220 @@
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from json import dumps
+from os import replace
+from pathlib import Path
+from re import sub
+from threading import Lock
+from typing import Any, Self
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+API_PREFIXES = ("/api/v1", "/api/v3")
+
+# Names in paths are collapsed, so calls are grouped by endpoint rather than
+# by repository.
+ENDPOINT_SUBSTITUTIONS = (
+    (r"^/repos/[^/]+/[^/]+", "/repos/{owner}/{repo}"),
+    (r"^/users/[^/]+", "/users/{username}"),
+    (r"/push_mirrors/[^/]+$", "/push_mirrors/{name}"),
+    (r"/contents/.*$", "/contents/{path}"),
+)
+
+
+def get_endpoint(method: str, path: str) -> str:
+    for prefix in API_PREFIXES:
+        path = path.removeprefix(prefix)
+
+    for pattern, replacement in ENDPOINT_SUBSTITUTIONS:
+        path = sub(pattern, replacement, path)
+
+    return f"{method} {path or '/'}"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Mapping[str, str]) -> str:
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items())
+
+
+@dataclass
+class EndpointMetrics:
+    calls: int = 0
+    retries: int = 0
+    response_bytes: int = 0
+    duration: float = 0.0
+    statuses: Counter[str] = field(default_factory=Counter)
+    buckets: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+
+    def observe(self: Self, status: str, seconds: float, retry: bool) -> None:
+        self.calls += 1
+        self.retries += retry
+        self.duration += seconds
+        self.statuses[status] += 1
+
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+
+    def cumulative_buckets(self: Self) -> list[int]:
+        counts: list[int] = []
+        total = 0
+        for count in self.buckets:
+            total += count
+            counts.append(total)
+
+        return counts
+
+    def to_json(self: Self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "response_bytes": self.response_bytes,
+            "duration_seconds": round(self.duration, 6),
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+class Metrics:
+    """
+    Counts, latencies, status codes, retries and response sizes of every
+    HTTP request, per host and endpoint.
+    """
+
+    endpoints: dict[tuple[str, str], EndpointMetrics]
+    lock: Lock
+
+    def __init__(self: Self) -> None:
+        self.endpoints = {}
+        self.lock = Lock()
+
+    def observe(
+        self: Self,
+        host: str,
+        endpoint: str,
+        status: str,
+        seconds: float,
+        retry: bool = False,
+    ) -> EndpointMetrics:
+        key = (host, endpoint)
+
+        with self.lock:
+            counters = self.endpoints.get(key)
+            if counters is None:
+                counters = self.endpoints[key] = EndpointMetrics()
+
+            counters.observe(status=status, seconds=seconds, retry=retry)
+
+        return counters
+
+    def count_bytes(self: Self, endpoint: EndpointMetrics, size: int) -> None:
+        with self.lock:
+            endpoint.response_bytes += size
+
+    def sorted_endpoints(self: Self) -> list[tuple[tuple[str, str], EndpointMetrics]]:
+        with self.lock:
+            return sorted(self.endpoints.items())
+
+
+def format_prometheus(
+    metrics: Metrics, outcomes: Mapping[str, Mapping[str, int]], duration: float
+) -> str:
+    """
+    Renders the metrics in the Prometheus text format read by the
+    node_exporter textfile collector. Outcome counts are keyed by job name,
+    which is left out for the single unnamed job of a plain run.
+    """
+
+    lines: list[str] = [
+        "# HELP forgesync_http_requests_total HTTP requests by endpoint and status.",
+        "# TYPE forgesync_http_requests_total counter",
+    ]
+    endpoints = metrics.sorted_endpoints()
+
+    for (host, endpoint), values in endpoints:
+        for status, count in sorted(values.statuses.items()):
+            labels = format_labels(
+                {"host": host, "endpoint": endpoint, "status": status}
+            )
+            lines.append(f"forgesync_http_requests_total{{{labels}}} {count}")
+
+    lines += [
+        "# HELP forgesync_http_request_duration_seconds Time until the response headers arrived.",
+        "# TYPE forgesync_http_request_duration_seconds histogram",
+    ]
+    for (host, endpoint), values in endpoints:
+        labels = {"host": host, "endpoint": endpoint}
+        for bound, count in zip(LATENCY_BUCKETS, values.cumulative_buckets()):
+            bucket = format_labels({**labels, "le": str(bound)})
+            lines.append(
+                f"forgesync_http_request_duration_seconds_bucket{{{bucket}}} {count}"
+            )
+
+        bucket = format_labels({**labels, "le": "+Inf"})
+        lines += [
+            f"forgesync_http_request_duration_seconds_bucket{{{bucket}}} {values.calls}",
+            f"forgesync_http_request_duration_seconds_sum{{{format_labels(labels)}}} {values.duration}",
+            f"forgesync_http_request_duration_seconds_count{{{format_labels(labels)}}} {values.calls}",
+        ]
+
+    for name, description, attribute in (
+        ("retries", "HTTP requests resent after a rate limit or failure.", "retries"),
+        ("response_bytes", "Bytes of HTTP response bodies.", "response_bytes"),
+    ):
+        lines += [
+            f"# HELP forgesync_http_{name}_total {description}",
+            f"# TYPE forgesync_http_{name}_total counter",
+        ]
+        for (host, endpoint), values in endpoints:
+            labels = format_labels({"host": host, "endpoint": endpoint})
+            lines.append(
+                f"forgesync_http_{name}_total{{{labels}}} {getattr(values, attribute)}"
+            )
+
+    lines += [
+        "# HELP forgesync_repositories Repositories by outcome of the last run.",
+        "# TYPE forgesync_repositories gauge",
+    ]
+    for job, counts in outcomes.items():
+        for outcome, count in counts.items():
+            labels = {"job": job} if job else {}
+            labels["outcome"] = outcome
+            lines.append(f"forgesync_repositories{{{format_labels(labels)}}} {count}")
+
+    lines += [
+        "# HELP forgesync_run_duration_seconds Duration of the last run.",
+        "# TYPE forgesync_run_duration_seconds gauge",
+        f"forgesync_run_duration_seconds {duration}",
+    ]
+
+    return "\n".join(lines) + "\n"
+
+
+def format_summary(
+    metrics: Metrics, outcomes: Mapping[str, Mapping[str, int]], duration: float
+) -> str:
+    endpoints: dict[str, dict[str, Any]] = {}
+    for (host, endpoint), values in metrics.sorted_endpoints():
+        endpoints.setdefault(host, {})[endpoint] = values.to_json()
+
+    return dumps(
+        {
+            "duration_seconds": round(duration, 3),
+            "outcomes": outcomes,
+            "hosts": endpoints,
+        },
+        indent=2,
+    )
+
+
+def write_atomically(path: Path, text: str) -> None:
+    # Readers like node_exporter may look at the file at any time, so it is
+    # replaced in one step rather than rewritten in place.
+    temporary = path.with_name(f".{path.name}.tmp")
+    _ = temporary.write_text(text)
+    replace(temporary, path)
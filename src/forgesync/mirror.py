@@ -1,11 +1,17 @@
+from asyncio import Lock as AsyncLock, Semaphore
+from collections.abc import Iterable
 from dataclasses import dataclass
 from logging import Logger
-from typing import Self
+from threading import BoundedSemaphore, Lock
+from typing import Any, Self
 from enum import StrEnum
-from pyforgejo import PushMirror, PyforgejoApi
+from pyforgejo import AsyncPyforgejoApi, PushMirror, PyforgejoApi
 
+from .plan import MirrorChanges
+from .retry import Retrier
+from .source import SourceRepository
 from .sync import SyncedRepository
-from .forgejo import depaginate
+from .forgejo import NO_RETRIES, AsyncPaginator, Paginator
 
 
 class MirrorError(RuntimeError):
@@ -26,123 +32,502 @@ class PushMirrorConfig:
     on_commit: bool
 
 
+class PushMirrorIndex:
+    """
+    The push mirrors of one source repository, keyed by remote address.
+
+    Listed once per run and kept up to date as mirrors are added or deleted.
+    """
+
+    mirrors: dict[str, list[PushMirror]]
+
+    def __init__(self: Self, push_mirrors: Iterable[PushMirror]) -> None:
+        self.mirrors = {}
+        for push_mirror in push_mirrors:
+            self.add(push_mirror)
+
+    def all(self: Self) -> list[PushMirror]:
+        return [
+            push_mirror
+            for push_mirrors in self.mirrors.values()
+            for push_mirror in push_mirrors
+        ]
+
+    def matching(self: Self, remote_address: str) -> list[PushMirror]:
+        return list(self.mirrors.get(remote_address, []))
+
+    def add(self: Self, push_mirror: PushMirror) -> None:
+        self.mirrors.setdefault(push_mirror.remote_address or "", []).append(
+            push_mirror
+        )
+
+    def remove(self: Self, push_mirror: PushMirror) -> None:
+        key = push_mirror.remote_address or ""
+        remaining = [
+            other
+            for other in self.mirrors.get(key, [])
+            if other.remote_name != push_mirror.remote_name
+        ]
+
+        if remaining:
+            self.mirrors[key] = remaining
+        else:
+            _ = self.mirrors.pop(key, None)
+
+
+def select_mirrors(
+    remirror: Remirror,
+    index: PushMirrorIndex,
+    clone_url: str,
+) -> tuple[list[PushMirror], bool]:
+    matching_mirrors = index.matching(clone_url)
+
+    match remirror:
+        case Remirror.PURGE:
+            return index.all(), True
+        case Remirror.YES:
+            return matching_mirrors, True
+        case Remirror.NO:
+            return [], not matching_mirrors
+
+
+def plan_mirrors(
+    remirror: Remirror,
+    index: PushMirrorIndex,
+    clone_url: str | None,
+    config: PushMirrorConfig,
+) -> MirrorChanges:
+    # A destination repository that doesn't exist yet has no clone URL, and
+    # nothing can be mirroring to it.
+    if clone_url is None:
+        push_mirrors_to_delete = index.all() if remirror == Remirror.PURGE else []
+        make_mirror = True
+    else:
+        push_mirrors_to_delete, make_mirror = select_mirrors(
+            remirror=remirror, index=index, clone_url=clone_url
+        )
+
+    return MirrorChanges(
+        delete=[get_remote_name(push_mirror) for push_mirror in push_mirrors_to_delete],
+        add=make_mirror,
+        interval=config.interval,
+        on_commit=config.on_commit,
+        sync=make_mirror and config.immediate,
+    )
+
+
+def make_add_options(
+    synced_repo: SyncedRepository, config: PushMirrorConfig, mirror_token: str
+) -> dict[str, Any]:
+    return {
+        "owner": synced_repo.orig_owner,
+        "repo": synced_repo.name,
+        "interval": config.interval,
+        "remote_address": synced_repo.clone_url,
+        "remote_username": synced_repo.new_owner,
+        "remote_password": mirror_token,
+        "sync_on_commit": config.on_commit,
+        "use_ssh": False,
+    }
+
+
+def find_push_mirror(
+    push_mirrors: Iterable[PushMirror], remote_address: str
+) -> PushMirror | None:
+    for push_mirror in push_mirrors:
+        if push_mirror.remote_address == remote_address:
+            return push_mirror
+
+    return None
+
+
+def get_remote_name(push_mirror: PushMirror) -> str:
+    if push_mirror.remote_name is None:
+        raise MirrorError("Missing remote name")
+
+    return push_mirror.remote_name
+
+
+class PushMirrorIndexes:
+    """
+    The push mirror indexes of one source instance. Every push mirrorer for
+    that instance can share them, so each repository is listed only once,
+    even when several destinations set up their mirrors at the same time.
+    """
+
+    client: PyforgejoApi
+    paginator: Paginator
+    indexes: dict[str, PushMirrorIndex]
+    locks: dict[str, Lock]
+    lock: Lock
+
+    def __init__(self: Self, client: PyforgejoApi, paginator: Paginator) -> None:
+        self.client = client
+        self.paginator = paginator
+        self.indexes = {}
+        self.locks = {}
+        self.lock = Lock()
+
+    def get(self: Self, owner: str, repo: str) -> PushMirrorIndex:
+        key = f"{owner}/{repo}"
+
+        with self.lock:
+            repo_lock = self.locks.setdefault(key, Lock())
+
+        with repo_lock:
+            if key not in self.indexes:
+                self.indexes[key] = PushMirrorIndex(
+                    self.paginator.depaginate(
+                        self.client.repository.with_raw_response.repo_list_push_mirrors,
+                        owner=owner,
+                        repo=repo,
+                    )
+                )
+
+            return self.indexes[key]
+
+
+class AsyncPushMirrorIndexes:
+    client: AsyncPyforgejoApi
+    paginator: AsyncPaginator
+    indexes: dict[str, PushMirrorIndex]
+    locks: dict[str, AsyncLock]
+
+    def __init__(
+        self: Self, client: AsyncPyforgejoApi, paginator: AsyncPaginator
+    ) -> None:
+        self.client = client
+        self.paginator = paginator
+        self.indexes = {}
+        self.locks = {}
+
+    async def get(self: Self, owner: str, repo: str) -> PushMirrorIndex:
+        key = f"{owner}/{repo}"
+
+        async with self.locks.setdefault(key, AsyncLock()):
+            if key not in self.indexes:
+                self.indexes[key] = PushMirrorIndex(
+                    [
+                        push_mirror
+                        async for push_mirror in self.paginator.depaginate(
+                            self.client.repository.with_raw_response.repo_list_push_mirrors,
+                            owner=owner,
+                            repo=repo,
+                        )
+                    ]
+                )
+
+            return self.indexes[key]
+
+
 class PushMirrorer:
     client: PyforgejoApi
+    indexes: PushMirrorIndexes
     mirror_token: str
     logger: Logger
+    limit: BoundedSemaphore
+    retrier: Retrier
 
     def __init__(
         self: Self,
         client: PyforgejoApi,
+        indexes: PushMirrorIndexes,
         mirror_token: str,
         logger: Logger,
+        limit: BoundedSemaphore,
+        retrier: Retrier,
     ) -> None:
         self.client = client
+        self.indexes = indexes
         self.mirror_token = mirror_token
         self.logger = logger
+        self.limit = limit
+        self.retrier = retrier
+
+    def add_mirror(
+        self: Self, synced_repo: SyncedRepository, config: PushMirrorConfig
+    ) -> PushMirror:
+        # Adding a push mirror twice would mirror twice, so after a failure
+        # the mirrors are listed to see whether it was added after all.
+        return self.retrier.call_checked(
+            lambda: self.client.repository.repo_add_push_mirror(
+                **make_add_options(
+                    synced_repo=synced_repo,
+                    config=config,
+                    mirror_token=self.mirror_token,
+                ),
+                request_options=NO_RETRIES,
+            ),
+            lambda: find_push_mirror(
+                self.indexes.paginator.depaginate(
+                    self.client.repository.with_raw_response.repo_list_push_mirrors,
+                    owner=synced_repo.orig_owner,
+                    repo=synced_repo.name,
+                ),
+                synced_repo.clone_url,
+            ),
+        )
+
+    def purge_repo(self: Self, source_repo: SourceRepository) -> None:
+        with self.limit:
+            index = self.indexes.get(source_repo.owner, source_repo.name)
+
+            for push_mirror in index.all():
+                self.client.repository.repo_delete_push_mirror(
+                    owner=source_repo.owner,
+                    repo=source_repo.name,
+                    name=get_remote_name(push_mirror),
+                    request_options=NO_RETRIES,
+                )
+                index.remove(push_mirror)
+
+                self.logger.info(
+                    "Removed old push mirror to %s", push_mirror.remote_address
+                )
 
     def mirror_repo(
         self: Self,
         synced_repo: SyncedRepository,
         config: PushMirrorConfig,
     ) -> PushMirror | None:
-        self.logger.info(
-            "Setting up mirroring for %s to %s at %s",
-            f"{synced_repo.orig_owner}/{synced_repo.name}",
-            f"{synced_repo.new_owner}/{synced_repo.name}",
-            synced_repo.clone_url,
-        )
+        with self.limit:
+            self.logger.info(
+                "Setting up mirroring for %s to %s at %s",
+                f"{synced_repo.orig_owner}/{synced_repo.name}",
+                f"{synced_repo.new_owner}/{synced_repo.name}",
+                synced_repo.clone_url,
+            )
 
-        new_push_mirror: PushMirror | None = None
+            new_push_mirror: PushMirror | None = None
 
-        push_mirrors_to_delete: list[PushMirror] = []
+            index = self.indexes.get(synced_repo.orig_owner, synced_repo.name)
 
-        make_mirror = False
+            push_mirrors_to_delete, make_mirror = select_mirrors(
+                remirror=config.remirror,
+                index=index,
+                clone_url=synced_repo.clone_url,
+            )
 
-        match config.remirror:
-            case Remirror.PURGE:
-                push_mirrors_to_delete = list(
-                    depaginate(
-                        self.client.repository.repo_list_push_mirrors,
-                        owner=synced_repo.orig_owner,
-                        repo=synced_repo.name,
-                    )
-                )
-                make_mirror = True
-            case Remirror.YES:
-                push_mirrors_to_delete = self.get_matching_mirrors(
-                    synced_repo=synced_repo
+            for push_mirror in push_mirrors_to_delete:
+                self.client.repository.repo_delete_push_mirror(
+                    owner=synced_repo.orig_owner,
+                    repo=synced_repo.name,
+                    name=get_remote_name(push_mirror),
+                    request_options=NO_RETRIES,
                 )
-                make_mirror = True
-            case Remirror.NO:
-                matching_mirrors = self.get_matching_mirrors(synced_repo=synced_repo)
-                if not matching_mirrors:
-                    make_mirror = True
+                index.remove(push_mirror)
 
-        for push_mirror in push_mirrors_to_delete:
-            if push_mirror.remote_name is None:
-                raise MirrorError("Missing remote name")
+                if push_mirror.remote_address is not None:
+                    self.logger.info(
+                        "Removed old push mirror to %s", push_mirror.remote_address
+                    )
 
-            self.client.repository.repo_delete_push_mirror(
-                owner=synced_repo.orig_owner,
-                repo=synced_repo.name,
-                name=push_mirror.remote_name,
-            )
+            if make_mirror:
+                new_push_mirror = self.add_mirror(synced_repo, config)
+                index.add(new_push_mirror)
 
-            if push_mirror.remote_address is not None:
-                self.logger.info(
-                    "Removed old push mirror to %s", push_mirror.remote_address
-                )
-
-        if make_mirror:
-            new_push_mirror = self.add_push_mirror(
-                synced_repo=synced_repo,
-                config=config,
-            )
+                self.logger.info("Created push mirror")
 
         if new_push_mirror is not None and config.immediate:
+            self.trigger_sync(synced_repo)
+
+        self.logger.info("Finished mirror setup for %s", synced_repo.name)
+
+        return new_push_mirror
+
+    def trigger_sync(self: Self, synced_repo: SyncedRepository) -> None:
+        with self.limit:
             self.client.repository.repo_push_mirror_sync(
                 owner=synced_repo.orig_owner,
                 repo=synced_repo.name,
+                request_options=NO_RETRIES,
             )
-            self.logger.info("Triggered push mirror")
 
-        self.logger.info("Finished mirror setup for %s", synced_repo.name)
+        self.logger.info("Triggered push mirror")
 
-        return new_push_mirror
+    def plan_purge(self: Self, source_repo: SourceRepository) -> list[str]:
+        with self.limit:
+            index = self.indexes.get(source_repo.owner, source_repo.name)
+
+        return [get_remote_name(push_mirror) for push_mirror in index.all()]
 
-    def get_matching_mirrors(
+    def plan_repo(
         self: Self,
-        synced_repo: SyncedRepository,
-    ) -> list[PushMirror]:
-        repo_mirrors: list[PushMirror] = []
+        source_repo: SourceRepository,
+        clone_url: str | None,
+        config: PushMirrorConfig,
+    ) -> MirrorChanges:
+        with self.limit:
+            index = self.indexes.get(source_repo.owner, source_repo.name)
 
-        push_mirrors = depaginate(
-            self.client.repository.repo_list_push_mirrors,
+        return plan_mirrors(
+            remirror=config.remirror, index=index, clone_url=clone_url, config=config
+        )
+
+    def apply_purge(self: Self, owner: str, repo: str, remote_names: list[str]) -> None:
+        with self.limit:
+            for remote_name in remote_names:
+                self.client.repository.repo_delete_push_mirror(
+                    owner=owner, repo=repo, name=remote_name, request_options=NO_RETRIES
+                )
+                self.logger.info("Removed old push mirror %s", remote_name)
+
+    def apply_repo(
+        self: Self, synced_repo: SyncedRepository, changes: MirrorChanges
+    ) -> PushMirror | None:
+        self.apply_purge(
             owner=synced_repo.orig_owner,
             repo=synced_repo.name,
+            remote_names=changes.delete,
         )
 
-        for push_mirror in push_mirrors:
-            if push_mirror.remote_address == synced_repo.clone_url:
-                repo_mirrors.append(push_mirror)
+        if not changes.add:
+            return None
 
-        return repo_mirrors
+        with self.limit:
+            new_push_mirror = self.add_mirror(
+                synced_repo,
+                PushMirrorConfig(
+                    interval=changes.interval,
+                    remirror=Remirror.NO,
+                    immediate=changes.sync,
+                    on_commit=changes.on_commit,
+                ),
+            )
+            self.logger.info(
+                "Created push mirror for %s to %s",
+                f"{synced_repo.orig_owner}/{synced_repo.name}",
+                synced_repo.clone_url,
+            )
 
-    def add_push_mirror(
-        self: Self, synced_repo: SyncedRepository, config: PushMirrorConfig
-    ) -> PushMirror:
-        push_mirror = self.client.repository.repo_add_push_mirror(
-            owner=synced_repo.orig_owner,
-            repo=synced_repo.name,
-            interval=config.interval,
-            remote_address=synced_repo.clone_url,
-            remote_username=synced_repo.new_owner,
-            remote_password=self.mirror_token,
-            sync_on_commit=config.on_commit,
-            use_ssh=False,
+        if changes.sync:
+            self.trigger_sync(synced_repo)
+
+        return new_push_mirror
+
+
+class AsyncPushMirrorer:
+    client: AsyncPyforgejoApi
+    indexes: AsyncPushMirrorIndexes
+    mirror_token: str
+    logger: Logger
+    limit: Semaphore
+    retrier: Retrier
+
+    def __init__(
+        self: Self,
+        client: AsyncPyforgejoApi,
+        indexes: AsyncPushMirrorIndexes,
+        mirror_token: str,
+        logger: Logger,
+        limit: Semaphore,
+        retrier: Retrier,
+    ) -> None:
+        self.client = client
+        self.indexes = indexes
+        self.mirror_token = mirror_token
+        self.logger = logger
+        self.limit = limit
+        self.retrier = retrier
+
+    async def find_mirror(
+        self: Self, synced_repo: SyncedRepository
+    ) -> PushMirror | None:
+        return find_push_mirror(
+            [
+                push_mirror
+                async for push_mirror in self.indexes.paginator.depaginate(
+                    self.client.repository.with_raw_response.repo_list_push_mirrors,
+                    owner=synced_repo.orig_owner,
+                    repo=synced_repo.name,
+                )
+            ],
+            synced_repo.clone_url,
         )
 
-        self.logger.info("Created push mirror")
+    async def purge_repo(self: Self, source_repo: SourceRepository) -> None:
+        async with self.limit:
+            index = await self.indexes.get(source_repo.owner, source_repo.name)
+
+            for push_mirror in index.all():
+                await self.client.repository.repo_delete_push_mirror(
+                    owner=source_repo.owner,
+                    repo=source_repo.name,
+                    name=get_remote_name(push_mirror),
+                    request_options=NO_RETRIES,
+                )
+                index.remove(push_mirror)
+
+                self.logger.info(
+                    "Removed old push mirror to %s", push_mirror.remote_address
+                )
+
+    async def mirror_repo(
+        self: Self,
+        synced_repo: SyncedRepository,
+        config: PushMirrorConfig,
+    ) -> PushMirror | None:
+        async with self.limit:
+            self.logger.info(
+                "Setting up mirroring for %s to %s at %s",
+                f"{synced_repo.orig_owner}/{synced_repo.name}",
+                f"{synced_repo.new_owner}/{synced_repo.name}",
+                synced_repo.clone_url,
+            )
+
+            new_push_mirror: PushMirror | None = None
+
+            index = await self.indexes.get(synced_repo.orig_owner, synced_repo.name)
+
+            push_mirrors_to_delete, make_mirror = select_mirrors(
+                remirror=config.remirror,
+                index=index,
+                clone_url=synced_repo.clone_url,
+            )
+
+            for push_mirror in push_mirrors_to_delete:
+                await self.client.repository.repo_delete_push_mirror(
+                    owner=synced_repo.orig_owner,
+                    repo=synced_repo.name,
+                    name=get_remote_name(push_mirror),
+                    request_options=NO_RETRIES,
+                )
+                index.remove(push_mirror)
+
+                if push_mirror.remote_address is not None:
+                    self.logger.info(
+                        "Removed old push mirror to %s", push_mirror.remote_address
+                    )
+
+            if make_mirror:
+                new_push_mirror = await self.retrier.call_checked_async(
+                    lambda: self.client.repository.repo_add_push_mirror(
+                        **make_add_options(
+                            synced_repo=synced_repo,
+                            config=config,
+                            mirror_token=self.mirror_token,
+                        ),
+                        request_options=NO_RETRIES,
+                    ),
+                    lambda: self.find_mirror(synced_repo),
+                )
+                index.add(new_push_mirror)
+
+                self.logger.info("Created push mirror")
+
+        if new_push_mirror is not None and config.immediate:
+            await self.trigger_sync(synced_repo)
+
+        self.logger.info("Finished mirror setup for %s", synced_repo.name)
+
+        return new_push_mirror
+
+    async def trigger_sync(self: Self, synced_repo: SyncedRepository) -> None:
+        async with self.limit:
+            await self.client.repository.repo_push_mirror_sync(
+                owner=synced_repo.orig_owner,
+                repo=synced_repo.name,
+                request_options=NO_RETRIES,
+            )
 
-        return push_mirror
+        self.logger.info("Triggered push mirror")
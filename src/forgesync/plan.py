@@ -0,0 +1,160 @@
+from dataclasses import asdict, dataclass, field
+from json import dumps, loads
+from pathlib import Path
+from typing import Any, Self, override
+
+PLAN_VERSION = 1
+
+
+class PlanError(RuntimeError):
+    pass
+
+
+@dataclass
+class MirrorChanges:
+    # Remote names of the push mirrors to delete.
+    delete: list[str] = field(default_factory=list)
+    add: bool = False
+    interval: str = ""
+    on_commit: bool = False
+    sync: bool = False
+
+    @property
+    def empty(self: Self) -> bool:
+        return not self.delete and not self.add
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> Self:
+        return cls(**data)
+
+
+@dataclass
+class RepositoryChanges:
+    """
+    The writes that bring one destination repository up to date. For a
+    repository that is created, `edit` holds all desired settings, and only
+    those the new repository doesn't have already are sent.
+    """
+
+    owner: str
+    name: str
+    clone_url: str | None
+    create: dict[str, Any] | None = None
+    edit: dict[str, Any] = field(default_factory=dict)
+    topics: list[str] | None = None
+    mirror: MirrorChanges | None = None
+    # An empty GitHub repository can't be edited until it has been mirrored.
+    mirror_first: bool = False
+
+    @property
+    def empty(self: Self) -> bool:
+        return (
+            self.create is None
+            and not self.edit
+            and self.topics is None
+            and (self.mirror is None or self.mirror.empty)
+        )
+
+    @property
+    def full_name(self: Self) -> str:
+        return f"{self.owner}/{self.name}"
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> Self:
+        mirror = data.get("mirror")
+        return cls(
+            **{
+                **data,
+                "mirror": MirrorChanges.from_json(mirror)
+                if mirror is not None
+                else None,
+            }
+        )
+
+
+@dataclass
+class TargetPlan:
+    destination: str
+    state_key: str
+    fingerprint: str
+    changes: RepositoryChanges
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> Self:
+        return cls(**{**data, "changes": RepositoryChanges.from_json(data["changes"])})
+
+
+@dataclass
+class RepositoryPlan:
+    owner: str
+    name: str
+    # Remote names of all push mirrors, deleted before any destination is set
+    # up again.
+    purge: list[str]
+    targets: list[TargetPlan]
+
+    @property
+    def empty(self: Self) -> bool:
+        return not self.purge and all(target.changes.empty for target in self.targets)
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            **{
+                **data,
+                "targets": [TargetPlan.from_json(target) for target in data["targets"]],
+            }
+        )
+
+    @override
+    def __str__(self: Self) -> str:
+        return f"{self.owner}/{self.name}"
+
+
+@dataclass
+class Plan:
+    source: str
+    destinations: list[str]
+    repositories: list[RepositoryPlan]
+    version: int = PLAN_VERSION
+
+    def save(self: Self, path: Path) -> None:
+        _ = path.write_text(dumps(asdict(self), indent=2) + "\n")
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        try:
+            data = loads(path.read_text())
+        except (OSError, ValueError) as e:
+            raise PlanError(f"Could not read plan {path}: {e}")
+
+        if data.get("version") != PLAN_VERSION:
+            raise PlanError(f"Unsupported plan version: {data.get('version')}")
+
+        try:
+            return cls(
+                source=data["source"],
+                destinations=data["destinations"],
+                repositories=[
+                    RepositoryPlan.from_json(repository)
+                    for repository in data["repositories"]
+                ],
+            )
+        except (KeyError, TypeError) as e:
+            raise PlanError(f"Malformed plan {path}: {e}")
+
+    def count_writes(self: Self) -> int:
+        writes = 0
+
+        for repository in self.repositories:
+            writes += len(repository.purge)
+            for target in repository.targets:
+                changes = target.changes
+                writes += changes.create is not None
+                writes += bool(changes.edit)
+                writes += changes.topics is not None
+                if changes.mirror is not None:
+                    writes += len(changes.mirror.delete)
+                    writes += changes.mirror.add + changes.mirror.sync
+
+        return writes
@@ -1,9 +1,13 @@
-from github.GithubObject import Consts
 from enum import StrEnum
 
-GITHUB_INSTANCE = Consts.DEFAULT_BASE_URL
+# PyGithub's default base URL, kept here so that naming GitHub as a
+# destination doesn't import PyGithub.
+GITHUB_INSTANCE = "https://api.github.com"
 CODEBERG_INSTANCE = "https://codeberg.org/api/v1"
 
+# GitHub's secondary limit for content-creating requests.
+GITHUB_WRITES_PER_MINUTE = 80
+
 
 class Platform(StrEnum):
     FORGEJO = "forgejo"
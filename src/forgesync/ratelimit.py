@@ -0,0 +1,227 @@
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from logging import Logger
+from threading import Lock
+from time import time
+from typing import Self, override
+
+# How GitHub words the 403 of its secondary rate limits, which often has no
+# Retry-After header and leaves the primary budget untouched.
+SECONDARY_LIMIT_MESSAGE = "secondary rate limit"
+
+# Once less than this share of the budget is left, requests are spread out
+# evenly until the budget resets.
+LOW_BUDGET = 0.1
+
+DEFAULT_PAUSE = 60.0
+MAX_PAUSES = 5
+
+
+def creates_content(method: str, path: str) -> bool:
+    # GraphQL queries are POSTs as well, but they only read.
+    return method.upper() == "POST" and not path.endswith("/graphql")
+
+
+def is_secondary_limit(body: str) -> bool:
+    return SECONDARY_LIMIT_MESSAGE in body.lower()
+
+
+def get_header(headers: Mapping[str, str], name: str) -> str | None:
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+
+    return None
+
+
+def get_int_header(headers: Mapping[str, str], name: str) -> int | None:
+    value = get_header(headers, name)
+    if value is None:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+@dataclass
+class RateLimitBudget:
+    limit: int | None = None
+    remaining: int | None = None
+    reset: float | None = None
+
+    @property
+    def low(self: Self) -> bool:
+        if self.limit is None or self.remaining is None or self.reset is None:
+            return False
+
+        return self.remaining <= self.limit * LOW_BUDGET
+
+    def update(self: Self, headers: Mapping[str, str]) -> None:
+        limit = get_int_header(headers, "x-ratelimit-limit")
+        remaining = get_int_header(headers, "x-ratelimit-remaining")
+        reset = get_int_header(headers, "x-ratelimit-reset")
+
+        if limit is not None:
+            self.limit = limit
+        if remaining is not None:
+            self.remaining = remaining
+        if reset is not None:
+            self.reset = float(reset)
+
+    @override
+    def __str__(self: Self) -> str:
+        return f"{self.remaining} of {self.limit} requests left"
+
+
+class TokenBucket:
+    rate: float
+    capacity: float
+    tokens: float
+    updated: float
+
+    def __init__(self: Self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time()
+
+    def reserve(self: Self, now: float) -> float:
+        """
+        Takes a token and returns how long the caller has to wait for it.
+        Tokens may go negative, so waiting callers are served in order.
+        """
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return 0.0
+
+        return -self.tokens / self.rate
+
+
+@dataclass
+class HostSchedule:
+    requests: TokenBucket | None = None
+    writes: TokenBucket | None = None
+    budget: RateLimitBudget = field(default_factory=RateLimitBudget)
+    paused_until: float = 0.0
+    paced_until: float = 0.0
+
+    def delay(self: Self, creates: bool, now: float) -> float:
+        delay = max(self.paused_until - now, 0.0)
+
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(now))
+
+        if self.writes is not None and creates:
+            delay = max(delay, self.writes.reserve(now))
+
+        budget = self.budget
+        if budget.low and budget.reset is not None and budget.remaining is not None:
+            delay = max(delay, self.paced_until - now)
+            spacing = max(budget.reset - now, 0.0) / max(budget.remaining, 1)
+            self.paced_until = now + delay + spacing
+
+        return delay
+
+    def pause(
+        self: Self, status: int, headers: Mapping[str, str], body: str, now: float
+    ) -> float | None:
+        self.budget.update(headers)
+
+        retry_after = get_int_header(headers, "retry-after")
+        exhausted = self.budget.remaining == 0
+
+        # A plain 403 is a permission problem, only treat it as a rate limit
+        # when the server says so.
+        if status != 429 and not (
+            status == 403
+            and (retry_after is not None or exhausted or is_secondary_limit(body))
+        ):
+            return None
+
+        if retry_after is not None:
+            pause = float(retry_after)
+        elif exhausted and self.budget.reset is not None:
+            pause = max(self.budget.reset - now, 1.0)
+        else:
+            pause = DEFAULT_PAUSE
+
+        self.paused_until = max(self.paused_until, now + pause)
+        return pause
+
+
+class RateLimiter:
+    """
+    Schedules requests per host. Each host gets an optional token bucket for
+    all requests and for content-creating ones, paces requests once the server-reported
+    budget runs low, and pauses entirely after a 403/429 rate limit response.
+    """
+
+    logger: Logger
+    requests_per_second: float | None
+    hosts: dict[str, HostSchedule]
+    lock: Lock
+
+    def __init__(
+        self: Self, logger: Logger, requests_per_second: float | None = None
+    ) -> None:
+        self.logger = logger
+        self.requests_per_second = requests_per_second
+        self.hosts = {}
+        self.lock = Lock()
+
+    def get_schedule(self: Self, host: str) -> HostSchedule:
+        if host not in self.hosts:
+            rate = self.requests_per_second
+            self.hosts[host] = HostSchedule(
+                requests=TokenBucket(rate=rate, capacity=max(rate, 1.0))
+                if rate is not None
+                else None
+            )
+
+        return self.hosts[host]
+
+    def limit_writes(self: Self, host: str, per_minute: int) -> None:
+        with self.lock:
+            self.get_schedule(host).writes = TokenBucket(
+                rate=per_minute / 60, capacity=per_minute
+            )
+
+    def before(self: Self, host: str, method: str, path: str) -> float:
+        with self.lock:
+            return self.get_schedule(host).delay(creates_content(method, path), time())
+
+    def after(
+        self: Self, host: str, status: int, headers: Mapping[str, str], body: str = ""
+    ) -> float | None:
+        """
+        `body` only matters for a 403, since GitHub names its secondary limits
+        there. Callers can skip reading it for any other status.
+        """
+
+        with self.lock:
+            pause = self.get_schedule(host).pause(status, headers, body, time())
+
+        if pause is not None:
+            self.logger.warning(
+                "Rate limited by %s, pausing for %.0f seconds", host, pause
+            )
+
+        return pause
+
+    def budget(self: Self, host: str) -> RateLimitBudget:
+        with self.lock:
+            return self.get_schedule(host).budget
+
+    def budgets(self: Self) -> dict[str, RateLimitBudget]:
+        with self.lock:
+            return {
+                host: schedule.budget
+                for host, schedule in self.hosts.items()
+                if schedule.budget.remaining is not None
+            }
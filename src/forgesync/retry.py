@@ -0,0 +1,374 @@
+from asyncio import sleep as async_sleep
+from collections.abc import Awaitable, Callable, Iterator, Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import StrEnum
+from itertools import count
+from logging import Logger
+from random import random
+from threading import Lock
+from time import monotonic, sleep
+from typing import Self, TypeVar, override
+
+from httpx import HTTPError, HTTPStatusError, ResponseNotRead, TransportError
+
+from .ratelimit import get_header, get_int_header, is_secondary_limit
+from .sync import SyncError
+
+T = TypeVar("T")
+
+# What a proxy in front of an overloaded or restarting instance answers with.
+RETRY_STATUSES = {502, 503, 504}
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "PATCH", "DELETE"}
+
+# POST endpoints that only read, or that can be repeated without harm.
+IDEMPOTENT_POSTS = ("/graphql", "/push_mirrors-sync")
+
+# Retries every host gets on top of its share of --retry-budget, so a run
+# that fails early can still retry.
+MIN_RETRY_BUDGET = 10
+
+
+def is_idempotent(method: str, path: str) -> bool:
+    return method.upper() in IDEMPOTENT_METHODS or path.endswith(IDEMPOTENT_POSTS)
+
+
+def get_status(error: BaseException) -> int | None:
+    if isinstance(error, HTTPStatusError):
+        return error.response.status_code
+
+    # pyforgejo's ApiError carries `status_code`, PyGithub's exceptions `status`.
+    return getattr(error, "status_code", None) or getattr(error, "status", None)
+
+
+def is_transient(error: BaseException) -> bool:
+    # requests, and so PyGithub, raises OSErrors for connection problems.
+    if isinstance(error, (TransportError, OSError)):
+        return True
+
+    return get_status(error) in RETRY_STATUSES
+
+
+def describe(error: BaseException) -> str:
+    # API errors include all response headers in their message.
+    status = get_status(error)
+    return f"HTTP {status}" if status is not None else str(error)
+
+
+def get_url(error: BaseException) -> str | None:
+    try:
+        request = getattr(error, "request", None)
+    except RuntimeError:
+        # httpx raises if the error isn't tied to a request.
+        return None
+
+    url = getattr(request, "url", None)
+    return str(url) if url is not None else None
+
+
+def get_headers(error: BaseException) -> Mapping[str, str]:
+    if isinstance(error, HTTPStatusError):
+        return error.response.headers
+
+    # pyforgejo's ApiError and PyGithub's exceptions both carry `headers`.
+    return getattr(error, "headers", None) or {}
+
+
+def get_body(error: BaseException) -> str:
+    if isinstance(error, HTTPStatusError):
+        try:
+            return error.response.text
+        except ResponseNotRead:
+            return ""
+
+    # pyforgejo's ApiError carries `body`, PyGithub's exceptions `data`.
+    body = getattr(error, "body", None) or getattr(error, "data", None)
+    return str(body) if body is not None else ""
+
+
+def is_denied(error: BaseException) -> bool:
+    status = get_status(error)
+    if status == 401:
+        return True
+
+    if status != 403:
+        return False
+
+    # A 403 that the server marks as a rate limit is only a matter of time.
+    headers = get_headers(error)
+    return (
+        get_header(headers, "retry-after") is None
+        and get_int_header(headers, "x-ratelimit-remaining") != 0
+        and not is_secondary_limit(get_body(error))
+    )
+
+
+def is_request_error(error: BaseException) -> bool:
+    # Anything a request can still fail with once it is out of retries, from
+    # httpx, requests, or the API clients on top of them. requests' errors are
+    # OSErrors that carry the request.
+    return (
+        isinstance(error, HTTPError)
+        or (isinstance(error, OSError) and hasattr(error, "request"))
+        or get_status(error) is not None
+    )
+
+
+@contextmanager
+def request_errors_as(error_type: type[SyncError]) -> Iterator[None]:
+    """
+    Raises failed requests as `error_type`, so that callers only have to
+    handle SyncError. Requests the token isn't allowed to make are raised as
+    SyncError, since every other request would be denied as well.
+    """
+
+    try:
+        yield
+    except SyncError:
+        raise
+    except Exception as e:
+        if not is_request_error(e):
+            raise
+
+        url = get_url(e)
+        message = (
+            f"Request to {url} failed: {describe(e)}"
+            if url is not None
+            else f"Request failed: {describe(e)}"
+        )
+
+        if is_denied(e):
+            raise SyncError(message)
+
+        raise error_type(message)
+
+
+# Raised while the circuit of a host is open. It stops the run, since the
+# remaining repositories would only fail the same way.
+class HostUnavailableError(SyncError):
+    pass
+
+
+@dataclass
+class RetryConfig:
+    retries: int = 3
+    backoff: float = 1.0
+    max_backoff: float = 30.0
+    jitter: float = 1.0
+    budget: float = 0.2
+    failure_threshold: int = 5
+    cooldown: float = 30.0
+
+    def delay(self: Self, retry: int) -> float:
+        ceiling = min(self.max_backoff, self.backoff * 2 ** (retry - 1))
+
+        # Full jitter spreads out clients that failed at the same moment, so
+        # they don't all come back at once.
+        return ceiling * (1 - self.jitter * random())
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Opens after a number of consecutive failures, so requests to that host
+    fail right away. Once the cooldown is over, a single request is let
+    through, and its result decides whether the circuit closes again.
+    """
+
+    threshold: int
+    cooldown: float
+    state: CircuitState = CircuitState.CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    probing: bool = False
+
+    def allow(self: Self, now: float) -> bool:
+        if self.state == CircuitState.OPEN and now - self.opened_at >= self.cooldown:
+            self.state = CircuitState.HALF_OPEN
+            self.probing = False
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self.probing:
+                return False
+
+            self.probing = True
+            return True
+
+        return self.state == CircuitState.CLOSED
+
+    def record(self: Self, failed: bool, now: float) -> CircuitState | None:
+        """
+        Returns the new state if the result changed it.
+        """
+
+        previous = self.state
+
+        if not failed:
+            self.failures = 0
+            self.state = CircuitState.CLOSED
+        else:
+            self.failures += 1
+            if self.state == CircuitState.HALF_OPEN or (
+                self.state == CircuitState.CLOSED and self.failures >= self.threshold
+            ):
+                self.state = CircuitState.OPEN
+                self.opened_at = now
+
+        self.probing = False
+        return self.state if self.state != previous else None
+
+
+@dataclass
+class HostRetries:
+    breaker: CircuitBreaker
+    requests: int = 0
+    retries: int = 0
+
+    def can_retry(self: Self, budget: float) -> bool:
+        return self.retries < MIN_RETRY_BUDGET + budget * self.requests
+
+    @override
+    def __str__(self: Self) -> str:
+        return f"{self.retries} retries for {self.requests} requests, circuit {self.breaker.state}"
+
+
+class Retrier:
+    """
+    Decides per host whether a failed request is retried and how long to
+    wait before, within a budget of retries, and keeps a circuit breaker for
+    every host.
+    """
+
+    logger: Logger
+    config: RetryConfig
+    hosts: dict[str, HostRetries]
+    lock: Lock
+
+    def __init__(self: Self, logger: Logger, config: RetryConfig | None = None) -> None:
+        self.logger = logger
+        self.config = config if config is not None else RetryConfig()
+        self.hosts = {}
+        self.lock = Lock()
+
+    def get_host(self: Self, host: str) -> HostRetries:
+        if host not in self.hosts:
+            self.hosts[host] = HostRetries(
+                breaker=CircuitBreaker(
+                    threshold=self.config.failure_threshold,
+                    cooldown=self.config.cooldown,
+                )
+            )
+
+        return self.hosts[host]
+
+    def before(self: Self, host: str) -> None:
+        with self.lock:
+            retries = self.get_host(host)
+            allowed = retries.breaker.allow(monotonic())
+            if allowed:
+                retries.requests += 1
+
+        if not allowed:
+            raise HostUnavailableError(
+                f"{host} is failing, not sending requests to it for now"
+            )
+
+    def after(self: Self, host: str, failed: bool) -> None:
+        with self.lock:
+            state = self.get_host(host).breaker.record(failed, monotonic())
+
+        match state:
+            case CircuitState.OPEN:
+                self.logger.warning(
+                    "Requests to %s keep failing, pausing them for %.0f seconds",
+                    host,
+                    self.config.cooldown,
+                )
+            case CircuitState.CLOSED:
+                self.logger.info("%s is responding again", host)
+            case _:
+                pass
+
+    def delay(self: Self, host: str, retry: int) -> float | None:
+        """
+        Returns how long to wait before the given retry, or None if the
+        request must not be retried.
+        """
+
+        if retry > self.config.retries:
+            return None
+
+        with self.lock:
+            retries = self.get_host(host)
+            if not retries.can_retry(self.config.budget):
+                return None
+
+            retries.retries += 1
+
+        return self.config.delay(retry)
+
+    def call_checked(
+        self: Self, call: Callable[[], T], find: Callable[[], T | None]
+    ) -> T:
+        """
+        Runs a request that must not be repeated blindly, such as creating a
+        repository. After a transient failure, `find` looks for what the
+        request would have created, and only if it finds nothing is the
+        request sent again.
+        """
+
+        for retry in count(1):
+            try:
+                return call()
+            except Exception as e:
+                if not is_transient(e) or retry > self.config.retries:
+                    raise
+
+                self.logger.warning(
+                    "Request failed (%s), checking before retrying", describe(e)
+                )
+                sleep(self.config.delay(retry))
+
+            found = find()
+            if found is not None:
+                return found
+
+        raise AssertionError("unreachable")
+
+    async def call_checked_async(
+        self: Self,
+        call: Callable[[], Awaitable[T]],
+        find: Callable[[], Awaitable[T | None]],
+    ) -> T:
+        for retry in count(1):
+            try:
+                return await call()
+            except Exception as e:
+                if not is_transient(e) or retry > self.config.retries:
+                    raise
+
+                self.logger.warning(
+                    "Request failed (%s), checking before retrying", describe(e)
+                )
+                await async_sleep(self.config.delay(retry))
+
+            found = await find()
+            if found is not None:
+                return found
+
+        raise AssertionError("unreachable")
+
+    def summary(self: Self) -> dict[str, HostRetries]:
+        with self.lock:
+            return {
+                host: retries
+                for host, retries in self.hosts.items()
+                if retries.retries > 0 or retries.breaker.state != CircuitState.CLOSED
+            }
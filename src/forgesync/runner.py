@@ -0,0 +1,414 @@
+from asyncio import Semaphore, TaskGroup
+from collections import Counter
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from enum import StrEnum
+from functools import partial
+from logging import Logger
+from threading import BoundedSemaphore, Event
+from typing import Self, override
+
+from .journal import Journal
+from .log import log_group
+from .mirror import MirrorError, Remirror
+from .plan import RepositoryPlan
+from .retry import request_errors_as
+from .source import SourceRepository
+from .state import StateStore
+from .sync import RepositoryError, RepositorySkippedError, SyncError
+from .task import AsyncTask, PlannedTask, Task
+from .trace import span
+
+
+class Engine(StrEnum):
+    THREADS = "threads"
+    ASYNC = "async"
+
+
+class Outcome(StrEnum):
+    SYNCED = "synced"
+    # Synchronized by an earlier run that was interrupted.
+    ALREADY_SYNCED = "already-synced"
+    UNCHANGED = "unchanged"
+    PLANNED = "planned"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+    MIRROR_FAILED = "mirror-failed"
+    FATAL = "fatal"
+    CANCELLED = "cancelled"
+
+
+# Outcomes after which a repository has to be looked at again on the next run.
+INCOMPLETE_OUTCOMES = (
+    Outcome.FAILED,
+    Outcome.MIRROR_FAILED,
+    Outcome.FATAL,
+    Outcome.CANCELLED,
+)
+
+
+@dataclass
+class RunSummary:
+    outcomes: Counter[Outcome] = field(default_factory=Counter)
+    skipped_writes: int = 0
+
+    def record(self: Self, outcome: Outcome) -> None:
+        self.outcomes[outcome] += 1
+
+    @property
+    def fatal(self: Self) -> bool:
+        return self.outcomes[Outcome.FATAL] > 0
+
+    def counts(self: Self) -> dict[str, int]:
+        return {str(outcome): self.outcomes[outcome] for outcome in Outcome}
+
+    @property
+    def complete(self: Self) -> bool:
+        return not any(self.outcomes[outcome] > 0 for outcome in INCOMPLETE_OUTCOMES)
+
+    @property
+    def interrupted(self: Self) -> bool:
+        return self.fatal or self.outcomes[Outcome.CANCELLED] > 0
+
+    @override
+    def __str__(self: Self) -> str:
+        parts = [
+            f"{self.outcomes[outcome]} {outcome}"
+            for outcome in Outcome
+            if self.outcomes[outcome] > 0
+        ]
+
+        if self.skipped_writes > 0:
+            parts.append(f"{self.skipped_writes} unnecessary writes skipped")
+
+        return ", ".join(parts) or "nothing to do"
+
+
+class BaseTaskRunner:
+    jobs: int
+    dry_run: bool
+    logger: Logger
+    state: StateStore | None
+    force: bool
+    remirror: Remirror
+    journal: Journal | None
+    stopped: Event
+
+    def __init__(
+        self: Self,
+        jobs: int,
+        dry_run: bool,
+        logger: Logger,
+        state: StateStore | None = None,
+        force: bool = False,
+        journal: Journal | None = None,
+        remirror: Remirror = Remirror.NO,
+    ) -> None:
+        if jobs < 1:
+            raise ValueError("The number of jobs must be at least 1")
+
+        self.jobs = jobs
+        self.dry_run = dry_run
+        self.logger = logger
+        self.state = state
+        self.force = force
+        self.remirror = remirror
+        self.journal = journal
+        self.stopped = Event()
+
+    def is_stale(self: Self, key: str, fingerprint: Callable[[], str]) -> bool:
+        # Remirroring replaces push mirrors, which the fingerprint doesn't cover.
+        if self.state is None or self.force or self.remirror != Remirror.NO:
+            return True
+
+        return not self.state.is_current(key, fingerprint())
+
+    def is_done(self: Self, key: str, fingerprint: Callable[[], str]) -> bool:
+        if self.journal is None:
+            return False
+
+        return self.journal.progress(key, fingerprint()).done
+
+    def log_done(self: Self, task: Task | AsyncTask) -> None:
+        self.logger.info(
+            "Repository %s was synchronized before the restart, skipping",
+            task.source_repo,
+        )
+
+    def log_unchanged(self: Self, task: Task | AsyncTask) -> None:
+        self.logger.info("Repository %s is unchanged, skipping", task.source_repo)
+
+    def handle_error(
+        self: Self,
+        source_repo: SourceRepository | RepositoryPlan,
+        error: SyncError | MirrorError,
+    ) -> Outcome:
+        match error:
+            case MirrorError():
+                self.logger.warning("Mirroring failed: %s", error)
+                return Outcome.MIRROR_FAILED
+            case RepositorySkippedError():
+                self.logger.warning(
+                    "Repository %s skipped: %s", source_repo.name, error
+                )
+                return Outcome.SKIPPED
+            case RepositoryError():
+                self.logger.warning(
+                    "Syncing repository %s failed: %s", source_repo.name, error
+                )
+                return Outcome.FAILED
+            case SyncError():
+                self.logger.fatal(
+                    "Syncing repository %s failed: %s", source_repo.name, error
+                )
+                self.stopped.set()
+                return Outcome.FATAL
+
+
+class TaskRunner(BaseTaskRunner):
+    slots: BoundedSemaphore | None
+    plans: list[RepositoryPlan] | None
+
+    def __init__(
+        self: Self,
+        jobs: int,
+        dry_run: bool,
+        logger: Logger,
+        state: StateStore | None = None,
+        force: bool = False,
+        slots: BoundedSemaphore | None = None,
+        plans: list[RepositoryPlan] | None = None,
+        journal: Journal | None = None,
+        remirror: Remirror = Remirror.NO,
+    ) -> None:
+        super().__init__(
+            jobs=jobs,
+            dry_run=dry_run,
+            logger=logger,
+            state=state,
+            force=force,
+            journal=journal,
+            remirror=remirror,
+        )
+        # Shared between the runners of several jobs to cap their total
+        # concurrency.
+        self.slots = slots
+        # Collects the changes of every task instead of running it.
+        self.plans = plans
+
+    def execute(
+        self: Self,
+        source_repo: SourceRepository,
+        make_task: Callable[[], Task],
+    ) -> Outcome:
+        if self.stopped.is_set():
+            return Outcome.CANCELLED
+
+        with (
+            self.slots or nullcontext(),
+            log_group(self.logger),
+            span("task", "task", repository=str(source_repo)),
+        ):
+            try:
+                with request_errors_as(RepositoryError):
+                    task = make_task()
+
+                    pending = [
+                        target
+                        for target in task.targets
+                        if not self.is_done(
+                            task.state_key(target), partial(task.fingerprint, target)
+                        )
+                    ]
+                    if not pending:
+                        self.log_done(task)
+                        return Outcome.ALREADY_SYNCED
+
+                    targets = [
+                        target
+                        for target in pending
+                        if self.is_stale(
+                            task.state_key(target), partial(task.fingerprint, target)
+                        )
+                    ]
+                    if not targets:
+                        self.log_unchanged(task)
+                        return Outcome.UNCHANGED
+
+                    if self.dry_run:
+                        self.logger.info("Would run task: %s", task)
+                        return Outcome.PLANNED
+
+                    if self.plans is not None:
+                        plan = task.plan(targets)
+                        if plan.empty:
+                            self.logger.info(
+                                "Repository %s is up to date", task.source_repo
+                            )
+                            return Outcome.UNCHANGED
+
+                        self.logger.info("Planned task: %s", task)
+                        self.plans.append(plan)
+                        return Outcome.PLANNED
+
+                    self.logger.info("Running task: %s", task)
+                    task.run(targets, self.journal, self.state)
+            except (SyncError, MirrorError) as error:
+                return self.handle_error(source_repo, error)
+
+        return Outcome.SYNCED
+
+    def run(
+        self: Self,
+        work: Iterable[tuple[SourceRepository, Callable[[], Task]]],
+    ) -> RunSummary:
+        summary = RunSummary()
+
+        if self.jobs == 1:
+            for source_repo, make_task in work:
+                summary.record(self.execute(source_repo, make_task))
+                if self.stopped.is_set():
+                    break
+            return summary
+
+        with ThreadPoolExecutor(
+            max_workers=self.jobs, thread_name_prefix="forgesync"
+        ) as executor:
+            futures: list[Future[Outcome]] = []
+            for source_repo, make_task in work:
+                if self.stopped.is_set():
+                    break
+                futures.append(executor.submit(self.execute, source_repo, make_task))
+
+            for future in as_completed(futures):
+                if future.cancelled():
+                    summary.record(Outcome.CANCELLED)
+                    continue
+
+                summary.record(future.result())
+                if self.stopped.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+        return summary
+
+
+class PlanRunner(BaseTaskRunner):
+    def execute(self: Self, task: PlannedTask) -> Outcome:
+        if self.stopped.is_set():
+            return Outcome.CANCELLED
+
+        with (
+            log_group(self.logger),
+            span("task", "task", repository=str(task.plan)),
+        ):
+            try:
+                with request_errors_as(RepositoryError):
+                    self.logger.info("Running task: %s", task)
+                    task.run()
+
+                    if self.state is not None:
+                        for target in task.plan.targets:
+                            self.state.record(target.state_key, target.fingerprint)
+            except (SyncError, MirrorError) as error:
+                return self.handle_error(task.plan, error)
+
+        return Outcome.SYNCED
+
+    def run(self: Self, tasks: Iterable[PlannedTask]) -> RunSummary:
+        summary = RunSummary()
+
+        with ThreadPoolExecutor(
+            max_workers=self.jobs, thread_name_prefix="forgesync"
+        ) as executor:
+            futures = [executor.submit(self.execute, task) for task in tasks]
+
+            for future in as_completed(futures):
+                if future.cancelled():
+                    summary.record(Outcome.CANCELLED)
+                    continue
+
+                summary.record(future.result())
+                if self.stopped.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+        return summary
+
+
+class AsyncTaskRunner(BaseTaskRunner):
+    async def execute(
+        self: Self,
+        source_repo: SourceRepository,
+        make_task: Callable[[], AsyncTask],
+        slots: Semaphore,
+    ) -> Outcome:
+        async with slots:
+            if self.stopped.is_set():
+                return Outcome.CANCELLED
+
+            with (
+                log_group(self.logger),
+                span("task", "task", repository=str(source_repo)),
+            ):
+                try:
+                    with request_errors_as(RepositoryError):
+                        task = make_task()
+
+                        if (
+                            self.state is not None and not self.force
+                        ) or self.journal is not None:
+                            _ = await task.prepare()
+
+                        pending = [
+                            target
+                            for target in task.targets
+                            if not self.is_done(
+                                task.state_key(target),
+                                partial(task.fingerprint, target),
+                            )
+                        ]
+                        if not pending:
+                            self.log_done(task)
+                            return Outcome.ALREADY_SYNCED
+
+                        targets = [
+                            target
+                            for target in pending
+                            if self.is_stale(
+                                task.state_key(target),
+                                partial(task.fingerprint, target),
+                            )
+                        ]
+                        if not targets:
+                            self.log_unchanged(task)
+                            return Outcome.UNCHANGED
+
+                        if self.dry_run:
+                            self.logger.info("Would run task: %s", task)
+                            return Outcome.PLANNED
+
+                        self.logger.info("Running task: %s", task)
+                        await task.run(targets, self.journal, self.state)
+                except (SyncError, MirrorError) as error:
+                    return self.handle_error(source_repo, error)
+
+            return Outcome.SYNCED
+
+    async def run(
+        self: Self,
+        work: Iterable[tuple[SourceRepository, Callable[[], AsyncTask]]],
+    ) -> RunSummary:
+        summary = RunSummary()
+        slots = Semaphore(self.jobs)
+
+        async with TaskGroup() as group:
+            tasks = [
+                group.create_task(self.execute(source_repo, make_task, slots))
+                for source_repo, make_task in work
+            ]
+
+        for task in tasks:
+            summary.record(task.result())
+
+        return summary
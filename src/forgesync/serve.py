@@ -0,0 +1,310 @@
+from collections.abc import Callable, Mapping
+from hashlib import sha256
+from hmac import compare_digest
+from hmac import new as new_hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import JSONDecodeError, loads
+from logging import Logger
+from socket import AF_INET6
+from threading import Condition, Event, Thread
+from time import monotonic
+from typing import Any, Self, override
+
+SIGNATURE_HEADERS = ("X-Forgejo-Signature", "X-Gitea-Signature")
+EVENT_HEADERS = ("X-Forgejo-Event", "X-Gitea-Event")
+
+# Events keep being merged into a batch for at most this many debounce delays,
+# so a steady stream of pushes can't postpone synchronization forever.
+MAX_DEBOUNCE_FACTOR = 10
+
+# Deliveries are read before their signature can be checked, so larger ones
+# are refused. Forgejo's payloads stay far below this.
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookError(RuntimeError):
+    pass
+
+
+def parse_listen(listen: str) -> tuple[str, int]:
+    host, _, port = listen.rpartition(":")
+
+    # IPv6 addresses are written in brackets, e.g. [::1]:8080.
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+
+    try:
+        return host or "127.0.0.1", int(port)
+    except ValueError:
+        raise ValueError(f"Invalid listen address: {listen}")
+
+
+def get_first_header(headers: Mapping[str, str], names: tuple[str, ...]) -> str | None:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+
+    return None
+
+
+def verify_signature(body: bytes, signature: str | None, secret: str) -> None:
+    if signature is None:
+        raise WebhookError("Missing webhook signature")
+
+    expected = new_hmac(secret.encode(), body, sha256).hexdigest()
+    if not compare_digest(expected, signature):
+        raise WebhookError("Invalid webhook signature")
+
+
+def parse_event(
+    headers: Mapping[str, str], body: bytes, secret: str | None
+) -> str | None:
+    """
+    Returns the full name of the repository a webhook delivery is about, or
+    None if it isn't about a repository.
+    """
+
+    if secret is not None:
+        verify_signature(
+            body=body,
+            signature=get_first_header(headers, SIGNATURE_HEADERS),
+            secret=secret,
+        )
+
+    try:
+        payload: Any = loads(body)
+    except (JSONDecodeError, UnicodeDecodeError):
+        raise WebhookError("Webhook payload is not valid JSON")
+
+    if not isinstance(payload, dict):
+        raise WebhookError("Webhook payload is not an object")
+
+    repository = payload.get("repository")
+    if not isinstance(repository, dict):
+        return None
+
+    full_name = repository.get("full_name")
+    if not isinstance(full_name, str) or "/" not in full_name:
+        return None
+
+    return full_name
+
+
+class Debouncer:
+    """
+    Coalesces repository names from bursts of webhook events into batches.
+    A batch is released once no new event has arrived for `delay` seconds.
+    """
+
+    delay: float
+    pending: set[str]
+    first_at: float | None
+    last_at: float | None
+    condition: Condition
+
+    def __init__(self: Self, delay: float) -> None:
+        self.delay = delay
+        self.pending = set()
+        self.first_at = None
+        self.last_at = None
+        self.condition = Condition()
+
+    def add(self: Self, full_name: str) -> None:
+        with self.condition:
+            now = monotonic()
+            if not self.pending:
+                self.first_at = now
+            self.pending.add(full_name)
+            self.last_at = now
+            self.condition.notify_all()
+
+    def wake(self: Self) -> None:
+        with self.condition:
+            self.condition.notify_all()
+
+    def ready_at(self: Self) -> float | None:
+        if self.first_at is None or self.last_at is None:
+            return None
+
+        return min(
+            self.last_at + self.delay,
+            self.first_at + self.delay * MAX_DEBOUNCE_FACTOR,
+        )
+
+    def take(self: Self, timeout: float, stopped: Event) -> set[str]:
+        """
+        Waits for up to `timeout` seconds for a batch. Returns an empty set if
+        none became ready in time or the daemon is stopping.
+        """
+
+        deadline = monotonic() + timeout
+
+        with self.condition:
+            while not stopped.is_set():
+                now = monotonic()
+                ready_at = self.ready_at()
+
+                if ready_at is not None and ready_at <= now:
+                    batch = self.pending
+                    self.pending = set()
+                    self.first_at = None
+                    self.last_at = None
+                    return batch
+
+                if now >= deadline:
+                    break
+
+                wait_until = deadline if ready_at is None else min(deadline, ready_at)
+                _ = self.condition.wait(wait_until - now)
+
+        return set()
+
+    def clear(self: Self) -> None:
+        with self.condition:
+            self.pending = set()
+            self.first_at = None
+            self.last_at = None
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    server: "WebhookServer"
+
+    def do_POST(self: Self) -> None:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+
+        if not 0 <= length <= MAX_BODY_SIZE:
+            self.server.logger.warning(
+                "Rejected webhook delivery of %s bytes",
+                self.headers.get("Content-Length"),
+            )
+            # The body is left unread, so the connection can't be reused.
+            self.close_connection = True
+            self.send_response(413 if length > MAX_BODY_SIZE else 400)
+            self.end_headers()
+            return
+
+        body = self.rfile.read(length)
+
+        try:
+            full_name = parse_event(
+                headers=self.headers, body=body, secret=self.server.secret
+            )
+        except WebhookError as e:
+            self.server.logger.warning("Rejected webhook delivery: %s", e)
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        if full_name is not None:
+            self.server.logger.info(
+                "Received %s event for %s",
+                get_first_header(self.headers, EVENT_HEADERS) or "unknown",
+                full_name,
+            )
+            self.server.debouncer.add(full_name)
+
+        self.send_response(202)
+        self.end_headers()
+
+    @override
+    def log_message(self: Self, format: str, *args: Any) -> None:
+        self.server.logger.debug(format, *args)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads: bool = True
+
+    debouncer: Debouncer
+    secret: str | None
+    logger: Logger
+
+    def __init__(
+        self: Self,
+        address: tuple[str, int],
+        debouncer: Debouncer,
+        secret: str | None,
+        logger: Logger,
+    ) -> None:
+        if ":" in address[0]:
+            self.address_family = AF_INET6
+
+        super().__init__(address, WebhookHandler)
+        self.debouncer = debouncer
+        self.secret = secret
+        self.logger = logger
+
+
+class Daemon:
+    """
+    Synchronizes the repositories named by webhook events in debounced
+    batches, and the whole account every `reconcile_interval` seconds.
+    """
+
+    server: WebhookServer
+    debouncer: Debouncer
+    reconcile_interval: float
+    logger: Logger
+    sync: Callable[[set[str]], None]
+    reconcile: Callable[[], None]
+    stopped: Event
+
+    def __init__(
+        self: Self,
+        server: WebhookServer,
+        reconcile_interval: float,
+        logger: Logger,
+        sync: Callable[[set[str]], None],
+        reconcile: Callable[[], None],
+    ) -> None:
+        self.server = server
+        self.debouncer = server.debouncer
+        self.reconcile_interval = reconcile_interval
+        self.logger = logger
+        self.sync = sync
+        self.reconcile = reconcile
+        self.stopped = Event()
+
+    def run(self: Self) -> None:
+        thread = Thread(
+            target=self.server.serve_forever, name="forgesync-webhooks", daemon=True
+        )
+        thread.start()
+
+        host, port = self.server.server_address[:2]
+        self.logger.info("Listening for webhooks on %s:%s", host, port)
+
+        try:
+            next_reconcile = monotonic()
+
+            while not self.stopped.is_set():
+                batch = self.debouncer.take(
+                    timeout=max(next_reconcile - monotonic(), 0.0),
+                    stopped=self.stopped,
+                )
+
+                if self.stopped.is_set():
+                    break
+
+                if monotonic() >= next_reconcile:
+                    # A full run covers anything that is still pending.
+                    self.debouncer.clear()
+                    self.logger.info("Starting full reconciliation")
+                    self.reconcile()
+                    next_reconcile = monotonic() + self.reconcile_interval
+                elif batch:
+                    self.logger.info(
+                        "Synchronizing %d changed repositories", len(batch)
+                    )
+                    self.sync(batch)
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            thread.join()
+
+    def stop(self: Self) -> None:
+        self.stopped.set()
+        self.debouncer.wake()
@@ -0,0 +1,66 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+from hashlib import sha256
+from statistics import mean, pstdev
+from typing import Self, override
+
+from .source import SourceRepository
+
+
+def get_shard_index(full_name: str, count: int) -> int:
+    # A cryptographic hash stays the same across processes and Python
+    # versions, unlike hash(), so every node agrees without coordinating.
+    digest = sha256(full_name.lower().encode()).digest()
+    return int.from_bytes(digest[:8]) % count
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, string: str) -> Self:
+        index, _, count = string.partition("/")
+
+        try:
+            shard = cls(index=int(index), count=int(count))
+        except ValueError:
+            raise ValueError(f"Invalid shard, expected INDEX/COUNT: {string}")
+
+        if shard.count < 1 or not 0 <= shard.index < shard.count:
+            raise ValueError(f"Shard index must be between 0 and {shard.count - 1}")
+
+        return shard
+
+    def contains(self: Self, source_repo: SourceRepository) -> bool:
+        return get_shard_index(str(source_repo), self.count) == self.index
+
+    @override
+    def __str__(self: Self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def count_shards(source_repos: Iterable[SourceRepository], count: int) -> list[int]:
+    counts = [0] * count
+    for source_repo in source_repos:
+        counts[get_shard_index(str(source_repo), count)] += 1
+
+    return counts
+
+
+def format_shard_balance(counts: list[int]) -> str:
+    lines = [
+        f"{Shard(index=index, count=len(counts))}\t{size}"
+        for index, size in enumerate(counts)
+    ]
+
+    average = mean(counts)
+    imbalance = max(counts) / average if average > 0 else 1.0
+    lines.append(
+        f"total {sum(counts)}, min {min(counts)}, max {max(counts)}, "
+        + f"mean {average:.1f}, stddev {pstdev(counts):.1f}, "
+        + f"max/mean {imbalance:.2f}"
+    )
+
+    return "\n".join(lines)
@@ -0,0 +1,141 @@
+from dataclasses import asdict
+from hashlib import sha256
+from json import dumps
+from pathlib import Path
+from sqlite3 import Connection, connect
+from threading import Lock
+from time import time
+from typing import Self
+
+from .dest import Destination
+from .discovery import DiscoveryMark
+from .mirror import PushMirrorConfig
+from .shard import Shard
+from .source import SourceRepository
+from .sync import RepositoryFeature
+
+STATE_FILE = "state.sqlite3"
+
+
+def make_fingerprint(
+    source_repo: SourceRepository,
+    description: str,
+    topics: list[str],
+    features: list[RepositoryFeature],
+    destination: Destination,
+    push_mirror_config: PushMirrorConfig,
+) -> str:
+    real = source_repo.real
+
+    inputs = {
+        "name": source_repo.name,
+        "description": description,
+        "topics": topics,
+        "website": real.website,
+        "default_branch": real.default_branch,
+        "wiki_branch": real.wiki_branch,
+        "private": real.private,
+        "archived": real.archived,
+        "template": real.template,
+        "features": sorted(set(features)),
+        "destination": str(destination),
+        "push_mirror_config": asdict(push_mirror_config),
+    }
+
+    return sha256(dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def make_state_key(source_repo: SourceRepository, destination: Destination) -> str:
+    return f"{source_repo.real.html_url or source_repo} -> {destination}"
+
+
+def make_discovery_key(
+    source: str, destinations: list[Destination], shard: Shard | None
+) -> str:
+    key = f"{source.rstrip('/')} -> {', '.join(map(str, destinations))}"
+    return f"{key} [{shard}]" if shard is not None else key
+
+
+class StateStore:
+    connection: Connection
+    lock: Lock
+
+    def __init__(self: Self, path: Path) -> None:
+        self.connection = connect(path, check_same_thread=False)
+        self.lock = Lock()
+
+        with self.lock, self.connection:
+            _ = self.connection.execute("PRAGMA journal_mode=WAL")
+            _ = self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS repositories (
+                    key TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    synced_at REAL NOT NULL
+                )
+                """
+            )
+            _ = self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS discovery (
+                    key TEXT PRIMARY KEY,
+                    updated_at REAL NOT NULL,
+                    swept_at REAL NOT NULL
+                )
+                """
+            )
+
+    @classmethod
+    def open(cls, state_dir: Path) -> Self:
+        state_dir.mkdir(parents=True, exist_ok=True)
+        return cls(state_dir / STATE_FILE)
+
+    def is_current(self: Self, key: str, fingerprint: str) -> bool:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fingerprint FROM repositories WHERE key = ?", (key,)
+            ).fetchone()
+
+        return row is not None and row[0] == fingerprint
+
+    def record(self: Self, key: str, fingerprint: str) -> None:
+        with self.lock, self.connection:
+            _ = self.connection.execute(
+                """
+                INSERT INTO repositories (key, fingerprint, synced_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    fingerprint = excluded.fingerprint,
+                    synced_at = excluded.synced_at
+                """,
+                (key, fingerprint, time()),
+            )
+
+    def get_mark(self: Self, key: str) -> DiscoveryMark | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT updated_at, swept_at FROM discovery WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        updated_at, swept_at = row
+        return DiscoveryMark(updated_at=updated_at, swept_at=swept_at)
+
+    def record_mark(self: Self, key: str, mark: DiscoveryMark) -> None:
+        with self.lock, self.connection:
+            _ = self.connection.execute(
+                """
+                INSERT INTO discovery (key, updated_at, swept_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    updated_at = excluded.updated_at,
+                    swept_at = excluded.swept_at
+                """,
+                (key, mark.updated_at, mark.swept_at),
+            )
+
+    def close(self: Self) -> None:
+        with self.lock:
+            self.connection.close()
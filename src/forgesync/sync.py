@@ -1,10 +1,12 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
 from enum import StrEnum
-from typing import Self
+from threading import Lock
+from typing import Any, Self
 
 from .source import SourceRepository
-from .platform import Platform
+from .plan import RepositoryChanges
 
 
 class RepositoryFeature(StrEnum):
@@ -24,11 +26,53 @@ class SyncedRepository:
     orig_owner: str
     name: str
     clone_url: str
-    platform: Platform
+    # The name of the destination's backend.
+    platform: str
     mirrored: bool
 
 
+@dataclass
+class WriteStats:
+    sent: int = 0
+    skipped: int = 0
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+    def count(self: Self, changed: bool) -> None:
+        with self.lock:
+            if changed:
+                self.sent += 1
+            else:
+                self.skipped += 1
+
+
+def diff_options(
+    desired: Mapping[str, Any], current: Mapping[str, Any]
+) -> dict[str, Any]:
+    changes: dict[str, Any] = {}
+
+    for key, value in desired.items():
+        if value is None:
+            continue
+
+        existing = current.get(key)
+        if isinstance(value, str) and existing is None:
+            existing = ""
+
+        if existing != value:
+            changes[key] = value
+
+    return changes
+
+
+def topics_differ(desired: Iterable[str], current: Iterable[str] | None) -> bool:
+    # Forgejo reports a repository without topics as null.
+    return set(desired) != set(current or [])
+
+
 class Syncer(ABC):
+    features: list[RepositoryFeature]
+    stats: WriteStats
+
     @abstractmethod
     def sync(
         self: Self,
@@ -38,6 +82,41 @@ class Syncer(ABC):
     ) -> SyncedRepository:
         pass
 
+    @abstractmethod
+    def plan(
+        self: Self,
+        source_repo: SourceRepository,
+        description: str,
+        topics: list[str],
+    ) -> RepositoryChanges:
+        pass
+
+
+class Applier(ABC):
+    """
+    Writes planned changes to a destination without reading its state.
+    """
+
+    @abstractmethod
+    def apply(
+        self: Self, orig_owner: str, changes: RepositoryChanges
+    ) -> SyncedRepository:
+        pass
+
+
+class AsyncSyncer(ABC):
+    features: list[RepositoryFeature]
+    stats: WriteStats
+
+    @abstractmethod
+    async def sync(
+        self: Self,
+        source_repo: SourceRepository,
+        description: str,
+        topics: list[str],
+    ) -> SyncedRepository:
+        pass
+
 
 class SyncError(RuntimeError):
     pass
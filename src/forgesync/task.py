@@ -1,62 +1,454 @@
+from asyncio import gather
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass, replace
 from typing import override
-from pyforgejo import PyforgejoApi
 
 from .dest import Destination
-from .mirror import PushMirrorConfig, PushMirrorer
+from .journal import Journal, Progress, get_progress
+from .mirror import (
+    AsyncPushMirrorer,
+    PushMirrorConfig,
+    PushMirrorIndex,
+    PushMirrorer,
+    Remirror,
+    plan_mirrors,
+)
+from .plan import RepositoryPlan, TargetPlan
 from .source import SourceRepository
-from .sync import Syncer
-from .forgejo import depaginate
+from .sync import Applier, AsyncSyncer, Syncer
+from .limits import AsyncHostLimits, HostLimits
+from .state import StateStore, make_fingerprint, make_state_key
+from .topics import AsyncTopicCache, TopicCache
+from .trace import span
 
 
-class Task:
+@dataclass
+class Target:
+    destination: Destination
     syncer: Syncer
-    source_client: PyforgejoApi
+    push_mirrorer: PushMirrorer
+    limits: HostLimits
+
+
+@dataclass
+class ApplyTarget:
+    destination: str
+    applier: Applier
+    push_mirrorer: PushMirrorer
+    limits: HostLimits
+
+
+@dataclass
+class AsyncTarget:
+    destination: Destination
+    syncer: AsyncSyncer
+    push_mirrorer: AsyncPushMirrorer
+    limits: AsyncHostLimits
+
+
+def get_target_config(config: PushMirrorConfig) -> PushMirrorConfig:
+    # Purging happens once per task, after which each target sets up its
+    # push mirror again.
+    if config.remirror == Remirror.PURGE:
+        return replace(config, remirror=Remirror.YES)
+
+    return config
+
+
+def needs_purge(config: PushMirrorConfig, purged: bool) -> bool:
+    # A resumed run may have set up push mirrors again since it purged them.
+    return config.remirror == Remirror.PURGE and not purged
+
+
+class Task:
+    topic_cache: TopicCache
     description: str
     source_repo: SourceRepository
-    topics: list[str]
-    push_mirrorer: PushMirrorer
     push_mirror_config: PushMirrorConfig
-    destination: Destination
+    targets: list[Target]
 
     def __init__(
         self,
-        syncer: Syncer,
-        source_client: PyforgejoApi,
+        topic_cache: TopicCache,
         description: str,
         source_repo: SourceRepository,
-        push_mirrorer: PushMirrorer,
         push_mirror_config: PushMirrorConfig,
-        destination: Destination,
+        targets: list[Target],
     ) -> None:
-        self.syncer = syncer
-        self.source_client = source_client
+        self.topic_cache = topic_cache
         self.description = description
         self.source_repo = source_repo
-        self.push_mirrorer = push_mirrorer
         self.push_mirror_config = push_mirror_config
-        self.destination = destination
-        self.topics = list(
-            depaginate(
-                source_client.repository.repo_list_topics,
-                owner=source_repo.owner,
-                repo=source_repo.name,
-                convert=lambda t: t.topics,
+        self.targets = targets
+
+    @property
+    def topics(self) -> list[str]:
+        return self.topic_cache.get(self.source_repo)
+
+    def run(
+        self,
+        targets: list[Target] | None = None,
+        journal: Journal | None = None,
+        state: StateStore | None = None,
+    ) -> None:
+        targets = self.targets if targets is None else targets
+        config = get_target_config(self.push_mirror_config)
+
+        # Fetched first, so that a failure doesn't leave the repository
+        # purged.
+        topics = self.topics
+
+        if needs_purge(self.push_mirror_config, purged=self.purged(journal)):
+            # Purging removes the push mirrors to every destination, so it
+            # happens once up front and all destinations are set up again.
+            with span("purge"):
+                self.targets[0].push_mirrorer.purge_repo(self.source_repo)
+            targets = self.targets
+
+            for target in targets:
+                self.progress(target, journal).record_purged()
+
+        if len(targets) == 1:
+            self.run_target(targets[0], topics, config, journal, state)
+            return
+
+        with ThreadPoolExecutor(
+            max_workers=len(targets), thread_name_prefix="forgesync-target"
+        ) as executor:
+            # Each target runs in a copy of the task's context, so that its
+            # logs stay in the task's log group and its spans under the task.
+            futures = [
+                executor.submit(
+                    copy_context().run,
+                    self.run_target,
+                    target,
+                    topics,
+                    config,
+                    journal,
+                    state,
+                )
+                for target in targets
+            ]
+
+        for future in futures:
+            future.result()
+
+    def run_target(
+        self,
+        target: Target,
+        topics: list[str],
+        config: PushMirrorConfig,
+        journal: Journal | None = None,
+        state: StateStore | None = None,
+    ) -> None:
+        destination = str(target.destination)
+        progress = self.progress(target, journal)
+
+        # Stages an interrupted run already completed are skipped.
+        synced_repo = progress.synced_repo
+        if synced_repo is None:
+            with target.limits.target, span("sync", destination=destination):
+                synced_repo = target.syncer.sync(
+                    source_repo=self.source_repo,
+                    description=self.description,
+                    topics=topics,
+                )
+            progress.record_synced(synced_repo)
+
+        if not synced_repo.mirrored:
+            if not progress.mirrored:
+                with span("mirror", destination=destination):
+                    push_mirror = target.push_mirrorer.mirror_repo(
+                        synced_repo=synced_repo,
+                        config=replace(config, immediate=False),
+                    )
+                progress.record_mirrored(
+                    trigger=push_mirror is not None and config.immediate
+                )
+
+            if progress.trigger:
+                with span("trigger", destination=destination):
+                    target.push_mirrorer.trigger_sync(synced_repo)
+                progress.record_triggered()
+
+        progress.record_done()
+
+        # Recorded per target, so that a failure at one destination doesn't
+        # make the next run redo the others.
+        if state is not None:
+            state.record(self.state_key(target), self.fingerprint(target))
+
+    def progress(self, target: Target, journal: Journal | None) -> Progress:
+        return get_progress(
+            journal, key=self.state_key(target), fingerprint=self.fingerprint(target)
+        )
+
+    def purged(self, journal: Journal | None) -> bool:
+        return any(self.progress(target, journal).purged for target in self.targets)
+
+    def plan(self, targets: list[Target] | None = None) -> RepositoryPlan:
+        targets = self.targets if targets is None else targets
+        config = self.push_mirror_config
+        purge: list[str] = []
+
+        if config.remirror == Remirror.PURGE:
+            purge = self.targets[0].push_mirrorer.plan_purge(self.source_repo)
+            config = get_target_config(config)
+
+            # Purging removes the push mirrors to every destination, so all
+            # of them have to be set up again.
+            if purge:
+                targets = self.targets
+
+        topics = self.topics
+
+        return RepositoryPlan(
+            owner=self.source_repo.owner,
+            name=self.source_repo.name,
+            purge=purge,
+            targets=[
+                self.plan_target(target, topics, config, purged=bool(purge))
+                for target in targets
+            ],
+        )
+
+    def plan_target(
+        self,
+        target: Target,
+        topics: list[str],
+        config: PushMirrorConfig,
+        purged: bool,
+    ) -> TargetPlan:
+        with target.limits.target, span("plan", destination=str(target.destination)):
+            changes = target.syncer.plan(
+                source_repo=self.source_repo,
+                description=self.description,
+                topics=topics,
             )
+
+        if purged:
+            # Whatever the index holds is gone once the purge has run.
+            if changes.mirror is not None:
+                changes.mirror.delete = []
+            else:
+                changes.mirror = plan_mirrors(
+                    remirror=config.remirror,
+                    index=PushMirrorIndex([]),
+                    clone_url=changes.clone_url,
+                    config=config,
+                )
+        elif changes.mirror is None:
+            changes.mirror = target.push_mirrorer.plan_repo(
+                source_repo=self.source_repo,
+                clone_url=changes.clone_url,
+                config=config,
+            )
+
+        return TargetPlan(
+            destination=str(target.destination),
+            state_key=self.state_key(target),
+            fingerprint=self.fingerprint(target),
+            changes=changes,
         )
 
-    def run(self) -> None:
-        synced_repo = self.syncer.sync(
+    def state_key(self, target: Target) -> str:
+        return make_state_key(
+            source_repo=self.source_repo, destination=target.destination
+        )
+
+    def fingerprint(self, target: Target) -> str:
+        return make_fingerprint(
             source_repo=self.source_repo,
             description=self.description,
             topics=self.topics,
+            features=target.syncer.features,
+            destination=target.destination,
+            push_mirror_config=self.push_mirror_config,
         )
 
-        if not synced_repo.mirrored:
-            _ = self.push_mirrorer.mirror_repo(
-                synced_repo=synced_repo,
-                config=self.push_mirror_config,
+    @override
+    def __str__(self) -> str:
+        destinations = ", ".join(str(target.destination) for target in self.targets)
+        return f"Synchronize {self.source_repo.owner}/{self.source_repo.name} to {destinations}"
+
+
+class PlannedTask:
+    plan: RepositoryPlan
+    targets: dict[str, ApplyTarget]
+
+    def __init__(self, plan: RepositoryPlan, targets: dict[str, ApplyTarget]) -> None:
+        self.plan = plan
+        self.targets = targets
+
+    def run(self) -> None:
+        if self.plan.purge:
+            target = next(iter(self.targets.values()))
+            with span("purge"):
+                target.push_mirrorer.apply_purge(
+                    owner=self.plan.owner,
+                    repo=self.plan.name,
+                    remote_names=self.plan.purge,
+                )
+
+        for target_plan in self.plan.targets:
+            if not target_plan.changes.empty:
+                self.run_target(self.targets[target_plan.destination], target_plan)
+
+    def run_target(self, target: ApplyTarget, target_plan: TargetPlan) -> None:
+        changes = target_plan.changes
+
+        with target.limits.target, span("apply", destination=target.destination):
+            synced_repo = target.applier.apply(
+                orig_owner=self.plan.owner, changes=changes
             )
 
+        if not synced_repo.mirrored and changes.mirror is not None:
+            with span("mirror", destination=target.destination):
+                _ = target.push_mirrorer.apply_repo(
+                    synced_repo=synced_repo, changes=changes.mirror
+                )
+
+    @override
+    def __str__(self) -> str:
+        destinations = ", ".join(
+            target.destination
+            for target in self.plan.targets
+            if not target.changes.empty
+        )
+        return f"Apply plan for {self.plan} to {destinations}"
+
+
+class AsyncTask:
+    topic_cache: AsyncTopicCache
+    description: str
+    source_repo: SourceRepository
+    topics: list[str] | None
+    push_mirror_config: PushMirrorConfig
+    targets: list[AsyncTarget]
+
+    def __init__(
+        self,
+        topic_cache: AsyncTopicCache,
+        description: str,
+        source_repo: SourceRepository,
+        push_mirror_config: PushMirrorConfig,
+        targets: list[AsyncTarget],
+    ) -> None:
+        self.topic_cache = topic_cache
+        self.description = description
+        self.source_repo = source_repo
+        self.topics = None
+        self.push_mirror_config = push_mirror_config
+        self.targets = targets
+
+    async def prepare(self) -> list[str]:
+        if self.topics is None:
+            self.topics = await self.topic_cache.get(self.source_repo)
+
+        return self.topics
+
+    async def run(
+        self,
+        targets: list[AsyncTarget] | None = None,
+        journal: Journal | None = None,
+        state: StateStore | None = None,
+    ) -> None:
+        targets = self.targets if targets is None else targets
+        config = get_target_config(self.push_mirror_config)
+
+        topics = await self.prepare()
+
+        if needs_purge(self.push_mirror_config, purged=self.purged(journal)):
+            with span("purge"):
+                await self.targets[0].push_mirrorer.purge_repo(self.source_repo)
+            targets = self.targets
+
+            for target in targets:
+                self.progress(target, journal).record_purged()
+
+        results = await gather(
+            *(
+                self.run_target(target, topics, config, journal, state)
+                for target in targets
+            ),
+            return_exceptions=True,
+        )
+
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def run_target(
+        self,
+        target: AsyncTarget,
+        topics: list[str],
+        config: PushMirrorConfig,
+        journal: Journal | None = None,
+        state: StateStore | None = None,
+    ) -> None:
+        destination = str(target.destination)
+        progress = self.progress(target, journal)
+
+        synced_repo = progress.synced_repo
+        if synced_repo is None:
+            async with target.limits.target:
+                with span("sync", destination=destination):
+                    synced_repo = await target.syncer.sync(
+                        source_repo=self.source_repo,
+                        description=self.description,
+                        topics=topics,
+                    )
+            progress.record_synced(synced_repo)
+
+        if not synced_repo.mirrored:
+            if not progress.mirrored:
+                with span("mirror", destination=destination):
+                    push_mirror = await target.push_mirrorer.mirror_repo(
+                        synced_repo=synced_repo,
+                        config=replace(config, immediate=False),
+                    )
+                progress.record_mirrored(
+                    trigger=push_mirror is not None and config.immediate
+                )
+
+            if progress.trigger:
+                with span("trigger", destination=destination):
+                    await target.push_mirrorer.trigger_sync(synced_repo)
+                progress.record_triggered()
+
+        progress.record_done()
+
+        if state is not None:
+            state.record(self.state_key(target), self.fingerprint(target))
+
+    def progress(self, target: AsyncTarget, journal: Journal | None) -> Progress:
+        return get_progress(
+            journal, key=self.state_key(target), fingerprint=self.fingerprint(target)
+        )
+
+    def purged(self, journal: Journal | None) -> bool:
+        return any(self.progress(target, journal).purged for target in self.targets)
+
+    def state_key(self, target: AsyncTarget) -> str:
+        return make_state_key(
+            source_repo=self.source_repo, destination=target.destination
+        )
+
+    def fingerprint(self, target: AsyncTarget) -> str:
+        if self.topics is None:
+            raise RuntimeError("Task must be prepared before fingerprinting")
+
+        return make_fingerprint(
+            source_repo=self.source_repo,
+            description=self.description,
+            topics=self.topics,
+            features=target.syncer.features,
+            destination=target.destination,
+            push_mirror_config=self.push_mirror_config,
+        )
+
     @override
     def __str__(self) -> str:
-        return f"Synchronize {self.source_repo.owner}/{self.source_repo.name} to {self.destination}"
+        destinations = ", ".join(str(target.destination) for target in self.targets)
+        return f"Synchronize {self.source_repo.owner}/{self.source_repo.name} to {destinations}"
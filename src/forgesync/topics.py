@@ -0,0 +1,106 @@
+from asyncio import Semaphore
+from threading import BoundedSemaphore, Lock
+from typing import Self
+
+from pyforgejo import AsyncPyforgejoApi, PyforgejoApi
+
+from .forgejo import AsyncPaginator, Paginator
+from .source import SourceRepository
+from .trace import span
+
+
+def get_listed_topics(source_repo: SourceRepository) -> list[str] | None:
+    # Forgejo lists a repository without topics with `topics: null`. Only if
+    # the field is missing altogether do the topics have to be fetched.
+    real = source_repo.real
+    if real.topics is None and "topics" not in real.model_fields_set:
+        return None
+
+    return list(real.topics or [])
+
+
+class TopicCache:
+    client: PyforgejoApi
+    paginator: Paginator
+    limit: BoundedSemaphore
+    topics: dict[str, list[str]]
+    lock: Lock
+
+    def __init__(
+        self: Self, client: PyforgejoApi, paginator: Paginator, limit: BoundedSemaphore
+    ) -> None:
+        self.client = client
+        self.paginator = paginator
+        self.limit = limit
+        self.topics = {}
+        self.lock = Lock()
+
+    def get(self: Self, source_repo: SourceRepository) -> list[str]:
+        listed = get_listed_topics(source_repo)
+        if listed is not None:
+            return listed
+
+        key = str(source_repo)
+
+        with self.lock:
+            if key in self.topics:
+                return self.topics[key]
+
+        with self.limit, span("topics", repository=key):
+            topics = list(
+                self.paginator.depaginate(
+                    self.client.repository.with_raw_response.repo_list_topics,
+                    owner=source_repo.owner,
+                    repo=source_repo.name,
+                    convert=lambda t: t.topics,
+                )
+            )
+
+        with self.lock:
+            self.topics[key] = topics
+
+        return topics
+
+
+class AsyncTopicCache:
+    client: AsyncPyforgejoApi
+    paginator: AsyncPaginator
+    limit: Semaphore
+    topics: dict[str, list[str]]
+
+    def __init__(
+        self: Self,
+        client: AsyncPyforgejoApi,
+        paginator: AsyncPaginator,
+        limit: Semaphore,
+    ) -> None:
+        self.client = client
+        self.paginator = paginator
+        self.limit = limit
+        self.topics = {}
+
+    async def get(self: Self, source_repo: SourceRepository) -> list[str]:
+        listed = get_listed_topics(source_repo)
+        if listed is not None:
+            return listed
+
+        key = str(source_repo)
+
+        if key in self.topics:
+            return self.topics[key]
+
+        async with self.limit:
+            with span("topics", repository=key):
+                topics = [
+                    topic
+                    async for topic in self.paginator.depaginate(
+                        self.client.repository.with_raw_response.repo_list_topics,
+                        owner=source_repo.owner,
+                        repo=source_repo.name,
+                        convert=lambda t: t.topics,
+                    )
+                ]
+
+        self.topics[key] = topics
+
+        return topics
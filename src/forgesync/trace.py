@@ -0,0 +1,169 @@
+from contextvars import ContextVar
+from heapq import heappop, heappush
+from json import dump
+from os import getpid
+from pathlib import Path
+from threading import Lock
+from time import perf_counter_ns
+from types import TracebackType
+from typing import Any, Self
+
+# The innermost open span of the current thread or asyncio task.
+current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+class Span:
+    tracer: "Tracer"
+    name: str
+    category: str
+    args: dict[str, Any]
+    lane: int
+    start: int
+    token: Any
+
+    def __init__(
+        self: Self, tracer: "Tracer", name: str, category: str, args: dict[str, Any]
+    ) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def set(self: Self, **args: Any) -> None:
+        self.args.update(args)
+
+    def __enter__(self: Self) -> Self:
+        self.lane = self.tracer.open(self, current_span.get())
+        self.token = current_span.set(self)
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        end = perf_counter_ns()
+        current_span.reset(self.token)
+
+        if exc is not None:
+            self.args["error"] = repr(exc)
+
+        self.tracer.close(self, end)
+
+
+class NullSpan:
+    """
+    What `span()` returns while tracing is off, so instrumented code costs
+    a function call and nothing else.
+    """
+
+    def set(self: Self, **args: Any) -> None:
+        pass
+
+    def __enter__(self: Self) -> Self:
+        return self
+
+    def __exit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace events. Spans that run concurrently are
+    put on separate lanes, which trace viewers show as threads, and lanes
+    are reused once all their spans are closed.
+    """
+
+    pid: int
+    origin: int
+    events: list[dict[str, Any]]
+    stacks: dict[int, list[Span]]
+    free_lanes: list[int]
+    lock: Lock
+
+    def __init__(self: Self) -> None:
+        self.pid = getpid()
+        self.origin = perf_counter_ns()
+        self.events = []
+        self.stacks = {}
+        self.free_lanes = []
+        self.lock = Lock()
+
+    def open(self: Self, span: Span, parent: Span | None) -> int:
+        with self.lock:
+            # A span stays on its parent's lane unless a sibling is already
+            # open there. A span opened by another thread may outlive its
+            # parent, whose lane is empty or reused by then.
+            stack = self.stacks[parent.lane] if parent is not None else []
+            if parent is not None and stack and stack[-1] is parent:
+                lane = parent.lane
+            elif self.free_lanes:
+                lane = heappop(self.free_lanes)
+            else:
+                lane = len(self.stacks) + 1
+
+            self.stacks.setdefault(lane, []).append(span)
+            return lane
+
+    def close(self: Self, span: Span, end: int) -> None:
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": (span.start - self.origin) / 1000,
+            "dur": (end - span.start) / 1000,
+            "pid": self.pid,
+            "tid": span.lane,
+            "args": span.args,
+        }
+
+        with self.lock:
+            self.events.append(event)
+
+            stack = self.stacks[span.lane]
+            stack.remove(span)
+            if not stack:
+                heappush(self.free_lanes, span.lane)
+
+    def write(self: Self, path: Path) -> None:
+        with self.lock:
+            lanes = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self.pid,
+                    "tid": lane,
+                    "args": {"name": f"lane {lane}"},
+                }
+                for lane in sorted(self.stacks)
+            ]
+            events = [*lanes, *self.events]
+
+        with path.open("w") as file:
+            dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+tracer: Tracer | None = None
+
+
+def enable_tracing() -> Tracer:
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def span(name: str, category: str = "forgesync", **args: Any) -> Span | NullSpan:
+    if tracer is None:
+        return NULL_SPAN
+
+    return Span(tracer, name, category, args)
@@ -0,0 +1,560 @@
+from asyncio import sleep as async_sleep
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass, field
+from importlib.util import find_spec
+from itertools import count
+from threading import Lock
+from time import perf_counter, sleep
+from typing import Any, Self, override
+
+from httpx import (
+    AsyncBaseTransport,
+    AsyncByteStream,
+    AsyncClient,
+    AsyncHTTPTransport,
+    BaseTransport,
+    Client,
+    ConnectError,
+    ConnectTimeout,
+    HTTPTransport,
+    Limits,
+    PoolTimeout,
+    Request,
+    Response,
+    SyncByteStream,
+    TransportError,
+)
+
+from .cache import (
+    CachedResponse,
+    HttpCache,
+    is_cacheable,
+    make_cache_key,
+    strip_headers,
+)
+from .metrics import EndpointMetrics, Metrics, get_endpoint
+from .ratelimit import MAX_PAUSES, RateLimiter
+from .retry import RETRY_STATUSES, Retrier, is_idempotent
+from .trace import span
+
+HTTP2_AVAILABLE = find_spec("h2") is not None
+
+CONNECT_EVENT = "connection.connect_tcp.complete"
+
+# Errors raised before the request was sent, so even writes can be resent.
+UNSENT_ERRORS = (ConnectError, ConnectTimeout, PoolTimeout)
+
+
+def can_resend(request: Request, error: TransportError | None) -> bool:
+    return isinstance(error, UNSENT_ERRORS) or is_idempotent(
+        request.method, request.url.path
+    )
+
+
+@dataclass
+class TransportConfig:
+    pool_size: int
+    keepalive: float
+    http2: bool
+    timeout: float
+
+    def make_limits(self: Self) -> Limits:
+        return Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive,
+        )
+
+
+@dataclass
+class ConnectionStats:
+    requests: int = 0
+    connections: int = 0
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+    def count_request(self: Self) -> None:
+        with self.lock:
+            self.requests += 1
+
+    def count_connection(self: Self) -> None:
+        with self.lock:
+            self.connections += 1
+
+    @property
+    def reused(self: Self) -> int:
+        return max(self.requests - self.connections, 0)
+
+    @override
+    def __str__(self: Self) -> str:
+        return f"{self.requests} requests over {self.connections} connections ({self.reused} reused)"
+
+
+class CountingTransport(HTTPTransport):
+    stats: ConnectionStats
+
+    def __init__(self: Self, stats: ConnectionStats, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def trace(self: Self, name: str, info: dict[str, Any]) -> None:
+        if name == CONNECT_EVENT:
+            self.stats.count_connection()
+
+    @override
+    def handle_request(self: Self, request: Request) -> Response:
+        self.stats.count_request()
+        request.extensions = {**request.extensions, "trace": self.trace}
+        return super().handle_request(request)
+
+
+class AsyncCountingTransport(AsyncHTTPTransport):
+    stats: ConnectionStats
+
+    def __init__(self: Self, stats: ConnectionStats, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def trace(self: Self, name: str, info: dict[str, Any]) -> None:
+        if name == CONNECT_EVENT:
+            self.stats.count_connection()
+
+    @override
+    async def handle_async_request(self: Self, request: Request) -> Response:
+        self.stats.count_request()
+        request.extensions = {**request.extensions, "trace": self.trace}
+        return await super().handle_async_request(request)
+
+
+class CountingByteStream(SyncByteStream):
+    inner: SyncByteStream
+    metrics: Metrics
+    endpoint: EndpointMetrics
+
+    def __init__(
+        self: Self, inner: SyncByteStream, metrics: Metrics, endpoint: EndpointMetrics
+    ) -> None:
+        self.inner = inner
+        self.metrics = metrics
+        self.endpoint = endpoint
+
+    @override
+    def __iter__(self: Self) -> Iterator[bytes]:
+        for chunk in self.inner:
+            self.metrics.count_bytes(self.endpoint, len(chunk))
+            yield chunk
+
+    @override
+    def close(self: Self) -> None:
+        self.inner.close()
+
+
+class AsyncCountingByteStream(AsyncByteStream):
+    inner: AsyncByteStream
+    metrics: Metrics
+    endpoint: EndpointMetrics
+
+    def __init__(
+        self: Self, inner: AsyncByteStream, metrics: Metrics, endpoint: EndpointMetrics
+    ) -> None:
+        self.inner = inner
+        self.metrics = metrics
+        self.endpoint = endpoint
+
+    @override
+    async def __aiter__(self: Self) -> AsyncIterator[bytes]:
+        async for chunk in self.inner:
+            self.metrics.count_bytes(self.endpoint, len(chunk))
+            yield chunk
+
+    @override
+    async def aclose(self: Self) -> None:
+        await self.inner.aclose()
+
+
+class RateLimitedTransport(BaseTransport):
+    """
+    Sends requests through the rate limiter, resending them when they were
+    rate limited or failed on the way, and records every attempt in the
+    metrics.
+    """
+
+    inner: BaseTransport
+    limiter: RateLimiter
+    retrier: Retrier
+    metrics: Metrics
+
+    def __init__(
+        self: Self,
+        inner: BaseTransport,
+        limiter: RateLimiter,
+        retrier: Retrier,
+        metrics: Metrics,
+    ) -> None:
+        self.inner = inner
+        self.limiter = limiter
+        self.retrier = retrier
+        self.metrics = metrics
+
+    def send(self: Self, request: Request, retry: bool) -> Response:
+        host = request.url.host
+        endpoint = get_endpoint(request.method, request.url.path)
+        status = "error"
+        start = perf_counter()
+
+        with span(endpoint, "http", host=host) as http_span:
+            try:
+                response = self.inner.handle_request(request)
+                status = str(response.status_code)
+            finally:
+                counters = self.metrics.observe(
+                    host, endpoint, status, perf_counter() - start, retry
+                )
+                http_span.set(status=status)
+
+        if isinstance(response.stream, SyncByteStream):
+            response.stream = CountingByteStream(
+                response.stream, self.metrics, counters
+            )
+        return response
+
+    @override
+    def handle_request(self: Self, request: Request) -> Response:
+        host = request.url.host
+        pauses = 0
+        retries = 0
+
+        for attempt in count(1):
+            sleep(self.limiter.before(host, request.method, request.url.path))
+            self.retrier.before(host)
+
+            try:
+                response = self.send(request, retry=attempt > 1)
+            except TransportError as e:
+                self.retrier.after(host, failed=True)
+
+                retries += 1
+                delay = self.retrier.delay(host, retries)
+                if delay is None or not can_resend(request, e):
+                    raise
+
+                sleep(delay)
+                continue
+
+            failed = response.status_code in RETRY_STATUSES
+            self.retrier.after(host, failed=failed)
+
+            # Reading the body keeps it available to the caller.
+            body = (
+                response.read().decode(errors="replace")
+                if response.status_code == 403
+                else ""
+            )
+            pause = self.limiter.after(
+                host, response.status_code, response.headers, body
+            )
+            if pause is not None and pauses < MAX_PAUSES:
+                # Rate limited requests were not processed, so they can be
+                # resent once the pause is over.
+                pauses += 1
+                response.close()
+                continue
+
+            if not failed or not can_resend(request, None):
+                return response
+
+            retries += 1
+            delay = self.retrier.delay(host, retries)
+            if delay is None:
+                return response
+
+            response.close()
+            sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    @override
+    def close(self: Self) -> None:
+        self.inner.close()
+
+
+class AsyncRateLimitedTransport(AsyncBaseTransport):
+    inner: AsyncBaseTransport
+    limiter: RateLimiter
+    retrier: Retrier
+    metrics: Metrics
+
+    def __init__(
+        self: Self,
+        inner: AsyncBaseTransport,
+        limiter: RateLimiter,
+        retrier: Retrier,
+        metrics: Metrics,
+    ) -> None:
+        self.inner = inner
+        self.limiter = limiter
+        self.retrier = retrier
+        self.metrics = metrics
+
+    async def send(self: Self, request: Request, retry: bool) -> Response:
+        host = request.url.host
+        endpoint = get_endpoint(request.method, request.url.path)
+        status = "error"
+        start = perf_counter()
+
+        with span(endpoint, "http", host=host) as http_span:
+            try:
+                response = await self.inner.handle_async_request(request)
+                status = str(response.status_code)
+            finally:
+                counters = self.metrics.observe(
+                    host, endpoint, status, perf_counter() - start, retry
+                )
+                http_span.set(status=status)
+
+        if isinstance(response.stream, AsyncByteStream):
+            response.stream = AsyncCountingByteStream(
+                response.stream, self.metrics, counters
+            )
+        return response
+
+    @override
+    async def handle_async_request(self: Self, request: Request) -> Response:
+        host = request.url.host
+        pauses = 0
+        retries = 0
+
+        for attempt in count(1):
+            await async_sleep(
+                self.limiter.before(host, request.method, request.url.path)
+            )
+            self.retrier.before(host)
+
+            try:
+                response = await self.send(request, retry=attempt > 1)
+            except TransportError as e:
+                self.retrier.after(host, failed=True)
+
+                retries += 1
+                delay = self.retrier.delay(host, retries)
+                if delay is None or not can_resend(request, e):
+                    raise
+
+                await async_sleep(delay)
+                continue
+
+            failed = response.status_code in RETRY_STATUSES
+            self.retrier.after(host, failed=failed)
+
+            body = (
+                (await response.aread()).decode(errors="replace")
+                if response.status_code == 403
+                else ""
+            )
+            pause = self.limiter.after(
+                host, response.status_code, response.headers, body
+            )
+            if pause is not None and pauses < MAX_PAUSES:
+                pauses += 1
+                await response.aclose()
+                continue
+
+            if not failed or not can_resend(request, None):
+                return response
+
+            retries += 1
+            delay = self.retrier.delay(host, retries)
+            if delay is None:
+                return response
+
+            await response.aclose()
+            await async_sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    @override
+    async def aclose(self: Self) -> None:
+        await self.inner.aclose()
+
+
+def get_cache_key(request: Request) -> str | None:
+    if request.method != "GET":
+        return None
+
+    # Leave requests alone that already carry their own validators.
+    if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+        return None
+
+    return make_cache_key(request.method, str(request.url), request.headers)
+
+
+def make_response(cached: CachedResponse, request: Request) -> Response:
+    return Response(
+        status_code=cached.status,
+        headers=cached.headers,
+        content=cached.body,
+        request=request,
+    )
+
+
+class CachingTransport(BaseTransport):
+    inner: BaseTransport
+    cache: HttpCache
+
+    def __init__(self: Self, inner: BaseTransport, cache: HttpCache) -> None:
+        self.inner = inner
+        self.cache = cache
+
+    @override
+    def handle_request(self: Self, request: Request) -> Response:
+        key = get_cache_key(request)
+        if key is None:
+            return self.inner.handle_request(request)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            request.headers.update(cached.validators())
+
+        response = self.inner.handle_request(request)
+
+        if cached is not None and response.status_code == 304:
+            response.close()
+            self.cache.stats.count(hit=True)
+            return make_response(cached.revalidated(response.headers), request)
+
+        self.cache.stats.count(hit=False)
+
+        if not is_cacheable(response.status_code, response.headers):
+            return response
+
+        fresh = CachedResponse(
+            status=response.status_code,
+            headers=strip_headers(response.headers),
+            body=response.read(),
+        )
+        response.close()
+        self.cache.put(key, fresh)
+
+        return make_response(fresh, request)
+
+    @override
+    def close(self: Self) -> None:
+        self.inner.close()
+
+
+class AsyncCachingTransport(AsyncBaseTransport):
+    inner: AsyncBaseTransport
+    cache: HttpCache
+
+    def __init__(self: Self, inner: AsyncBaseTransport, cache: HttpCache) -> None:
+        self.inner = inner
+        self.cache = cache
+
+    @override
+    async def handle_async_request(self: Self, request: Request) -> Response:
+        key = get_cache_key(request)
+        if key is None:
+            return await self.inner.handle_async_request(request)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            request.headers.update(cached.validators())
+
+        response = await self.inner.handle_async_request(request)
+
+        if cached is not None and response.status_code == 304:
+            await response.aclose()
+            self.cache.stats.count(hit=True)
+            return make_response(cached.revalidated(response.headers), request)
+
+        self.cache.stats.count(hit=False)
+
+        if not is_cacheable(response.status_code, response.headers):
+            return response
+
+        fresh = CachedResponse(
+            status=response.status_code,
+            headers=strip_headers(response.headers),
+            body=await response.aread(),
+        )
+        await response.aclose()
+        self.cache.put(key, fresh)
+
+        return make_response(fresh, request)
+
+    @override
+    async def aclose(self: Self) -> None:
+        await self.inner.aclose()
+
+
+class Transport:
+    """
+    The single place HTTP clients are built, so every Forgejo and GitHub client
+    in a run shares one connection pool, rate limiter and response cache.
+    """
+
+    config: TransportConfig
+    stats: ConnectionStats
+    limiter: RateLimiter
+    retrier: Retrier
+    cache: HttpCache | None
+    metrics: Metrics
+
+    def __init__(
+        self: Self,
+        config: TransportConfig,
+        limiter: RateLimiter,
+        retrier: Retrier,
+        cache: HttpCache | None = None,
+    ) -> None:
+        self.config = config
+        self.stats = ConnectionStats()
+        self.limiter = limiter
+        self.retrier = retrier
+        self.cache = cache
+        self.metrics = Metrics()
+
+    @property
+    def http2(self: Self) -> bool:
+        return self.config.http2 and HTTP2_AVAILABLE
+
+    def make_client(self: Self) -> Client:
+        transport: BaseTransport = CountingTransport(
+            stats=self.stats,
+            limits=self.config.make_limits(),
+            http2=self.http2,
+        )
+        transport = RateLimitedTransport(
+            inner=transport,
+            limiter=self.limiter,
+            retrier=self.retrier,
+            metrics=self.metrics,
+        )
+        if self.cache is not None:
+            transport = CachingTransport(inner=transport, cache=self.cache)
+
+        return Client(
+            transport=transport,
+            timeout=self.config.timeout,
+            follow_redirects=True,
+        )
+
+    def make_async_client(self: Self) -> AsyncClient:
+        transport: AsyncBaseTransport = AsyncCountingTransport(
+            stats=self.stats,
+            limits=self.config.make_limits(),
+            http2=self.http2,
+        )
+        transport = AsyncRateLimitedTransport(
+            inner=transport,
+            limiter=self.limiter,
+            retrier=self.retrier,
+            metrics=self.metrics,
+        )
+        if self.cache is not None:
+            transport = AsyncCachingTransport(inner=transport, cache=self.cache)
+
+        return AsyncClient(
+            transport=transport,
+            timeout=self.config.timeout,
+            follow_redirects=True,
+        )
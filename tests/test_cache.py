@@ -0,0 +1,55 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase
+
+from forgesync.cache import CachedResponse, HttpCache
+
+
+def make_response(size: int) -> CachedResponse:
+    return CachedResponse(status=200, headers={"etag": '"1"'}, body=b"x" * size)
+
+
+class HttpCacheTest(TestCase):
+    def setUp(self: Self) -> None:
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def open(self: Self, max_size: int) -> HttpCache:
+        return HttpCache.open(self.directory, max_size=max_size)
+
+    def test_hit_doesnt_write(self: Self) -> None:
+        cache = self.open(max_size=100)
+        self.addCleanup(cache.close)
+        cache.put("a", make_response(10))
+
+        changes = cache.connection.total_changes
+        self.assertEqual(cache.get("a"), make_response(10))
+        self.assertEqual(cache.connection.total_changes, changes)
+
+    def test_recent_hit_survives_eviction(self: Self) -> None:
+        cache = self.open(max_size=25)
+        self.addCleanup(cache.close)
+        cache.put("a", make_response(10))
+        cache.put("b", make_response(10))
+
+        _ = cache.get("a")
+        cache.put("c", make_response(10))
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_hits_are_kept_on_close(self: Self) -> None:
+        cache = self.open(max_size=25)
+        cache.put("a", make_response(10))
+        cache.put("b", make_response(10))
+        _ = cache.get("a")
+        cache.close()
+
+        cache = self.open(max_size=25)
+        self.addCleanup(cache.close)
+        cache.put("c", make_response(10))
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
@@ -0,0 +1,157 @@
+from collections.abc import Callable
+from json import dumps, loads
+from os import environ
+from pathlib import Path
+from subprocess import run
+from sys import executable, path
+from typing import Any, Self
+from unittest import TestCase
+
+# The fakes live with the benchmarks, which aren't a package.
+path.insert(0, str(Path(__file__).parents[1] / "benchmarks"))
+
+from fakes import (
+    SOURCE_LOGIN,
+    TARGET_LOGIN,
+    FakeForgejo,
+    FakeGithub,
+    FakeServer,
+    Request,
+    Response,
+    Traffic,
+)
+
+REPO_COUNT = 12
+EXISTING = 5
+PAGE_SIZE = 5
+
+# Fields the fakes derive from the order in which repositories got created,
+# which the engines don't keep.
+UNORDERED_FIELDS = {"id", "updated_at"}
+
+
+def start(
+    name: str,
+    respond: Callable[[Request], Response],
+    traffic: Traffic,
+    host: str = "127.0.0.1",
+) -> FakeServer:
+    server = FakeServer(
+        name=name, respond=respond, traffic=traffic, latency=0.0, host=host
+    )
+    server.start()
+    return server
+
+
+def get_repos(repos: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    return {
+        name: {
+            key: sorted(value) if key == "topics" else value
+            for key, value in repo.items()
+            if key not in UNORDERED_FIELDS
+        }
+        for name, repo in repos.items()
+    }
+
+
+def get_writes(traffic: Traffic) -> dict[str, int]:
+    return {
+        endpoint: count
+        for endpoint, count in traffic.calls.items()
+        if " GET " not in endpoint and not endpoint.endswith("/graphql")
+    }
+
+
+class EngineParityTest(TestCase):
+    """
+    Runs both engines against fresh fake servers and compares what they
+    leave behind, and the writes they needed for it.
+    """
+
+    def sync(self: Self, target: str, engine: str, *args: str) -> list[dict[str, Any]]:
+        traffic = Traffic()
+        source = start("source", lambda request: source_api.handle(request), traffic)
+        self.addCleanup(source.stop)
+        source_api = FakeForgejo(
+            login=SOURCE_LOGIN,
+            base_url=f"http://127.0.0.1:{source.port}",
+            repo_count=REPO_COUNT,
+            page_size=PAGE_SIZE,
+        )
+
+        target_api: FakeForgejo | FakeGithub
+        match target:
+            case "forgejo":
+                server = start(
+                    "target", lambda request: target_api.handle(request), traffic
+                )
+                target_api = FakeForgejo(
+                    login=TARGET_LOGIN,
+                    base_url=f"http://127.0.0.1:{server.port}",
+                    repo_count=EXISTING,
+                    page_size=PAGE_SIZE,
+                )
+                target_url = f"forgejo=http://127.0.0.1:{server.port}/api/v1"
+            case _:
+                target_api = FakeGithub(login=TARGET_LOGIN, repo_count=EXISTING)
+                server = start("target", target_api.handle, traffic, host="localhost")
+                target_url = f"github=http://localhost:{server.port}"
+        self.addCleanup(server.stop)
+
+        outcomes: list[dict[str, Any]] = []
+        for _ in range(2):
+            traffic.reset()
+            process = run(
+                [
+                    executable,
+                    "-m",
+                    "forgesync",
+                    f"http://127.0.0.1:{source.port}/api/v1",
+                    target_url,
+                    "--engine",
+                    engine,
+                    *args,
+                ],
+                env={
+                    **environ,
+                    "SOURCE_TOKEN": "source",
+                    "TARGET_TOKEN": "target",
+                    "MIRROR_TOKEN": "mirror",
+                },
+                capture_output=True,
+                check=False,
+            )
+            outcome = dumps(
+                {
+                    "exit_code": process.returncode,
+                    "target": get_repos(target_api.repos),
+                    "push_mirrors": {
+                        name: sorted(
+                            push_mirror["remote_address"]
+                            for push_mirror in push_mirrors
+                        )
+                        for name, push_mirrors in source_api.push_mirrors.items()
+                    },
+                    "writes": get_writes(traffic),
+                }
+            )
+            # The servers listen on other ports for every engine.
+            for name, port in (("source", source.port), ("target", server.port)):
+                outcome = outcome.replace(f":{port}", f":{name}")
+            outcomes.append(loads(outcome))
+
+        return outcomes
+
+    def assert_parity(self: Self, target: str, *args: str) -> None:
+        threads = self.sync(target, "threads", *args)
+        self.assertEqual(threads[0]["exit_code"], 0)
+        self.assertEqual(self.sync(target, "async", *args), threads)
+
+    def test_forgejo(self: Self) -> None:
+        self.assert_parity("forgejo")
+
+    def test_github(self: Self) -> None:
+        self.assert_parity("github")
+
+    def test_purge(self: Self) -> None:
+        self.assert_parity("forgejo", "--purge")
@@ -0,0 +1,115 @@
+from asyncio import run
+from collections.abc import AsyncIterator
+from contextlib import redirect_stdout
+from io import StringIO
+from types import SimpleNamespace
+from typing import Any, Self
+from unittest import TestCase
+
+from httpx import AsyncClient, Client, MockTransport, Request, Response
+from pyforgejo import AsyncPyforgejoApi
+from pyforgejo.core.api_error import ApiError
+
+from forgesync.forgejo import (
+    AsyncPaginator,
+    Paginator,
+    find_repo,
+    make_async_client,
+    make_client,
+)
+
+BASE_URL = "https://forgejo.example/api/v1"
+
+
+class NoRetriesTest(TestCase):
+    def setUp(self: Self) -> None:
+        self.requests: list[Request] = []
+
+        def handle(request: Request) -> Response:
+            self.requests.append(request)
+            return Response(503)
+
+        httpx_client = Client(transport=MockTransport(handle))
+        self.addCleanup(httpx_client.close)
+        self.client = make_client(
+            base_url=BASE_URL, api_key="token", httpx_client=httpx_client
+        )
+
+    def test_request_is_sent_once(self: Self) -> None:
+        with self.assertRaises(ApiError):
+            _ = find_repo(self.client, "alice", "repo")
+
+        self.assertEqual(len(self.requests), 1)
+
+    def test_page_is_sent_once(self: Self) -> None:
+        with self.assertRaises(ApiError):
+            _ = list(
+                Paginator().depaginate(
+                    self.client.user.with_raw_response.list_repos, "alice"
+                )
+            )
+
+        self.assertEqual(len(self.requests), 1)
+
+
+class CappedListing:
+    """
+    A list endpoint that caps `limit` below what the client asks for and
+    doesn't send `X-Total-Count`.
+    """
+
+    def __init__(self: Self, items: int, cap: int) -> None:
+        self.items = list(range(items))
+        self.cap = cap
+
+    def __call__(self: Self, page: int, limit: int, **_: Any) -> SimpleNamespace:
+        limit = min(limit, self.cap)
+        start = (page - 1) * limit
+        return SimpleNamespace(data=self.items[start : start + limit], headers={})
+
+    async def fetch(self: Self, page: int, limit: int, **_: Any) -> SimpleNamespace:
+        return self(page=page, limit=limit)
+
+
+async def collect(items: AsyncIterator[int]) -> list[int]:
+    return [item async for item in items]
+
+
+class CappedPageSizeTest(TestCase):
+    def setUp(self: Self) -> None:
+        self.listing = CappedListing(items=7, cap=3)
+
+    def test_depaginate(self: Self) -> None:
+        items = list(Paginator(page_size=50).depaginate(self.listing))
+        self.assertEqual(items, self.listing.items)
+
+    def test_walk(self: Self) -> None:
+        items = list(Paginator(page_size=50).walk(self.listing))
+        self.assertEqual(items, self.listing.items)
+
+    def test_async_depaginate(self: Self) -> None:
+        paginator = AsyncPaginator(page_size=50)
+        items = run(collect(paginator.depaginate(self.listing.fetch)))
+        self.assertEqual(items, self.listing.items)
+
+    def test_async_walk(self: Self) -> None:
+        paginator = AsyncPaginator(page_size=50)
+        items = run(collect(paginator.walk(self.listing.fetch)))
+        self.assertEqual(items, self.listing.items)
+
+
+class AsyncClientTest(TestCase):
+    def test_pyforgejo_still_prints(self: Self) -> None:
+        # make_async_client silences this; drop that once it stops.
+        with redirect_stdout(StringIO()) as stdout:
+            _ = AsyncPyforgejoApi(base_url=BASE_URL, api_key="token")
+
+        self.assertIn("Using BASE_URL", stdout.getvalue())
+
+    def test_stdout_is_silent(self: Self) -> None:
+        with redirect_stdout(StringIO()) as stdout:
+            _ = make_async_client(
+                base_url=BASE_URL, api_key="token", httpx_client=AsyncClient()
+            )
+
+        self.assertEqual(stdout.getvalue(), "")
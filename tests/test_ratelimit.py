@@ -0,0 +1,49 @@
+from typing import Self
+from unittest import TestCase
+
+from forgesync.ratelimit import (
+    DEFAULT_PAUSE,
+    HostSchedule,
+    TokenBucket,
+    creates_content,
+)
+
+SECONDARY_LIMIT_BODY = (
+    '{"message": "You have exceeded a secondary rate limit. Please wait a few'
+    ' minutes before you try again."}'
+)
+
+
+class CreatesContentTest(TestCase):
+    def test_creating_post(self: Self) -> None:
+        self.assertTrue(creates_content("POST", "/user/repos"))
+        self.assertTrue(creates_content("post", "/orgs/acme/repos"))
+
+    def test_other_requests(self: Self) -> None:
+        self.assertFalse(creates_content("POST", "/graphql"))
+        self.assertFalse(creates_content("PATCH", "/repos/alice/repo"))
+        self.assertFalse(creates_content("PUT", "/repos/alice/repo/topics"))
+        self.assertFalse(creates_content("DELETE", "/repos/alice/repo"))
+
+
+class HostScheduleTest(TestCase):
+    def test_only_content_creation_uses_write_bucket(self: Self) -> None:
+        writes = TokenBucket(rate=1.0, capacity=1.0)
+        schedule = HostSchedule(writes=writes)
+        now = writes.updated
+
+        self.assertEqual(schedule.delay(creates=False, now=now), 0.0)
+        self.assertEqual(schedule.delay(creates=True, now=now), 0.0)
+        self.assertEqual(schedule.delay(creates=False, now=now), 0.0)
+        self.assertGreater(schedule.delay(creates=True, now=now), 0.0)
+
+    def test_plain_forbidden_doesnt_pause(self: Self) -> None:
+        schedule = HostSchedule()
+        pause = schedule.pause(403, {}, '{"message": "Forbidden"}', now=0.0)
+        self.assertIsNone(pause)
+
+    def test_secondary_limit_pauses(self: Self) -> None:
+        schedule = HostSchedule()
+        pause = schedule.pause(403, {}, SECONDARY_LIMIT_BODY, now=0.0)
+        self.assertEqual(pause, DEFAULT_PAUSE)
+        self.assertEqual(schedule.paused_until, DEFAULT_PAUSE)
@@ -0,0 +1,42 @@
+from typing import Self
+from unittest import TestCase
+
+from pyforgejo.core.api_error import ApiError
+
+from forgesync.retry import request_errors_as
+from forgesync.sync import RepositoryError, SyncError
+
+
+def fail(error: Exception) -> type[SyncError]:
+    try:
+        with request_errors_as(RepositoryError):
+            raise error
+    except SyncError as e:
+        return type(e)
+
+    raise AssertionError("request_errors_as didn't raise")
+
+
+class RequestErrorsAsTest(TestCase):
+    def test_failed_request_fails_repository(self: Self) -> None:
+        self.assertIs(fail(ApiError(status_code=404)), RepositoryError)
+        self.assertIs(fail(ApiError(status_code=503)), RepositoryError)
+
+    def test_rejected_token_is_fatal(self: Self) -> None:
+        self.assertIs(fail(ApiError(status_code=401)), SyncError)
+        self.assertIs(fail(ApiError(status_code=403, headers={})), SyncError)
+
+    def test_rate_limit_fails_repository(self: Self) -> None:
+        exhausted = {"X-RateLimit-Remaining": "0"}
+        self.assertIs(
+            fail(ApiError(status_code=403, headers=exhausted)), RepositoryError
+        )
+        self.assertIs(
+            fail(ApiError(status_code=403, headers={"Retry-After": "60"})),
+            RepositoryError,
+        )
+        secondary = {"message": "You have exceeded a secondary rate limit."}
+        self.assertIs(
+            fail(ApiError(status_code=403, headers={}, body=secondary)),
+            RepositoryError,
+        )
@@ -0,0 +1,42 @@
+from logging import getLogger
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase
+
+from forgesync.mirror import Remirror
+from forgesync.runner import BaseTaskRunner
+from forgesync.state import StateStore
+
+KEY = "https://forgejo.example/alice/repo -> github"
+
+
+class IsStaleTest(TestCase):
+    def setUp(self: Self) -> None:
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state = StateStore.open(Path(directory.name))
+        self.addCleanup(self.state.close)
+        self.state.record(KEY, "fingerprint")
+
+    def make_runner(self: Self, remirror: Remirror) -> BaseTaskRunner:
+        return BaseTaskRunner(
+            jobs=1,
+            dry_run=False,
+            logger=getLogger(__name__),
+            state=self.state,
+            remirror=remirror,
+        )
+
+    def test_unchanged_repository_is_skipped(self: Self) -> None:
+        runner = self.make_runner(Remirror.NO)
+        self.assertFalse(runner.is_stale(KEY, lambda: "fingerprint"))
+        self.assertTrue(runner.is_stale(KEY, lambda: "changed"))
+
+    def test_remirror_synchronizes_unchanged_repository(self: Self) -> None:
+        runner = self.make_runner(Remirror.YES)
+        self.assertTrue(runner.is_stale(KEY, lambda: "fingerprint"))
+
+    def test_purge_synchronizes_unchanged_repository(self: Self) -> None:
+        runner = self.make_runner(Remirror.PURGE)
+        self.assertTrue(runner.is_stale(KEY, lambda: "fingerprint"))
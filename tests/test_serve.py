@@ -0,0 +1,82 @@
+from http.client import HTTPConnection
+from logging import getLogger
+from socket import AF_INET6, has_ipv6, socket
+from threading import Thread
+from typing import Self
+from unittest import TestCase, skipUnless
+
+from forgesync.serve import MAX_BODY_SIZE, Debouncer, WebhookServer, parse_listen
+
+
+class ParseListenTest(TestCase):
+    def test_host_and_port(self: Self) -> None:
+        self.assertEqual(parse_listen("0.0.0.0:8080"), ("0.0.0.0", 8080))
+        self.assertEqual(parse_listen(":8080"), ("127.0.0.1", 8080))
+
+    def test_ipv6_brackets_are_stripped(self: Self) -> None:
+        self.assertEqual(parse_listen("[::1]:8080"), ("::1", 8080))
+        self.assertEqual(parse_listen("[::]:8080"), ("::", 8080))
+
+    def test_invalid_port(self: Self) -> None:
+        with self.assertRaises(ValueError):
+            _ = parse_listen("localhost")
+
+
+def can_bind_ipv6() -> bool:
+    if not has_ipv6:
+        return False
+
+    try:
+        with socket(AF_INET6) as probe:
+            probe.bind(("::1", 0))
+    except OSError:
+        return False
+
+    return True
+
+
+class WebhookServerTest(TestCase):
+    def setUp(self: Self) -> None:
+        self.debouncer = Debouncer(delay=0.0)
+        self.server = WebhookServer(
+            address=("127.0.0.1", 0),
+            debouncer=self.debouncer,
+            secret=None,
+            logger=getLogger(__name__),
+        )
+        thread = Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def post(self: Self, body: bytes, length: int) -> int:
+        host, port = self.server.server_address[:2]
+        connection = HTTPConnection(str(host), port)
+        self.addCleanup(connection.close)
+
+        connection.putrequest("POST", "/")
+        connection.putheader("Content-Length", str(length))
+        connection.putheader("X-Forgejo-Event", "push")
+        connection.endheaders(body)
+        return connection.getresponse().status
+
+    def test_event_is_queued(self: Self) -> None:
+        body = b'{"repository": {"full_name": "alice/repo"}}'
+        self.assertEqual(self.post(body, len(body)), 202)
+        self.assertEqual(self.debouncer.pending, {"alice/repo"})
+
+    def test_oversized_body_is_rejected(self: Self) -> None:
+        self.assertEqual(self.post(b"", MAX_BODY_SIZE + 1), 413)
+        self.assertEqual(self.debouncer.pending, set())
+
+    @skipUnless(can_bind_ipv6(), "IPv6 loopback isn't available")
+    def test_listens_on_ipv6(self: Self) -> None:
+        server = WebhookServer(
+            address=parse_listen("[::1]:0"),
+            debouncer=self.debouncer,
+            secret=None,
+            logger=getLogger(__name__),
+        )
+        self.addCleanup(server.server_close)
+        self.assertEqual(server.server_address[0], "::1")
@@ -0,0 +1,37 @@
+from contextvars import copy_context
+from typing import Self
+from unittest import TestCase
+
+from forgesync.trace import Span, Tracer, current_span
+
+
+class TracerTest(TestCase):
+    def setUp(self: Self) -> None:
+        self.tracer = Tracer()
+
+    def make_span(self: Self, name: str) -> Span:
+        return Span(self.tracer, name, "test", {})
+
+    def test_child_shares_parent_lane(self: Self) -> None:
+        with self.make_span("parent") as parent, self.make_span("child") as child:
+            self.assertEqual(child.lane, parent.lane)
+
+    def test_sibling_gets_own_lane(self: Self) -> None:
+        with self.make_span("parent") as parent:
+            context = copy_context()
+            with self.make_span("first") as first:
+                second = context.run(lambda: self.make_span("second").__enter__())
+                self.assertEqual(first.lane, parent.lane)
+                self.assertNotEqual(second.lane, parent.lane)
+
+    def test_child_outliving_parent(self: Self) -> None:
+        # A target that finishes after its task, e.g. on another thread.
+        with self.make_span("parent"):
+            context = copy_context()
+
+        def open_child() -> Span:
+            self.assertEqual(current_span.get().name, "parent")
+            return self.make_span("child").__enter__()
+
+        child = context.run(open_child)
+        self.assertIn(child, self.tracer.stacks[child.lane])